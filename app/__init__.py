@@ -2,12 +2,23 @@
     extensions and reusable packages as well as the configuration settings.
 '''
 
-from flask import Flask, jsonify
+from flask import Flask, current_app, jsonify, redirect
 from flask_jwt_extended import JWTManager
 
 from instance.config import app_config
-from app.models.blacklist import Blacklist
+from .auth_cache import init_auth_cache, load_user
+from .batch_helper import init_batch
+from .compression import init_compression
 from .db import db
+from .green import init_green
+from .metrics import init_metrics
+from .password_pool import PasswordPool
+from .query_budget import init_query_budgets
+from .replicas import init_replicas
+from .response_cache import init_response_cache
+from .revocation_cache import RevocationCache
+from .sharding import init_sharding
+from .swagger_spec import init_swagger_specs
 from flask_cors import CORS
 
 cors = CORS()
@@ -30,8 +41,24 @@ def create_app(config_name):
     app.config['JWT_BLACKLIST_ENABLED'] = True
     app.config['JWT_BLACKLIST_TOKEN_CHECKS'] = ['access']
     db.init_app(app)
+    init_sharding(app)
+    init_replicas(app)
+    # first, so request timing covers the hooks registered after it
+    init_metrics(app)
+    init_query_budgets(app)
     cors.init_app(app)
     jwt.init_app(app)
+    init_auth_cache(app)
+    init_compression(app)
+    init_response_cache(app)
+    init_batch(app)
+    init_green(app)
+    app.extensions['revocation_cache'] = RevocationCache(
+        app.config.get('JWT_BLACKLIST_CACHE_SECONDS', 5))
+    app.extensions['password_pool'] = PasswordPool(
+        workers=app.config.get('BCRYPT_POOL_WORKERS', 2),
+        max_queue=app.config.get('BCRYPT_POOL_QUEUE', 8),
+        timeout=app.config.get('BCRYPT_POOL_TIMEOUT', 10))
 
     from app.apis import apiv1_blueprint as api_v1
     from app.apis import apiv2_blueprint as api_v2
@@ -39,22 +66,69 @@ def create_app(config_name):
     app.register_blueprint(api_v1, url_prefix='/api/v1')
     app.register_blueprint(api_v2, url_prefix='/api/v2')
 
+    @app.route('/')
+    def main():
+        ''' Load the documentation on heroku '''
+        return redirect('/api/v1/')
+
+    # last, the file is checked against every URL rule of the app
+    init_swagger_specs(app)
     return app
 
 
+def warm_up(app):
+    ''' Does the work a worker would otherwise leave to its first requests:
+        imports the serializers, configures the model mappers and builds
+        the Swagger specs not loaded from SWAGGER_SPEC_FILE.
+        wsgi.py calls it, so under gunicorn --preload it is done once in the
+        master and the workers fork with it done. It opens no connection.
+
+        :param object app: The app created by create_app
+    '''
+    from sqlalchemy.orm import configure_mappers
+
+    from app.apis import api, api_2
+    from app.dump_helper import load_serializers
+
+    load_serializers()
+    configure_mappers()
+    with app.test_request_context():
+        for an_api in (api, api_2):
+            an_api.__schema__
+
+
 @jwt.token_in_blacklist_loader
 def check_if_token_in_blacklist(decrypted_token):
     """ Call back function that checks if a the token is valid on all the
-        endpoints that require a token
+        endpoints that require a token.
+        The lookup is served by the worker's revocation cache, which only
+        queries the blacklisted table once its staleness window has passed.
 
         :param decrypted_token: -- [description]
         :Return: Boolean
     """
     jti = decrypted_token['jti']
+    return current_app.extensions['revocation_cache'].is_revoked(jti)
+
+
+@jwt.user_loader_callback_loader
+def user_loader_callback(identity):
+    """ Call back function that loads the user a token identifies on all the
+        endpoints that require a token.
+        The lookup is served by the worker's user cache, which only queries
+        the users table once per identity and JWT_USER_CACHE_SECONDS.
+
+        :param identity: The user_id in the token
+        :Return: A CachedUser, None if the user was deleted
+    """
+    return load_user(identity)
+
 
-    if Blacklist.query.filter_by(token=jti).first() is None:
-        return False
-    return True
+@jwt.user_loader_error_loader
+def my_user_loader_error_callback(identity):
+    ''' Rejects a token whose user no longer exists '''
+    return jsonify({'message': 'You must be logged in to access this page'}), \
+        401
 
 
 @jwt.revoked_token_loader
@@ -1,8 +1,16 @@
-from flask import Blueprint, jsonify, make_response
-from flask_restplus import Api
+from flask import Blueprint, current_app, jsonify, make_response
+from flask_restplus.representations import output_json
+
+try:
+    import orjson
+except ImportError:     # optional, RESTPLUS_FAST_JSON needs it installed
+    orjson = None
 
 from app import jwt
+from ..sharding import UserMoving, moving_response
+from ..swagger_spec import Api
 from .auth import api as ns_auth
+from .batch import api as ns_batch
 from .categories import api as ns_categories
 from .recipes import api as ns_recipes
 from .hello import api as ns_hello
@@ -32,12 +40,35 @@ api_2 = Api(apiv2_blueprint,
 api.add_namespace(ns_auth)
 api.add_namespace(ns_categories)
 api.add_namespace(ns_recipes)
+api.add_namespace(ns_batch)
 
 api_2.add_namespace(ns_hello)
 
 jwt._set_error_handler_callbacks(api)
 
 
+@api.representation('application/json')
+@api_2.representation('application/json')
+def output_fast_json(data, code, headers=None):
+    ''' Encodes responses with orjson when RESTPLUS_FAST_JSON is set.
+        orjson leaves out the whitespace the default encoder puts after
+        separators, so the bytes differ from output_json's.
+    '''
+    if orjson is None or not current_app.config.get('RESTPLUS_FAST_JSON'):
+        return output_json(data, code, headers)
+    resp = make_response(orjson.dumps(data) + b'\n', code)
+    resp.headers.extend(headers or {})
+    return resp
+
+
+@api.errorhandler(UserMoving)
+def handle_user_moving(error):
+    ''' Return a 503 for a write while the user's data is moved to another
+        shard
+    '''
+    return moving_response()
+
+
 @apiv1_blueprint.app_errorhandler(404)
 def handle_not_found_exception(e):
     ''' Return a custom message and 404 status code '''
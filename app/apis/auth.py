@@ -1,6 +1,7 @@
 ''' This script handles user registration, login, logout and password reset '''
 
 from datetime import timedelta
+from flask import current_app
 from flask_jwt_extended import (
     get_jwt_identity, create_access_token, jwt_required, get_raw_jwt)
 from flask_restplus import fields, Namespace, Resource, reqparse
@@ -9,6 +10,9 @@ from flask_restplus import fields, Namespace, Resource, reqparse
 from app.models.user import User
 from app.models.blacklist import Blacklist
 from ..db import db
+from ..password_pool import PasswordPoolBusy
+from ..query_budget import query_budget
+from ..sharding import place_user
 from ..validation_helper import(
     username_validator, password_validator, email_validator)
 
@@ -43,12 +47,19 @@ AUTH_PARSER.add_argument('old_password', required=True)
 AUTH_PARSER.add_argument('new_password', required=True)
 
 
+@api.errorhandler(PasswordPoolBusy)
+def handle_password_pool_busy(error):
+    ''' Return a 503 when there are too many logins in progress '''
+    return {'message': 'The server is busy, try again shortly'}, 503
+
+
 @api.route('/register/')
 class UserRegistration(Resource):
     ''' This class registers a new user. '''
 
     @api.expect(REGISTER_USER)
     @api.response(201, 'Account was successfully created')
+    @query_budget(3)
     def post(self):
         ''' This method adds a new user.
             Takes the user credentials added, hashes the password and saves
@@ -86,6 +97,7 @@ class UserRegistration(Resource):
         new_user = User(username, email)
         new_user.password_hasher(password)
         db.session.add(new_user)
+        place_user(new_user)
         db.session.commit()
         return {"message": "Account was successfully created"}, 201
 
@@ -96,6 +108,7 @@ class UserLogin(Resource):
 
     @api.expect(LOGIN_USER)
     @api.response(201, 'You have been signed in')
+    @query_budget(1)
     def post(self):
         ''' This method signs in an existing user
             Checks if the entered credentials match the existing ones in the DB
@@ -106,8 +119,8 @@ class UserLogin(Resource):
         username = args.username
         password = args.password
         username = username.lower()
-        if User.query.filter_by(username=username).first() is not None:
-            the_user = User.query.filter_by(username=username).first()
+        the_user = User.query.filter_by(username=username).first()
+        if the_user is not None:
             a_user = the_user.password_checker(password)
 
             if a_user:
@@ -130,6 +143,7 @@ class UserLogout(Resource):
     ''' This class logs out a currently logged in user. '''
 
     @api.response(200, 'You have been logged out')
+    @query_budget(1)
     @jwt_required
     def delete(self):
         ''' This method logs out a logged in user
@@ -140,6 +154,7 @@ class UserLogout(Resource):
         blacklisted = Blacklist(jti)
         db.session.add(blacklisted)
         db.session.commit()
+        current_app.extensions['revocation_cache'].add(jti)
         the_response = {"message": "Successfully logged out"}
         return the_response, 200
 
@@ -150,6 +165,7 @@ class ResetPassword(Resource):
 
     @api.expect(AUTH_PARSER)
     @api.response(200, 'Password reset successfully')
+    @query_budget(2)
     @jwt_required
     def put(self):
         ''' This method handles password reset.
@@ -0,0 +1,57 @@
+''' This script handles batches of API operations sent in one request '''
+
+from flask import current_app, request
+from flask_jwt_extended import jwt_required
+from flask_restplus import fields, Namespace, Resource
+
+from ..batch_helper import (
+    BATCH_MAX_OPERATIONS, BatchError, parse_operations, run_batch)
+
+
+api = Namespace(
+    'batch', description='Running several operations in one request')
+
+OPERATION = api.model('Operation', {
+    'method': fields.String(required=True, description='GET, POST, PUT or '
+                            'DELETE', enum=['GET', 'POST', 'PUT', 'DELETE']),
+    'path': fields.String(required=True,
+                          description='e.g. /api/v1/categories/'),
+    'body': fields.Raw(description='the JSON body of the operation'),
+    'headers': fields.Raw(description='extra headers, e.g. If-None-Match'),
+})
+
+BATCH = api.model('Batch', {
+    'operations': fields.List(fields.Nested(OPERATION), required=True),
+    'atomic': fields.Boolean(default=False, description='run the operations '
+                             'in one transaction, stopping at the first '
+                             'failure'),
+})
+
+
+@api.route('/')
+class Batch(Resource):
+    ''' This class runs a batch of operations '''
+
+    @api.expect(BATCH)
+    @api.response(200, 'The batch was run')
+    @jwt_required
+    def post(self):
+        ''' This method runs a list of operations on the other endpoints, in
+            order, with the token of the batch.
+            Each result has the status, body and headers the operation would
+            have had on its own. With atomic set, the first failing operation
+            rolls back every operation and the ones after it are not run.
+
+            :return: A dictionary with the results of the operations
+        '''
+        try:
+            operations, atomic = parse_operations(
+                request.get_json(silent=True), current_app.config.get(
+                    'BATCH_MAX_OPERATIONS', BATCH_MAX_OPERATIONS))
+        except BatchError as error:
+            return {'message': str(error)}, 400
+        results, rolled_back = run_batch(self, operations, atomic)
+        response = {'results': results}
+        if atomic:
+            response['rolledBack'] = rolled_back
+        return response, 200
@@ -1,15 +1,25 @@
 ''' This script handles the categories CRUD '''
 
-from flask import request, jsonify
+from flask import current_app, request, jsonify
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from flask_restplus import fields, Namespace, Resource, reqparse
-from sqlalchemy import func
+from sqlalchemy.orm import subqueryload
 
 from app import db
 from app.models.category import Category
-from ..serializers import CategorySchema
+from app.models.recipe import Recipe
+from ..dump_helper import dump_category
+from ..etag_helper import conditional, row_version, rows_version
+from ..query_budget import query_budget
+from ..response_cache import cached, invalidates
+from ..search import search
 from ..validation_helper import name_validator
-from ..get_helper import PER_PAGE_MAX, PER_PAGE_MIN
+from ..export_helper import (
+    EXPORT_FORMATS, export_response, user_categories)
+from ..get_helper import PER_PAGE_MAX, PER_PAGE_MIN, keyset_paginate
+from ..import_helper import (
+    CategoryImport, ImportParseError, IMPORT_BATCH_SIZE, NDJSON_TYPES,
+    iter_json_array, iter_ndjson)
 
 
 api = Namespace(
@@ -34,6 +44,10 @@ EDIT_PARSER.add_argument('category_name', required=False,
 EDIT_PARSER.add_argument('description', required=False,
                          help='Try again: {error_msg}', default='')
 
+# dump_category nests each category's recipes, load them with the categories
+# instead of lazily once per category
+WITH_RECIPES = (subqueryload(Category.recipes),)
+
 Q_PARSER = reqparse.RequestParser(bundle_errors=True)
 Q_PARSER.add_argument('q', required=False,
                       help='search for word', location='args')
@@ -41,6 +55,33 @@ Q_PARSER.add_argument('page', required=False, type=int,
                       help='Number of pages', location='args')
 Q_PARSER.add_argument('per_page', required=False, type=int,
                       help='categories per page', default=10, location='args')
+Q_PARSER.add_argument('cursor', required=False,
+                      help='nextCursor of the previous page, empty for the '
+                      'first page', location='args')
+
+EXPORT_PARSER = reqparse.RequestParser(bundle_errors=True)
+EXPORT_PARSER.add_argument('format', choices=tuple(EXPORT_FORMATS),
+                           default='ndjson', help='Try again: {error_msg}',
+                           location='args')
+
+
+def categories_version():
+    ''' Versions the user's categories and the recipes nested in them '''
+    user_id = get_jwt_identity()
+    return (rows_version(Category, Category.created_by == user_id) +
+            rows_version(Recipe, Recipe.created_by == user_id))
+
+
+def category_version(category_id):
+    ''' Versions a category and the recipes nested in it '''
+    user_id = get_jwt_identity()
+    the_category = row_version(Category, Category.created_by == user_id,
+                               Category.category_id == category_id)
+    if the_category is None:
+        return None
+    return tuple(the_category) + rows_version(
+        Recipe, Recipe.created_by == user_id,
+        Recipe.category_id == category_id)
 
 
 @api.route('/')
@@ -48,8 +89,12 @@ class Categories(Resource):
     ''' The class handles the Category CRUD functionality '''
 
     @api.response(200, 'Category found successfully')
+    @api.response(304, 'Not modified')
     @api.expect(Q_PARSER)
+    @query_budget(5)
     @jwt_required
+    @cached
+    @conditional(categories_version)
     def get(self):
         ''' This method returns all the categories
 
@@ -58,33 +103,50 @@ class Categories(Resource):
         user_id = get_jwt_identity()
 
         # get BaseQuery object to allow for pagination
-        the_categories = Category.query.filter_by(
-            created_by=user_id).order_by("category_id desc")
+        the_categories = Category.query.options(*WITH_RECIPES).filter_by(
+            created_by=user_id).order_by(Category.category_id.desc())
         args = Q_PARSER.parse_args(request)
         q = args.get('q', '')
         page = args.get('page', 1)
         per_page = args.get('per_page', 10)
+        cursor = args.get('cursor')
         if per_page < PER_PAGE_MIN:
             per_page = PER_PAGE_MIN
         if per_page > PER_PAGE_MAX:
             per_page = PER_PAGE_MAX
 
         if q:
-            q = q.lower()
-            the_categories = Category.query.filter(
-                (Category.created_by == user_id),
-                (func.lower(Category.category_name).ilike("%" + q + "%")))
-            # print("qqqqqqqqqqqqqqqqqqqq", the_categories.all())
-            if the_categories.all():
-                categorieschema = CategorySchema(many=True)
-                the_categories = categorieschema.dump(the_categories)
-                # print("<<<<<<<<<<<<<<<<>>>>>>>>>>>>>",
-                #       the_categories.data)
-
-                response = {"categories": the_categories.data,
-                            "message": "These are the category search results"
-                            }
-                return response
+            search_results = search(Category, q, Category.created_by == user_id)
+            if search_results is not None:
+                pag_search = search_results.options(*WITH_RECIPES).paginate(
+                    page, per_page, error_out=False)
+                if pag_search.items:
+                    the_categories = [dump_category(a_category) for a_category
+                                      in pag_search.items]
+
+                    response = {"categories": the_categories,
+                                "message": "These are the category search "
+                                "results",
+                                "categoryPages": pag_search.pages,
+                                "categoryPage": pag_search.page
+                                }
+                    return response
+
+        if cursor is not None:
+            try:
+                page_categories, next_cursor = keyset_paginate(
+                    the_categories, Category.category_id, cursor, per_page)
+            except ValueError:
+                return {'message': 'The cursor is not valid'}, 400
+            if not page_categories:
+                return {'message': 'There are no more categories'}
+            all_categories = [dump_category(a_category)
+                              for a_category in page_categories]
+            return {"categories": all_categories,
+                    "message": "These are your categories",
+                    "nextCursor": next_cursor
+                    }
+
         pag_categories = the_categories.paginate(
             page, per_page, error_out=False)
 
@@ -93,13 +155,9 @@ class Categories(Resource):
 
         if not pag_categories.items:
             return {'message': f'There are no categories on page {page}'}
-        paginated = []
-        for a_category in pag_categories.items:
-            paginated.append(a_category)
-        categoriesschema = CategorySchema(many=True)
-        all_categories = categoriesschema.dump(paginated)
-        # print("<><><><><><><><><><><><><><><>", all_categories.data)
-        response = {"categories": all_categories.data,
+        all_categories = [dump_category(a_category)
+                          for a_category in pag_categories.items]
+        response = {"categories": all_categories,
                     "message": "These are your categories",
                     "categoryPages": pages,
                     "categoryPage": page
@@ -108,7 +166,9 @@ class Categories(Resource):
 
     @api.expect(CATEGORY)
     @api.response(201, 'Category created successfully')
+    @query_budget(3)
     @jwt_required
+    @invalidates
     def post(self):
         ''' This method adds a new category to the DB
 
@@ -145,28 +205,52 @@ class Categories(Resource):
                 'more than one word'}, 400
 
 
+@api.route('/export/')
+class ExportCategories(Resource):
+    ''' This class handles exporting all of a user's categories '''
+
+    @api.response(200, 'Success')
+    @api.expect(EXPORT_PARSER)
+    @jwt_required
+    def get(self):
+        ''' This method downloads all the categories created by a user.
+            As NDJSON each line is a category with its recipes nested, the
+            format the import endpoint takes. As CSV each row is a category.
+
+            :return: A streamed response with every category
+        '''
+        user_id = get_jwt_identity()
+        args = EXPORT_PARSER.parse_args(request)
+        return export_response(user_categories(user_id), args['format'],
+                               'categories')
+
+
 @api.route('/<int:category_id>/')
 class Categoryy(Resource):
     ''' This class handles a single category GET, PUT AND DELETE functionality
     '''
 
     @api.response(200, 'Category found successfully')
+    @api.response(304, 'Not modified')
+    @query_budget(4)
     @jwt_required
+    @cached
+    @conditional(category_version)
     def get(self, category_id):
         ''' This method returns a category '''
         user_id = get_jwt_identity()
-        the_category = Category.query.filter_by(created_by=user_id,
-                                                category_id=category_id).first()
+        the_category = Category.query.options(*WITH_RECIPES).filter_by(
+            created_by=user_id, category_id=category_id).first()
 
         if the_category is None:
             return {'message': f'You don\'t have a category with id {category_id}'}, 404
-        categoryschema = CategorySchema()
-        get_response = categoryschema.dump(the_category)
-        return jsonify(get_response.data)
+        return jsonify(dump_category(the_category))
 
     @api.expect(EDIT_PARSER)
     @api.response(204, 'Successfully edited')
+    @query_budget(2)
     @jwt_required
+    @invalidates
     def put(self, category_id):
         ''' This method edits a category.
 
@@ -210,7 +294,9 @@ class Categoryy(Resource):
                 'more than one word'}
 
     @api.response(204, 'Category was deleted')
+    @query_budget(1)
     @jwt_required
+    @invalidates
     def delete(self, category_id):
         ''' This method deletes a Category. The method is passed the category
             name in the url and it deletes the category that matches that name.
@@ -219,10 +305,46 @@ class Categoryy(Resource):
             :return: A dictionary with a message confirming deletion.
         '''
 
-        the_category = Category.query.filter_by(
-            category_id=category_id).first()
-        if the_category is not None:
-            db.session.delete(the_category)
-            db.session.commit()
+        user_id = get_jwt_identity()
+        # a single DELETE, the database deletes the recipes with it
+        deleted = Category.query.filter_by(
+            created_by=user_id, category_id=category_id).delete(
+                synchronize_session=False)
+        db.session.commit()
+        if deleted:
             return {'message': 'Category was deleted'}, 200
         return {'message': f'Category with id {category_id} does not exist'}
+
+
+@api.route('/import/')
+class ImportCategories(Resource):
+    ''' This class handles bulk imports of categories with their recipes '''
+
+    @api.response(200, 'Import finished')
+    @jwt_required
+    @invalidates
+    def post(self):
+        ''' This method imports categories with nested recipes.
+            The body is NDJSON (Content-Type application/x-ndjson), one
+            category per line, or a JSON array of categories, e.g.
+            {"category_name": "...", "description": "...",
+             "recipes": [{"recipe_name": "...", "ingredients": "..."}]}
+            Recipes for a category that already exists are added to it.
+
+            :return: The number of categories and recipes created and the
+            items or recipes that were rejected
+        '''
+        user_id = get_jwt_identity()
+        the_import = CategoryImport(
+            user_id, current_app.config.get('IMPORT_BATCH_SIZE', IMPORT_BATCH_SIZE))
+        if request.mimetype in NDJSON_TYPES:
+            documents = iter_ndjson(request.stream)
+        else:
+            documents = iter_json_array(request.stream)
+        try:
+            for number, document in documents:
+                the_import.add(number, document)
+        except ImportParseError as error:
+            the_import.errors.append({'message': str(error)})
+        the_import.flush()
+        return the_import.report(), 200
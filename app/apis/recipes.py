@@ -2,17 +2,24 @@
 
 ''' This script handles the recipes CRUD '''
 
-from flask import request
+from flask import current_app, request
 from flask_jwt_extended import jwt_required, get_jwt_identity
 from flask_restplus import fields, Namespace, Resource, reqparse
-from sqlalchemy import func
 
 from app import db
 from app.models.recipe import Recipe
+from ..bulk_helper import (
+    BULK_MAX_IDS, BulkError, delete_recipes, parse_selection, parse_values,
+    update_recipes)
+from ..etag_helper import conditional, row_version, rows_version
+from ..query_budget import query_budget
+from ..response_cache import cached, invalidates
+from ..export_helper import EXPORT_FORMATS, export_response, user_recipes
+from ..ingredient_index import (
+    MATCHES, parse_ingredients, recipes_with_ingredients)
+from ..search import search
 from ..validation_helper import name_validator
-from ..get_helper import (
-    manage_get_recipes, manage_get_recipe, PER_PAGE_MAX, PER_PAGE_MIN)
-from ..serializers import RecipeSchema
+from ..get_helper import manage_get_recipes, manage_get_recipe
 
 api = Namespace(
     'recipes', description='Creating, viewing, editing and deleting recipes')
@@ -23,6 +30,31 @@ recipe = api.model('Recipe', {
                                  description='Recipe ingredients'),
 })
 
+RECIPE_FILTER = api.model('RecipeFilter', {
+    'category_id': fields.Integer(description='the recipes in a category'),
+    'q': fields.String(description='the recipes matching a search'),
+    'created_after': fields.DateTime(description='the recipes created on or '
+                                     'after, e.g. 2018-02-01'),
+    'created_before': fields.DateTime(description='the recipes created '
+                                      'before, e.g. 2018-03-01'),
+})
+
+BULK_SELECTION = api.model('BulkSelection', {
+    'ids': fields.List(fields.Integer, description='the ids of the recipes'),
+    'filter': fields.Nested(RECIPE_FILTER, description='selects the recipes '
+                            'matching every filter given, and the ids if '
+                            'any'),
+})
+
+BULK_UPDATE = api.inherit('BulkUpdate', BULK_SELECTION, {
+    'set': fields.Nested(api.model('RecipeValues', {
+        'recipe_name': fields.String(description='Recipe name'),
+        'ingredients': fields.String(description='Recipe ingredients'),
+        'category_id': fields.Integer(description='the category to move the '
+                                      'recipes to'),
+    }), required=True),
+})
+
 RECIPE_PARSER = reqparse.RequestParser(bundle_errors=True)
 RECIPE_PARSER.add_argument(
     'recipe_name', required=True, help='Try again: {error_msg}')
@@ -39,6 +71,40 @@ Q_PARSER.add_argument(
     'page', type=int, help='Try again: {error_msg}', location='args')
 Q_PARSER.add_argument('per_page', type=int,
                       help='Try again: {error_msg}', location='args')
+Q_PARSER.add_argument('cursor', help='nextCursor of the previous page, empty '
+                      'for the first page', location='args')
+
+INGREDIENTS_PARSER = Q_PARSER.copy()
+INGREDIENTS_PARSER.remove_argument('q')
+INGREDIENTS_PARSER.add_argument(
+    'ingredients', required=True, location='args',
+    help='Comma separated ingredients, e.g. garlic, tomato: {error_msg}')
+INGREDIENTS_PARSER.add_argument(
+    'match', choices=MATCHES, default='any', location='args',
+    help='any, all or only, the recipes using nothing else: {error_msg}')
+
+EXPORT_PARSER = reqparse.RequestParser(bundle_errors=True)
+EXPORT_PARSER.add_argument('format', choices=tuple(EXPORT_FORMATS),
+                           default='ndjson', help='Try again: {error_msg}',
+                           location='args')
+
+
+def recipes_version():
+    ''' Versions all of the user's recipes '''
+    return rows_version(Recipe, Recipe.created_by == get_jwt_identity())
+
+
+def category_recipes_version(category_id):
+    ''' Versions the user's recipes in a category '''
+    return rows_version(Recipe, Recipe.created_by == get_jwt_identity(),
+                        Recipe.category_id == category_id)
+
+
+def recipe_version(category_id, recipe_id):
+    ''' Versions a single recipe '''
+    return row_version(Recipe, Recipe.created_by == get_jwt_identity(),
+                       Recipe.category_id == category_id,
+                       Recipe.recipe_id == recipe_id)
 
 # Not consumed
 
@@ -48,8 +114,12 @@ class Recipess(Resource):
     ''' The class handles the view functionality for all recipes '''
 
     @api.response(200, 'Success')
+    @api.response(304, 'Not modified')
     @api.expect(Q_PARSER)
+    @query_budget(3)
     @jwt_required
+    @cached
+    @conditional(recipes_version)
     def get(self):
         ''' A method to get all the recipes
             Returns all the recipes created by a user or a recipe that matches
@@ -62,22 +132,116 @@ class Recipess(Resource):
 
         args = Q_PARSER.parse_args(request)
         q = args.get('q', ' ')
-        #  page = args.get('page', THE_PAGE)
-        per_page = args.get('per_page', PER_PAGE_MAX)
-        if per_page is None or per_page < PER_PAGE_MIN:
-            per_page = PER_PAGE_MIN
-        if per_page > PER_PAGE_MAX:
-            per_page = PER_PAGE_MAX
 
         if q:
-            q = q.lower()
-            the_recipes = Recipe.query.filter(
-                (Recipe.created_by == user_id),
-                ((Recipe.recipe_name).ilike("%" + q + "%"))
-            )
+            search_results = search(Recipe, q, Recipe.created_by == user_id)
+            if search_results is not None:
+                the_recipes = search_results
 
         return manage_get_recipes(the_recipes, args)
 
+
+@api.route('/ingredients/')
+class RecipesByIngredients(Resource):
+    ''' The class handles finding recipes by their ingredients '''
+
+    @api.response(200, 'Success')
+    @api.response(304, 'Not modified')
+    @api.expect(INGREDIENTS_PARSER)
+    @query_budget(3)
+    @jwt_required
+    @cached
+    @conditional(recipes_version)
+    def get(self):
+        ''' A method to find the recipes using the given ingredients.
+            match=any returns the recipes using any of them, match=all the
+            ones using all of them and match=only the ones that can be
+            cooked with them alone, i.e. use nothing else
+
+            :return: A page of the matching recipes
+        '''
+        user_id = get_jwt_identity()
+        args = INGREDIENTS_PARSER.parse_args(request)
+        if args['match'] not in MATCHES:
+            # a bundling parser hands invalid choices back as their message
+            return {'message': {'match': args['match']}}, 400
+        names = parse_ingredients(args['ingredients'])
+        if not names:
+            return {'message': 'No ingredients were given'}, 400
+        the_recipes = recipes_with_ingredients(user_id, names, args['match'])
+        return manage_get_recipes(the_recipes, args)
+
+
+@api.route('/bulk/')
+class BulkRecipes(Resource):
+    ''' The class handles editing and deleting many recipes at once '''
+
+    @api.expect(BULK_UPDATE)
+    @api.response(200, 'Success')
+    @query_budget(8)
+    @jwt_required
+    @invalidates
+    def put(self):
+        ''' A method for editing the recipes with the given ids or matching
+            a filter, e.g. {"filter": {"category_id": 1}, "set":
+            {"category_id": 2}} moves every recipe of category 1 to 2
+
+            :return: A dictionary with the number of recipes edited
+        '''
+        user_id = get_jwt_identity()
+        payload = request.get_json(silent=True)
+        try:
+            criteria = parse_selection(
+                payload, user_id,
+                current_app.config.get('BULK_MAX_IDS', BULK_MAX_IDS))
+            values = parse_values(payload, user_id)
+        except BulkError as error:
+            return {'message': str(error)}, error.code
+        updated = update_recipes(user_id, criteria, values)
+        return {'message': f'{updated} recipes were edited',
+                'updated': updated}, 200
+
+    @api.expect(BULK_SELECTION)
+    @api.response(200, 'Success')
+    @query_budget(1)
+    @jwt_required
+    @invalidates
+    def delete(self):
+        ''' A method for deleting the recipes with the given ids or matching
+            a filter, e.g. {"filter": {"q": "cake"}}
+
+            :return: A dictionary with the number of recipes deleted
+        '''
+        user_id = get_jwt_identity()
+        try:
+            criteria = parse_selection(
+                request.get_json(silent=True), user_id,
+                current_app.config.get('BULK_MAX_IDS', BULK_MAX_IDS))
+        except BulkError as error:
+            return {'message': str(error)}, error.code
+        deleted = delete_recipes(criteria)
+        return {'message': f'{deleted} recipes were deleted',
+                'deleted': deleted}, 200
+
+
+@api.route('/export/')
+class ExportRecipes(Resource):
+    ''' The class handles exporting all of a user's recipes '''
+
+    @api.response(200, 'Success')
+    @api.expect(EXPORT_PARSER)
+    @jwt_required
+    def get(self):
+        ''' A method to download all the recipes created by a user.
+            The recipes are streamed as NDJSON, one recipe per line, or as CSV
+
+            :return: A streamed response with every recipe
+        '''
+        user_id = get_jwt_identity()
+        args = EXPORT_PARSER.parse_args(request)
+        return export_response(user_recipes(user_id), args['format'],
+                               'recipes')
+
 # Consumed for view and search
 
 
@@ -86,8 +250,12 @@ class Recipes(Resource):
     ''' The class handles the Recipes CRUD functionality '''
 
     @api.response(200, 'Success')
+    @api.response(304, 'Not modified')
     @api.expect(Q_PARSER)
+    @query_budget(3)
     @jwt_required
+    @cached
+    @conditional(category_recipes_version)
     def get(self, category_id):
         ''' A method to get recipes in a category.
             Checks if a category ID exists and returns all the recipes in the
@@ -106,29 +274,21 @@ class Recipes(Resource):
         args = Q_PARSER.parse_args(request)
         q = args.get('q', ' ')
 
-        if not the_recipes.all():
-            return {'message': f'No recipes in category {category_id}'}, 404
-
         if q:
-            q = q.lower()
-            the_recipes = Recipe.query.filter(
-                (Recipe.created_by == user_id),
-                (func.lower(Recipe.recipe_name).like("%" + q + "%"))
-            )
-            recipesschema = RecipeSchema(many=True)
-            search_recipes = recipesschema.dump(the_recipes)
-
-            response = {
-                "recipes": search_recipes.data,
-                "message": "These are your recipes",
-            }
-            return response
-        return manage_get_recipes(the_recipes, args)
+            search_results = search(Recipe, q, Recipe.created_by == user_id,
+                                    Recipe.category_id == category_id)
+            if search_results is not None:
+                return manage_get_recipes(search_results, args)
+        # the page's own query tells an empty category apart
+        return manage_get_recipes(the_recipes, args, if_empty=(
+            {'message': f'No recipes in category {category_id}'}, 404))
 
     # specifies the expected input fields
     @api.expect(recipe)
     @api.response(201, 'Success')
+    @query_budget(7)
     @jwt_required
+    @invalidates
     def post(self, category_id):
         ''' A method to create a recipe.
             Checks if a recipe id exists in the given category, if it doesn\'t
@@ -175,7 +335,11 @@ class Recipee(Resource):
     """
 
     @api.response(200, 'Category found successfully')
+    @api.response(304, 'Not modified')
+    @query_budget(2)
     @jwt_required
+    @cached
+    @conditional(recipe_version, dated=True)
     def get(self, category_id, recipe_id):
         ''' A method to get a recipe in a category by id.
             Checks if the given recipe id exists in the given category and
@@ -195,7 +359,9 @@ class Recipee(Resource):
 
     @api.expect(EDIT_PARSER)
     @api.response(204, 'Success')
+    @query_budget(7)
     @jwt_required
+    @invalidates
     def put(self, category_id, recipe_id):
         ''' A method for editing a recipe.
             Checks if the given recipe id exists in the given category and
@@ -235,13 +401,14 @@ class Recipee(Resource):
                 'status': 'Success',
                 'message': 'Recipe details successfully edited'
             }
-            print(response, 'editing recipes')
             return response, 200
         return {'message': 'The recipe name should comprise alphabetical'
                 ' characters and can be more than one word'}, 401
 
     @api.response(204, 'Success')
+    @query_budget(2)
     @jwt_required
+    @invalidates
     def delete(self, category_id, recipe_id):
         ''' A method to delete a recipe
             Checks if the given recipe id exists in the given category and
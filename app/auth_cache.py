@@ -0,0 +1,142 @@
+''' This script caches what a worker works out from a request's token.
+
+    Clients send the same bearer token with every request, for up to a year
+    with the tokens UserLogin gives out. A token's signature is verified and
+    its claims decoded on the first request a worker gets with it. Later
+    requests read the verified claims from a bounded LRU keyed by the
+    token's SHA-256, until the token's exp. The revocation check runs on
+    every request as before, so a logged out token is still rejected.
+
+    The user a token identifies is looked up in the users table once per
+    JWT_USER_CACHE_SECONDS, and a token whose user no longer exists is
+    rejected with a 401 instead of reaching the endpoint.
+'''
+
+import hashlib
+import time
+from collections import OrderedDict, namedtuple
+from threading import Lock
+
+from flask import current_app
+from flask_jwt_extended import view_decorators
+
+from .db import db
+from .models.user import User
+from .query_budget import unbudgeted
+
+CachedUser = namedtuple('CachedUser', ['user_id', 'username', 'email'])
+
+# the decoder the decorators of flask_jwt_extended call, wrapped below
+_decode_jwt = view_decorators.decode_jwt
+
+
+class ExpiringLRU(object):
+    ''' An in-process LRU of at most max_entries, each kept until the Unix
+        time it expires at, counting hits and misses
+
+        :param int max_entries: Entries kept before the least recently used
+        one is evicted, 0 keeps none
+    '''
+
+    def __init__(self, max_entries):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lock = Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'evictions': 0}
+
+    def get(self, key):
+        ''' Returns the value kept under key, None if missing or expired '''
+        with self._lock:
+            value, expires = self._entries.get(key, (None, None))
+            if expires is not None and expires <= time.time():
+                del self._entries[key]
+                value = None
+            if value is None:
+                self._stats['misses'] += 1
+                return None
+            self._entries.move_to_end(key)
+            self._stats['hits'] += 1
+            return value
+
+    def set(self, key, value, expires=None):
+        ''' Keeps a value until expires, a Unix time, or for good if None '''
+        if not self.max_entries:
+            return
+        with self._lock:
+            self._entries[key] = (value, expires)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self._stats['evictions'] += 1
+
+    def clear(self):
+        ''' Drops every entry '''
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        ''' Returns a copy of the counters and the number of entries '''
+        with self._lock:
+            return dict(self._stats, entries=len(self._entries))
+
+
+def decode_jwt(encoded_token, secret, algorithm, csrf, identity_claim):
+    """ flask_jwt_extended's decode_jwt, reading the claims of a token it
+        verified before from the app's token cache. The secret, algorithm
+        and expected claims are the app's own, the same for every call.
+
+        :param str encoded_token: The token from the Authorization header
+        :return: A dictionary of the token's claims
+    """
+    cache = current_app.extensions.get('token_cache')
+    if cache is None:
+        return _decode_jwt(encoded_token, secret, algorithm, csrf,
+                           identity_claim)
+    key = hashlib.sha256(encoded_token.encode('utf-8')).digest()
+    claims = cache.get(key)
+    if claims is None:
+        # raises, and caches nothing, for a token that fails verification
+        claims = _decode_jwt(encoded_token, secret, algorithm, csrf,
+                             identity_claim)
+        cache.set(key, claims, claims.get('exp'))
+    # the request gets its own copy, flask_jwt_extended keeps it on the
+    # request context
+    return dict(claims)
+
+
+def load_user(identity):
+    """ Looks up the user a token identifies, in the worker's user cache
+        first
+
+        :param int identity: The user_id in the token
+        :return: A CachedUser, None if the user does not exist
+    """
+    cache = current_app.extensions['user_cache']
+    user = cache.get(identity)
+    if user is None:
+        # a lookup lands on whichever request finds the user missing or
+        # expired, it does not count against that request's query budget
+        with unbudgeted():
+            row = db.session.query(
+                User.user_id, User.username, User.email).filter_by(
+                    user_id=identity).first()
+        if row is None:
+            return None
+        user = CachedUser(*row)
+        cache.set(identity, user,
+                  time.time() + current_app.config.get(
+                      'JWT_USER_CACHE_SECONDS', 60))
+    return user
+
+
+def init_auth_cache(app):
+    ''' Sets up the worker's token and user caches and has flask_jwt_extended
+        decode tokens through the token cache
+    '''
+    size = app.config.get('JWT_DECODE_CACHE_SIZE', 10000)
+    if size:
+        app.extensions['token_cache'] = ExpiringLRU(size)
+    app.extensions['user_cache'] = ExpiringLRU(
+        app.config.get('JWT_USER_CACHE_SIZE', 10000))
+    # process wide, every app decodes with its own cache or without one
+    view_decorators.decode_jwt = decode_jwt
@@ -0,0 +1,240 @@
+''' This script runs the operations of a batch request.
+
+    Each operation is dispatched to the resource its path routes to, in a
+    request context of its own but in the batch's app context, so the token
+    @jwt_required verified for the batch is the one every operation sees and
+    it is not decoded again. With atomic set, the operations share one
+    transaction: the resources' commits only flush and nothing is committed
+    unless every operation succeeds. Their reads bypass the response cache,
+    which is invalidated once the transaction ends. Otherwise consecutive
+    GETs, which cannot depend on each other, run concurrently on
+    BATCH_READ_WORKERS threads.
+'''
+
+import json
+from concurrent.futures import ThreadPoolExecutor
+
+from flask import _app_ctx_stack, _request_ctx_stack, current_app, request
+from flask_jwt_extended import jwt_required
+from flask_restplus.utils import unpack
+from werkzeug.exceptions import HTTPException
+from werkzeug.test import EnvironBuilder
+from werkzeug.wrappers import BaseResponse
+
+from .db import HOLD_COMMITS, db
+from .response_cache import deferred_invalidation
+from .sharding import UserMoving, moving_response
+
+BATCH_MAX_OPERATIONS = 50
+METHODS = ('GET', 'POST', 'PUT', 'DELETE')
+NOT_RUN = {'status': 424,
+           'body': {'message': 'Not run, an earlier operation failed'}}
+
+# the code of @jwt_required's wrapper, which identifies the methods it wraps
+JWT_REQUIRED_CODE = jwt_required(lambda: None).__code__
+
+
+class BatchError(Exception):
+    ''' Raised when a batch or one of its operations is malformed '''
+
+
+def parse_operations(payload, max_operations):
+    """ Validates the body of a batch request
+
+        :param object payload: The decoded JSON body
+        :param int max_operations: The most operations a batch may hold
+        :return: The list of operations and whether to run them atomically
+        :raises BatchError: If the body is not a valid batch
+    """
+    if not isinstance(payload, dict) or \
+            not isinstance(payload.get('operations'), list):
+        raise BatchError('The body should be an object with a list of '
+                         'operations')
+    operations = payload['operations']
+    if not operations:
+        raise BatchError('The batch has no operations')
+    if len(operations) > max_operations:
+        raise BatchError(f'A batch can hold at most {max_operations} '
+                         'operations')
+    for number, operation in enumerate(operations):
+        if not isinstance(operation, dict) or \
+                not isinstance(operation.get('path'), str):
+            raise BatchError(f'Operation {number} should be an object with a '
+                             'method and a path')
+        operation['method'] = str(operation.get('method', 'GET')).upper()
+        if operation['method'] not in METHODS:
+            raise BatchError(f'Operation {number} has an unsupported method '
+                             f'{operation["method"]}')
+        if not isinstance(operation.get('headers', {}), dict):
+            raise BatchError(f'The headers of operation {number} should be '
+                             'an object')
+    return operations, bool(payload.get('atomic', False))
+
+
+def run_batch(resource, operations, atomic):
+    """ Runs a batch's operations, in order
+
+        :param object resource: The resource handling the batch
+        :param list operations: The operations from parse_operations
+        :param bool atomic: Runs the operations in a single transaction
+        :return: The result of every operation and whether they were rolled
+        back
+    """
+    batch = _Batch(resource)
+    if atomic:
+        return batch.run_atomic(operations)
+    results = []
+    reads = []
+    for operation in operations:
+        if operation['method'] == 'GET':
+            reads.append(operation)
+            continue
+        results += batch.run_reads(reads)
+        reads = []
+        results.append(batch.run(operation))
+    results += batch.run_reads(reads)
+    return results, False
+
+
+class _Batch(object):
+    ''' The state shared by the operations of a batch '''
+
+    def __init__(self, resource):
+        self.resource = resource
+        self.app = current_app._get_current_object()
+        self.jwt = getattr(_app_ctx_stack.top, 'jwt', None)
+        self.blueprint = request.blueprint
+        self.base_url = request.url_root
+        self.authorization = request.headers.get('Authorization')
+
+    def run(self, operation):
+        ''' Runs an operation, rolling back what it left uncommitted if it
+            failed
+        '''
+        result = self.dispatch(operation)
+        if result['status'] >= 500:
+            db.session.rollback()
+        return result
+
+    def run_reads(self, operations):
+        ''' Runs GET operations, concurrently if there is more than one '''
+        executor = self.app.extensions.get('batch_executor')
+        if len(operations) < 2 or executor is None:
+            return [self.dispatch(operation) for operation in operations]
+        return list(executor.map(self.dispatch_in_thread, operations))
+
+    def run_atomic(self, operations):
+        ''' Runs the operations in one transaction, stopping at the first one
+            that fails
+        '''
+        results = []
+        failed = False
+        with deferred_invalidation():
+            # however many times a resource commits, e.g. an import's
+            # batches, it only flushes until every operation has run
+            db.session.info[HOLD_COMMITS] = True
+            try:
+                for operation in operations:
+                    results.append(self.dispatch(operation))
+                    if results[-1]['status'] >= 400:
+                        failed = True
+                        break
+            finally:
+                db.session.info.pop(HOLD_COMMITS, None)
+            if failed:
+                db.session.rollback()
+                results += [dict(NOT_RUN)] * (len(operations) - len(results))
+            else:
+                db.session.commit()
+        return results, failed
+
+    def dispatch_in_thread(self, operation):
+        with self.app.app_context():
+            _app_ctx_stack.top.jwt = self.jwt
+            return self.dispatch(operation)
+
+    def dispatch(self, operation):
+        """ Calls the resource method an operation routes to
+
+            :param dict operation: The method, path, body and headers
+            :return: The operation's status, body and headers
+        """
+        headers = dict(operation.get('headers', {}))
+        if self.authorization:
+            headers['Authorization'] = self.authorization
+        body = operation.get('body')
+        environ = EnvironBuilder(
+            path=operation['path'], base_url=self.base_url,
+            method=operation['method'], headers=headers,
+            data=None if body is None else json.dumps(body),
+            content_type='application/json').get_environ()
+        # pushed onto the stack rather than with RequestContext.push, whose
+        # pop would run the teardown hooks of the batch's own request
+        context = self.app.request_context(environ)
+        _request_ctx_stack.push(context)
+        try:
+            return self.call(context.request)
+        except HTTPException as error:
+            return {'status': error.code, 'body': getattr(
+                error, 'data', {'message': error.description})}
+        except UserMoving:
+            return _result(moving_response())
+        except Exception:
+            self.app.logger.exception(
+                f'Batch operation {operation["method"]} {operation["path"]}')
+            return {'status': 500,
+                    'body': {'message': 'Internal Server Error'}}
+        finally:
+            _request_ctx_stack.pop()
+
+    def call(self, the_request):
+        if the_request.routing_exception is not None:
+            raise the_request.routing_exception
+        endpoint = the_request.url_rule.endpoint
+        resource_class = getattr(self.app.view_functions[endpoint],
+                                 'view_class', None)
+        if resource_class is None or \
+                not endpoint.startswith(self.blueprint + '.') or \
+                isinstance(self.resource, resource_class):
+            return {'status': 400, 'body': {
+                'message': f'{the_request.path} can not be batched'}}
+        resource = resource_class(self.resource.api)
+        method = getattr(resource_class, the_request.method.lower(), None)
+        if method is None:
+            return {'status': 405,
+                    'body': {'message': 'The method is not allowed'}}
+        resource.validate_payload(method)
+        if method.__code__ is JWT_REQUIRED_CODE:
+            # the batch's token was verified already
+            method = method.__wrapped__
+        return _result(method(resource, **the_request.view_args))
+
+
+def _result(response):
+    ''' Turns a resource method's return value into an operation's result '''
+    if isinstance(response, BaseResponse):
+        if response.is_streamed:
+            return {'status': 400, 'body': {
+                'message': 'Streamed responses can not be batched'}}
+        data = response.get_data(as_text=True)
+        if response.mimetype == 'application/json' and data:
+            data = json.loads(data)
+        code = response.status_code
+        headers = response.headers
+    else:
+        data, code, headers = unpack(response)
+    result = {'status': code, 'body': data if data != '' else None}
+    headers = {name: value for name, value in dict(headers).items()
+               if name not in ('Content-Type', 'Content-Length')}
+    if headers:
+        result['headers'] = headers
+    return result
+
+
+def init_batch(app):
+    ''' Sets up the threads batches run their reads on. Threads are started
+        on first use, so none is started before a preloading server forks
+    '''
+    workers = app.config.get('BATCH_READ_WORKERS', 4)
+    if workers > 1:
+        app.extensions['batch_executor'] = ThreadPoolExecutor(workers)
@@ -0,0 +1,165 @@
+''' This script runs bulk updates and deletes of a user's recipes.
+
+    The recipes are selected by a list of ids, a filter or both, and every
+    recipe selected is changed by a single UPDATE or DELETE scoped to the
+    user, rather than being loaded and written one by one. New ingredients
+    are the exception, the ids of the recipes they go to are read first so
+    the ingredient index can be relinked.
+'''
+
+from flask_restplus.inputs import datetime_from_iso8601
+
+from .db import db
+from .ingredient_index import index_recipes
+from .models.category import Category
+from .models.recipe import Recipe
+from .search import search
+from .validation_helper import name_validator
+
+BULK_MAX_IDS = 1000
+FILTERS = ('category_id', 'q', 'created_after', 'created_before')
+UPDATES = ('recipe_name', 'ingredients', 'category_id')
+
+
+class BulkError(Exception):
+    ''' Raised when a bulk request is malformed '''
+
+    def __init__(self, message, code=400):
+        super().__init__(message)
+        self.code = code
+
+
+def _integer(value, name):
+    if isinstance(value, bool) or not isinstance(value, int):
+        raise BulkError(f'{name} should be an integer')
+    return value
+
+
+def _date(value, name):
+    try:
+        return datetime_from_iso8601(value)
+    except (TypeError, ValueError):
+        raise BulkError(f'{name} should be an ISO 8601 date, e.g. '
+                        '2018-02-01 or 2018-02-01T10:00:00')
+
+
+def parse_selection(payload, user_id, max_ids):
+    """ Turns the ids and filter of a bulk request into query criteria
+
+        :param object payload: The decoded JSON body, e.g. {"ids": [1, 2]} or
+        {"filter": {"category_id": 1, "q": "cake"}}
+        :param int user_id: The user whose recipes are selected
+        :param int max_ids: The most ids a request may list
+        :return: A list of criteria, the first of them the created_by scope
+        :raises BulkError: If nothing or something invalid is selected
+    """
+    if not isinstance(payload, dict):
+        raise BulkError('The body should be a JSON object')
+    ids = payload.get('ids')
+    filters = payload.get('filter', {})
+    if not isinstance(filters, dict):
+        raise BulkError('filter should be an object')
+    unknown = set(filters) - set(FILTERS)
+    if unknown:
+        raise BulkError(f'Unknown filters {", ".join(sorted(unknown))}, use '
+                        f'{", ".join(FILTERS)}')
+    if ids is None and not filters:
+        raise BulkError('Select the recipes with ids, a filter or both')
+
+    criteria = [Recipe.created_by == user_id]
+    if ids is not None:
+        if not isinstance(ids, list) or not ids:
+            raise BulkError('ids should be a list of recipe ids')
+        if len(ids) > max_ids:
+            raise BulkError(f'A request can list at most {max_ids} ids')
+        criteria.append(Recipe.recipe_id.in_(
+            {_integer(an_id, 'ids') for an_id in ids}))
+    if 'category_id' in filters:
+        criteria.append(Recipe.category_id == _integer(
+            filters['category_id'], 'category_id'))
+    if 'created_after' in filters:
+        criteria.append(Recipe.date_created >= _date(
+            filters['created_after'], 'created_after'))
+    if 'created_before' in filters:
+        criteria.append(Recipe.date_created < _date(
+            filters['created_before'], 'created_before'))
+    if 'q' in filters:
+        matches = search(Recipe, str(filters['q']), *criteria)
+        if matches is None:
+            raise BulkError('q holds no words to search for')
+        criteria.append(Recipe.recipe_id.in_(
+            matches.with_entities(Recipe.recipe_id).order_by(None)))
+    return criteria
+
+
+def parse_values(payload, user_id):
+    """ Validates the new values of a bulk update
+
+        :param object payload: The decoded JSON body, its "set" object holds
+        the new recipe_name, ingredients or category_id
+        :param int user_id: The user whose recipes are updated
+        :return: A dictionary of the recipe columns to set
+        :raises BulkError: If a value is invalid or the category is not the
+        user's
+    """
+    values = payload.get('set')
+    if not isinstance(values, dict) or not values:
+        raise BulkError(f'set should be an object with the new '
+                        f'{", ".join(UPDATES)}')
+    unknown = set(values) - set(UPDATES)
+    if unknown:
+        raise BulkError(f'Recipes have no {", ".join(sorted(unknown))} to '
+                        'set')
+    if 'recipe_name' in values:
+        recipe_name = str(values['recipe_name']).lower()
+        if not name_validator(recipe_name):
+            raise BulkError('The recipe name should comprise alphabetical '
+                            'characters and can be more than one word')
+        values['recipe_name'] = recipe_name
+    if 'ingredients' in values:
+        values['ingredients'] = str(values['ingredients']).lower()
+    if 'category_id' in values:
+        category_id = _integer(values['category_id'], 'category_id')
+        category = Category.query.filter_by(
+            created_by=user_id, category_id=category_id)
+        if not db.session.query(category.exists()).scalar():
+            raise BulkError(f'Category with id {category_id} does not exist',
+                            404)
+    return values
+
+
+def update_recipes(user_id, criteria, values):
+    """ Sets new values on every recipe selected
+
+        :param int user_id: The user whose recipes are updated
+        :param list criteria: The criteria from parse_selection
+        :param dict values: The values from parse_values
+        :return: The number of recipes updated
+    """
+    if 'ingredients' in values:
+        recipe_ids = [recipe_id for recipe_id, in db.session.query(
+            Recipe.recipe_id).filter(*criteria)]
+        if not recipe_ids:
+            return 0
+        criteria = [Recipe.created_by == user_id,
+                    Recipe.recipe_id.in_(recipe_ids)]
+    updated = Recipe.query.filter(*criteria).update(
+        values, synchronize_session=False)
+    if 'ingredients' in values:
+        # the UPDATE skips the session events keeping the index current
+        index_recipes(db.session.connection(), [
+            (recipe_id, user_id, values['ingredients'])
+            for recipe_id in recipe_ids])
+    db.session.commit()
+    return updated
+
+
+def delete_recipes(criteria):
+    """ Deletes every recipe selected, with their ingredient links
+
+        :param list criteria: The criteria from parse_selection
+        :return: The number of recipes deleted
+    """
+    deleted = Recipe.query.filter(*criteria).delete(synchronize_session=False)
+    db.session.commit()
+    return deleted
@@ -0,0 +1,130 @@
+''' This script handles compressing responses.
+
+    The encoding is negotiated from the request's Accept-Encoding: brotli if
+    the brotli package is installed and the client takes it, else gzip.
+    Buffered responses under COMPRESS_MIN_SIZE are sent as they are, streamed
+    responses are compressed chunk by chunk as they are sent.
+'''
+
+import gzip
+import zlib
+
+from flask import current_app, request
+
+try:
+    import brotli
+except ImportError:     # optional, gzip is used without it
+    brotli = None
+
+COMPRESS_MIMETYPES = ('application/json', 'application/x-ndjson', 'text/csv',
+                      'text/html', 'text/css', 'application/javascript')
+# suffixes added to a response's ETag, one per encoding, so each encoded
+# representation has its own strong ETag
+ETAG_SUFFIXES = ('-br', '-gzip')
+
+
+def _encodings():
+    if brotli is not None:
+        return ['br', 'gzip']
+    return ['gzip']
+
+
+def compress(data, encoding, config):
+    """ Compresses a whole body
+
+        :param bytes data: The body
+        :param str encoding: br or gzip
+        :param dict config: The app config holding the compression levels
+        :return: The compressed body
+    """
+    if encoding == 'br':
+        return brotli.compress(data, quality=config['COMPRESS_BR_LEVEL'])
+    return gzip.compress(data, config['COMPRESS_LEVEL'])
+
+
+def compress_stream(chunks, encoding, config):
+    """ Compresses a streamed body, flushing after every chunk so each one
+        reaches the client as soon as it is produced
+
+        :param object chunks: The iterable of the streamed body
+        :param str encoding: br or gzip
+        :param dict config: The app config holding the compression levels
+        :return: A generator of compressed chunks
+    """
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=config['COMPRESS_BR_LEVEL'])
+        process = getattr(compressor, 'process', None) or compressor.compress
+        flush, finish = compressor.flush, compressor.finish
+    else:
+        compressor = zlib.compressobj(config['COMPRESS_LEVEL'], zlib.DEFLATED,
+                                      16 + zlib.MAX_WBITS)
+        process = compressor.compress
+
+        def flush():
+            return compressor.flush(zlib.Z_SYNC_FLUSH)
+
+        def finish():
+            return compressor.flush(zlib.Z_FINISH)
+
+    try:
+        for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode('utf-8')
+            data = process(chunk) + flush()
+            if data:
+                yield data
+        yield finish()
+    finally:
+        if hasattr(chunks, 'close'):
+            chunks.close()
+
+
+def compress_response(response):
+    ''' Compresses a response with the encoding the client prefers '''
+    config = current_app.config
+    if not config['COMPRESS_ENABLED'] or response.direct_passthrough:
+        return response
+    encoding = request.accept_encodings.best_match(_encodings())
+
+    if response.status_code == 304:
+        # a 304 carries the ETag of the representation the client holds
+        etag, weak = response.get_etag()
+        for suffix in ETAG_SUFFIXES:
+            if etag and request.if_none_match.contains(etag + suffix):
+                response.set_etag(etag + suffix, weak)
+        return response
+
+    if (response.status_code < 200 or response.status_code == 204 or
+            response.mimetype not in config['COMPRESS_MIMETYPES'] or
+            'Content-Encoding' in response.headers or
+            'no-transform' in response.headers.get('Cache-Control', '')):
+        return response
+    response.vary.add('Accept-Encoding')
+    if encoding is None:
+        return response
+
+    if response.is_streamed:
+        response.response = compress_stream(response.response, encoding,
+                                            config)
+        response.headers.pop('Content-Length', None)
+    else:
+        data = response.get_data()
+        if len(data) < config['COMPRESS_MIN_SIZE']:
+            return response
+        response.set_data(compress(data, encoding, config))
+    response.headers['Content-Encoding'] = encoding
+
+    etag, weak = response.get_etag()
+    if etag:
+        response.set_etag(f'{etag}-{encoding}', weak)
+    return response
+
+
+def init_compression(app):
+    ''' Registers response compression on the app '''
+    app.config.setdefault('COMPRESS_ENABLED', True)
+    app.config.setdefault('COMPRESS_MIN_SIZE', 500)
+    app.config.setdefault('COMPRESS_LEVEL', 6)
+    app.config.setdefault('COMPRESS_BR_LEVEL', 4)
+    app.config.setdefault('COMPRESS_MIMETYPES', COMPRESS_MIMETYPES)
+    app.after_request(compress_response)
@@ -1,5 +1,100 @@
 ''' This script creates the db instance '''
 
-from flask_sqlalchemy import SQLAlchemy
+import sqlite3
+from weakref import WeakKeyDictionary
+
+from flask_sqlalchemy import SQLAlchemy as BaseSQLAlchemy, SignallingSession
+from sqlalchemy import DateTime, event, orm
+from sqlalchemy.engine import Engine
+from sqlalchemy.ext.compiler import compiles
+from sqlalchemy.sql.expression import FunctionElement
+
+from .db_pool import pool_options
+
+POOL_SETTINGS = ('pool_size', 'pool_timeout', 'pool_recycle', 'max_overflow')
+
+
+# the app.extensions keys of the routers, asked in turn for a bind
+ROUTERS = ('shard_router', 'replica_router')
+# the session.info key set while an atomic batch runs, see
+# app/batch_helper.py
+HOLD_COMMITS = 'hold_commits'
+
+
+class RoutingSession(SignallingSession):
+    ''' A session running its statements on the bind the app's routers pick,
+        the user's shard (see app/sharding.py) or a read replica (see
+        app/replicas.py), and on the primary without one. While
+        HOLD_COMMITS is set in its info, a commit only flushes.
+    '''
+
+    def commit(self):
+        if self.info.get(HOLD_COMMITS):
+            self.flush()
+            return
+        super().commit()
+
+    def get_bind(self, mapper=None, clause=None):
+        for name in ROUTERS:
+            router = self.app.extensions.get(name)
+            if router is not None:
+                bind = router.bind_for(self, mapper)
+                if bind is not None:
+                    return db.get_engine(self.app, bind=bind)
+        return super().get_bind(mapper, clause)
+
+
+class SQLAlchemy(BaseSQLAlchemy):
+    ''' Flask-SQLAlchemy creating engines with the pool settings of
+        instance/config.py, and sessions routed to the shards and replicas
+    '''
+
+    def __init__(self, *args, **kwargs):
+        # the bind name of every engine handed out, 'primary' for the
+        # default one, which the metrics label statements with
+        self.bind_names = WeakKeyDictionary()
+        super().__init__(*args, **kwargs)
+
+    def create_session(self, options):
+        return orm.sessionmaker(class_=RoutingSession, db=self, **options)
+
+    def get_engine(self, app=None, bind=None):
+        engine = super().get_engine(app, bind)
+        self.bind_names[engine] = bind or 'primary'
+        return engine
+
+    def apply_driver_hacks(self, app, info, options):
+        if info.drivername == 'sqlite':
+            # sqlite connections are not pooled, see flask_sqlalchemy
+            for setting in POOL_SETTINGS:
+                options.pop(setting, None)
+        super().apply_driver_hacks(app, info, options)
+        options.update(pool_options(app.config, info))
+
+
+class UtcNow(FunctionElement):
+    ''' The current time in UTC, as a naive timestamp. Postgres'
+        CURRENT_TIMESTAMP is in the server's time zone, SQLite's in UTC.
+    '''
+    type = DateTime()
+
+
+@compiles(UtcNow)
+def _utc_now(element, compiler, **kwargs):
+    return 'CURRENT_TIMESTAMP'
+
+
+@compiles(UtcNow, 'postgresql')
+def _utc_now_postgresql(element, compiler, **kwargs):
+    return "TIMEZONE('utc', CURRENT_TIMESTAMP)"
+
+
+@event.listens_for(Engine, 'connect')
+def _enforce_foreign_keys(dbapi_connection, connection_record):
+    # SQLite ignores foreign keys, and so the ON DELETE CASCADE deleting a
+    # category's recipes, unless they are switched on per connection
+    if isinstance(dbapi_connection, sqlite3.Connection):
+        dbapi_connection.execute('PRAGMA foreign_keys=ON')
+
 
 db = SQLAlchemy()
@@ -0,0 +1,122 @@
+''' This script holds the connection pool the app's engines use.
+
+    It is SQLAlchemy's QueuePool timing every checkout, so the wait for a
+    free connection and the connections in use can be watched while sizing
+    workers against the database's connection limit. It also pings
+    connections before handing them out and never hands a connection opened
+    by a parent process to a forked worker.
+'''
+
+import os
+import time
+from threading import Lock
+
+from sqlalchemy import event, exc
+from sqlalchemy.pool import QueuePool
+
+
+class TimedQueuePool(QueuePool):
+    ''' A QueuePool counting checkouts, their wait and the ones timing out.
+
+        :param bool pre_ping: Runs SELECT 1 on a connection before a checkout
+        returns it, replacing it if the database dropped it
+    '''
+
+    def __init__(self, creator, pre_ping=False, **kw):
+        super().__init__(creator, **kw)
+        self.pre_ping = pre_ping
+        self._stats_lock = Lock()
+        self._stats = {'checkouts': 0, 'timeouts': 0, 'wait_seconds': 0.0,
+                       'max_wait_seconds': 0.0}
+        # a recreated pool is handed the listeners of the one it replaces
+        if '_dispatch' not in kw:
+            event.listen(self, 'connect', _remember_pid)
+            event.listen(self, 'checkout', self._on_checkout)
+
+    def recreate(self):
+        self.logger.info("Pool recreating")
+        return self.__class__(self._creator, pool_size=self._pool.maxsize,
+                              max_overflow=self._max_overflow,
+                              timeout=self._timeout,
+                              recycle=self._recycle, echo=self.echo,
+                              logging_name=self._orig_logging_name,
+                              use_threadlocal=self._use_threadlocal,
+                              reset_on_return=self._reset_on_return,
+                              _dispatch=self.dispatch,
+                              dialect=self._dialect,
+                              pre_ping=self.pre_ping)
+
+    def stats(self):
+        ''' Returns the pool's gauges and a copy of its checkout counters '''
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats.update(size=self.size(), in_use=self.checkedout(),
+                     idle=self.checkedin(), overflow=max(self.overflow(), 0))
+        return stats
+
+    def _do_get(self):
+        started = time.monotonic()
+        try:
+            record = super()._do_get()
+        except exc.TimeoutError:
+            self._record(time.monotonic() - started, timeouts=1)
+            raise
+        self._record(time.monotonic() - started, checkouts=1)
+        return record
+
+    def _record(self, waited, **increments):
+        with self._stats_lock:
+            for key, value in increments.items():
+                self._stats[key] += value
+            self._stats['wait_seconds'] += waited
+            self._stats['max_wait_seconds'] = max(
+                self._stats['max_wait_seconds'], waited)
+
+    def _on_checkout(self, dbapi_connection, connection_record,
+                     connection_proxy):
+        if connection_record.info.get('pid') != os.getpid():
+            # opened before a fork, the parent still owns the socket, so it
+            # is dropped without being closed
+            connection_record.connection = connection_proxy.connection = None
+            raise exc.DisconnectionError(
+                'Connection belongs to another process')
+        if self.pre_ping:
+            cursor = dbapi_connection.cursor()
+            try:
+                cursor.execute('SELECT 1')
+            except Exception:
+                raise exc.DisconnectionError('Connection failed a ping')
+            finally:
+                try:
+                    cursor.close()
+                except Exception:
+                    pass
+
+
+def _remember_pid(dbapi_connection, connection_record):
+    connection_record.info['pid'] = os.getpid()
+
+
+def pool_options(config, info):
+    """ Returns the create_engine options for the pool settings in config
+
+        :param dict config: The app config
+        :param object info: The URL of the database
+        :return: A dict of create_engine keyword arguments
+    """
+    if info.drivername == 'sqlite':
+        return {}
+    options = {'poolclass': TimedQueuePool,
+               'pre_ping': config.get('SQLALCHEMY_POOL_PRE_PING', True)}
+    timeout = config.get('SQLALCHEMY_STATEMENT_TIMEOUT')
+    if timeout and info.drivername.startswith('postgresql'):
+        options['connect_args'] = {
+            'options': f'-c statement_timeout={int(timeout)}'}
+    return options
+
+
+def pool_stats(engine):
+    ''' Returns the gauges of an engine's pool, empty if it is not timed '''
+    if isinstance(engine.pool, TimedQueuePool):
+        return engine.pool.stats()
+    return {}
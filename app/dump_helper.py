@@ -0,0 +1,35 @@
+''' This script dumps model objects with the compiled serializers of
+    app/serializers.py for the endpoints and the exports.
+
+    The serializers are built on the first dump, not when the app is
+    imported: app/serializers.py imports marshmallow-sqlalchemy, which is
+    slow to import. warm_up builds them ahead of the first request.
+'''
+
+from functools import lru_cache
+
+
+@lru_cache()
+def load_serializers():
+    ''' Imports app/serializers.py, building its serializers, once
+
+        :return: The serializers module
+    '''
+    from . import serializers
+
+    return serializers
+
+
+def dump_category(the_category):
+    ''' Dumps a category with its recipes, like CategorySchema '''
+    return load_serializers().dump_category(the_category)
+
+
+def dump_category_fields(the_category):
+    ''' Dumps a category's own fields, without its recipes '''
+    return load_serializers().dump_category_fields(the_category)
+
+
+def dump_recipe(the_recipe):
+    ''' Dumps a recipe, like RecipeSchema '''
+    return load_serializers().dump_recipe(the_recipe)
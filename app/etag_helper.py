@@ -0,0 +1,114 @@
+''' This script handles conditional GET requests.
+
+    Resources are versioned from their ids, their version columns, which
+    every UPDATE bumps, and their date_modified, which an aggregate over an
+    index answers without loading or serializing the rows. Clients sending
+    If-None-Match get a 304 when the version has not changed. Only a single
+    row is answered by its date_modified for If-Modified-Since, deleting a
+    row from a set leaves the set's latest date_modified as it was.
+'''
+
+import hashlib
+from functools import wraps
+
+from flask import Response, request
+from flask_jwt_extended import get_jwt_identity
+
+from .compression import ETAG_SUFFIXES
+from .db import db
+
+CACHE_CONTROL = 'private, no-cache'
+VARY = 'Authorization'
+
+
+def row_version(model, *criteria):
+    """ Returns the version of a single row
+
+        :param object model: Recipe or Category
+        :param criteria: The filters identifying the row
+        :return: A tuple of the row's id, version and date_modified or None
+    """
+    pk = model.__mapper__.primary_key[0]
+    return db.session.query(pk, model.version, model.date_modified).filter(
+        *criteria).first()
+
+
+def rows_version(model, *criteria):
+    """ Returns the version of a set of rows, which changes when a row is
+        added, deleted or edited
+
+        :param object model: Recipe or Category
+        :param criteria: The filters selecting the rows
+        :return: A tuple of the row count, highest id, sum of the versions
+        and latest date_modified
+    """
+    pk = model.__mapper__.primary_key[0]
+    return tuple(db.session.query(
+        db.func.count(pk), db.func.max(pk), db.func.sum(model.version),
+        db.func.max(model.date_modified)).filter(*criteria).one())
+
+
+def make_etag(*parts):
+    ''' Builds a strong ETag from the parts of a version '''
+    digest = hashlib.sha1('|'.join(map(str, parts)).encode('utf-8'))
+    return digest.hexdigest()
+
+
+def not_modified(etag, last_modified):
+    ''' Checks the request's validators against a resource's version '''
+    if request.if_none_match:
+        # the client may hold the ETag of a compressed representation
+        return any(request.if_none_match.contains(etag + suffix)
+                   for suffix in ('',) + ETAG_SUFFIXES)
+    if request.if_modified_since and last_modified:
+        return last_modified.replace(microsecond=0) <= \
+            request.if_modified_since.replace(tzinfo=None)
+    return False
+
+
+def _with_headers(response, headers):
+    if isinstance(response, Response):
+        if response.status_code == 200:
+            response.headers.extend(headers)
+        return response
+    if not isinstance(response, tuple):
+        return response, 200, headers
+    data, code = response[0], response[1]
+    if code != 200:
+        return response
+    extra = response[2] if len(response) > 2 else {}
+    return data, code, dict(extra, **headers)
+
+
+def conditional(version, dated=False):
+    """ Makes a GET method answer conditional requests.
+        version is called with the method's url arguments and returns the
+        parts of the resource's version, ending with datetimes that give its
+        Last-Modified, or None if there is nothing to version.
+        Goes under @jwt_required, the ETag is scoped to the user and the url.
+
+        :param function version: Returns the version parts of the resource
+        :param bool dated: Sends Last-Modified and answers If-Modified-Since,
+        only for a single row
+        :return: The decorated method
+    """
+    def decorator(method):
+        @wraps(method)
+        def wrapper(resource, *args, **kwargs):
+            parts = version(*args, **kwargs)
+            if parts is None:
+                return method(resource, *args, **kwargs)
+            etag = make_etag(get_jwt_identity(), request.full_path, *parts)
+            modified = [part for part in parts if hasattr(part, 'isoformat')]
+            last_modified = max(modified) if dated and modified else None
+            headers = {'ETag': f'"{etag}"', 'Cache-Control': CACHE_CONTROL,
+                       'Vary': VARY}
+            if last_modified:
+                # date_modified is stored in UTC
+                headers['Last-Modified'] = last_modified.strftime(
+                    '%a, %d %b %Y %H:%M:%S GMT')
+            if not_modified(etag, last_modified):
+                return Response(status=304, headers=headers)
+            return _with_headers(method(resource, *args, **kwargs), headers)
+        return wrapper
+    return decorator
@@ -0,0 +1,127 @@
+''' This script handles streaming exports of a user's categories and recipes.
+
+    Rows are read from a server-side cursor a batch at a time and written to
+    the response as they arrive, as NDJSON or CSV, so a worker's memory does
+    not grow with the size of the account.
+'''
+
+import csv
+import io
+import json
+from flask import Response, stream_with_context
+from sqlalchemy import select
+
+from .db import db
+from .dump_helper import dump_category_fields, dump_recipe
+from .models.category import Category
+from .models.recipe import Recipe
+
+EXPORT_BATCH_SIZE = 1000
+EXPORT_FORMATS = {'ndjson': 'application/x-ndjson', 'csv': 'text/csv'}
+
+
+def stream_rows(statement, batch_size=EXPORT_BATCH_SIZE):
+    """ Runs a select on a server-side cursor and yields its rows, fetching
+        batch_size rows at a time
+
+        :param object statement: A select
+        :return: Result rows, readable by the compiled serializers
+    """
+    connection = db.session.connection().execution_options(
+        stream_results=True)
+    result = connection.execute(statement)
+    try:
+        while True:
+            rows = result.fetchmany(batch_size)
+            if not rows:
+                return
+            yield from rows
+    finally:
+        result.close()
+
+
+def user_recipes(user_id):
+    ''' Streams a user's recipes, dumped like the recipe endpoints do '''
+    recipes = Recipe.__table__
+    statement = select([recipes]).where(
+        recipes.c.created_by == user_id).order_by(recipes.c.recipe_id)
+    for row in stream_rows(statement):
+        yield dump_recipe(row)
+
+
+def user_categories(user_id):
+    """ Streams a user's categories with their recipes nested, in the shape
+        the import endpoint accepts.
+        Categories and recipes come from two cursors, both in category_id
+        order, merged as they are read.
+    """
+    categories = Category.__table__
+    recipes = Recipe.__table__
+    category_rows = stream_rows(select([categories]).where(
+        categories.c.created_by == user_id).order_by(categories.c.category_id))
+    recipe_rows = stream_rows(select([recipes]).where(
+        (recipes.c.created_by == user_id) &
+        (recipes.c.category_id.isnot(None))).order_by(
+            recipes.c.category_id, recipes.c.recipe_id))
+    a_recipe = next(recipe_rows, None)
+    for a_category in category_rows:
+        nested = []
+        while (a_recipe is not None and
+               a_recipe.category_id <= a_category.category_id):
+            if a_recipe.category_id == a_category.category_id:
+                nested.append(dump_recipe(a_recipe))
+            a_recipe = next(recipe_rows, None)
+        document = dump_category_fields(a_category)
+        document['recipes'] = nested
+        yield document
+
+
+def _ndjson_chunks(documents, batch_size):
+    lines = []
+    for document in documents:
+        lines.append(json.dumps(document))
+        if len(lines) >= batch_size:
+            yield '\n'.join(lines) + '\n'
+            lines = []
+    if lines:
+        yield '\n'.join(lines) + '\n'
+
+
+def _csv_chunks(documents, batch_size):
+    buffer = io.StringIO()
+    writer = None
+    count = 0
+    for document in documents:
+        document = {key: value for key, value in document.items()
+                    if not isinstance(value, list)}
+        if writer is None:
+            writer = csv.DictWriter(buffer, fieldnames=sorted(document))
+            writer.writeheader()
+        writer.writerow(document)
+        count += 1
+        if count % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    if buffer.getvalue():
+        yield buffer.getvalue()
+
+
+def export_response(documents, export_format, name):
+    """ Builds a streamed response writing documents out as they are read.
+        CSV leaves out nested lists, e.g. a category's recipes.
+
+        :param object documents: An iterator of dicts
+        :param str export_format: ndjson or csv
+        :param str name: The file name offered to the client
+        :return: A Response object
+    """
+    if export_format == 'csv':
+        chunks = _csv_chunks(documents, EXPORT_BATCH_SIZE)
+    else:
+        chunks = _ndjson_chunks(documents, EXPORT_BATCH_SIZE)
+    response = Response(stream_with_context(chunks),
+                        mimetype=EXPORT_FORMATS[export_format])
+    response.headers['Content-Disposition'] = (
+        f'attachment; filename={name}.{export_format}')
+    return response
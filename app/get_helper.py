@@ -1,27 +1,33 @@
 # get_helper.py
 ''' This script handles pagination of recipe get request data '''
 
+import base64
+import binascii
+import json
+
 from flask import jsonify
 
-from .serializers import RecipeSchema
+from .dump_helper import dump_recipe
+from .models.recipe import Recipe
 THE_PAGE = 1
 PER_PAGE_MIN = 5
 PER_PAGE_MAX = 10
 
 
-def manage_get_recipes(the_recipes, args):
-    """ Function to handle search and pagination
-        It receives a BaseQuery object of recipes, checks if the search
-        parameter was passed a value and searches for that value.
+def manage_get_recipes(the_recipes, args, if_empty=None):
+    """ Function to handle pagination
+        It receives a BaseQuery object of recipes, which is already filtered
+        and ranked if the search parameter was passed a value.
         If the pagination parameters were passed values, checks if they are
         within the min/max range per page and paginates accordingly.
+        If a cursor was passed, pages by recipe id instead of page number.
 
         :param object the_recipes: -- [description]
         :param list args: -- [description]
+        :param object if_empty: The response when the query has no rows at
+        all, instead of the empty page message
         :return:
     """
-
-    q = args.get('q', '')
     page = args.get('page', THE_PAGE)
     per_page = args.get('per_page', PER_PAGE_MAX)
     if per_page is None or per_page < PER_PAGE_MIN:
@@ -29,13 +35,20 @@ def manage_get_recipes(the_recipes, args):
     if per_page > PER_PAGE_MAX:
         per_page = PER_PAGE_MAX
 
-    for a_recipe in the_recipes.all():
-        if q:
-            q = q.lower()
-            if q in a_recipe.recipe_name:
-                recipeschema = RecipeSchema()
-                the_recipe = recipeschema.dump(a_recipe)
-                return jsonify(the_recipe.data)
+    cursor = args.get('cursor')
+    if cursor is not None and not args.get('q'):
+        try:
+            page_recipes, next_cursor = keyset_paginate(
+                the_recipes, Recipe.recipe_id, cursor, per_page)
+        except ValueError:
+            return {'message': 'The cursor is not valid'}, 400
+        if not page_recipes:
+            if if_empty is not None and not cursor:
+                return if_empty
+            return {'message': 'There are no more recipes'}
+        return {"recipes": [dump_recipe(a_recipe) for a_recipe in page_recipes],
+                "message": "These are the recipes",
+                "nextCursor": next_cursor}
 
     pag_recipes = the_recipes.paginate(
         page, per_page, error_out=False)
@@ -44,14 +57,12 @@ def manage_get_recipes(the_recipes, args):
     page = pag_recipes.page
     categoryId = 0
     if not pag_recipes.items:
+        if if_empty is not None and not pag_recipes.total:
+            return if_empty
         return {'message': f'There are no recipes on page {page}'}
-    paginated = []
-    for a_recipe in pag_recipes.items:
-        paginated.append(a_recipe)
-    recipesschema = RecipeSchema(many=True)
-    all_recipes = recipesschema.dump(paginated)
+    all_recipes = [dump_recipe(a_recipe) for a_recipe in pag_recipes.items]
 
-    response = {"recipes": all_recipes.data,
+    response = {"recipes": all_recipes,
                 "message": "These are the recipes",
                 "recipePages": pages,
                 "recipePage": page,
@@ -61,7 +72,58 @@ def manage_get_recipes(the_recipes, args):
     return response
 
 
+def encode_cursor(last_id):
+    """ Encodes the id of the last row on a page as an opaque cursor
+
+        :param int last_id: The id the next page starts after
+        :return: A url safe string
+    """
+    payload = json.dumps({'id': last_id}).encode('utf-8')
+    return base64.urlsafe_b64encode(payload).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """ Decodes a cursor made by encode_cursor, an empty cursor is the first
+        page
+
+        :param str cursor: The cursor passed by the client
+        :return: The id the page starts after or None for the first page
+        :raises ValueError: If the cursor was not made by encode_cursor
+    """
+    if not cursor:
+        return None
+    try:
+        payload = json.loads(
+            base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8'))
+        last_id = payload['id']
+    except (binascii.Error, UnicodeError, TypeError, KeyError) as error:
+        raise ValueError(f'Invalid cursor {cursor}') from error
+    if not isinstance(last_id, int):
+        raise ValueError(f'Invalid cursor {cursor}')
+    return last_id
+
+
+def keyset_paginate(query, key, cursor, per_page):
+    """ Fetches the page of a query after the cursor, newest first.
+        The page is a range scan on the key so every page costs the same
+        and no count is run.
+
+        :param object query: A BaseQuery object
+        :param object key: The id column to page on
+        :param str cursor: The cursor returned with the previous page
+        :param int per_page: The number of rows per page
+        :return: The rows on the page and the cursor of the next page
+    """
+    last_id = decode_cursor(cursor)
+    if last_id is not None:
+        query = query.filter(key < last_id)
+    rows = query.order_by(None).order_by(key.desc()).limit(per_page + 1).all()
+    next_cursor = None
+    if len(rows) > per_page:
+        rows = rows[:per_page]
+        next_cursor = encode_cursor(getattr(rows[-1], key.key))
+    return rows, next_cursor
+
+
 def manage_get_recipe(the_recipe):
-    recipeschema = RecipeSchema()
-    get_response = recipeschema.dump(the_recipe)
-    return jsonify(get_response.data)
+    return jsonify(dump_recipe(the_recipe))
@@ -0,0 +1,102 @@
+''' This script lets a worker serve requests from gevent's event loop.
+
+    Under gunicorn's gevent worker every request runs in a greenlet on one
+    event loop. psycopg2 is switched to its asynchronous protocol with a wait
+    callback that hands the loop to other requests while a query is in
+    flight. A request holds one of the worker's pooled connections until it
+    ends, so GREEN_POOL_SIZE + GREEN_MAX_OVERFLOW requests run queries at
+    once, in place of one in a sync worker, and the others wait up to
+    SQLALCHEMY_POOL_TIMEOUT for a connection. The resources, JWT checks,
+    queries and serializers are the ones every other worker runs, so the
+    responses are identical.
+
+    With READ_ONLY set the worker only takes GET, HEAD and OPTIONS requests,
+    for a read path the proxy sends the reads to:
+
+        READ_ONLY=1 gunicorn -k gevent --worker-connections 2000 \
+            --keep-alive 30 wsgi:app
+
+    A worker only reads a new connection's request once the loop gets to
+    it, and gunicorn's keep-alive timeout (2 seconds by default) covers that
+    read, so it is raised to not reset connections waiting behind a burst.
+    gunicorn patches the standard library when a gevent worker starts, so
+    the app must not be preloaded in the master with --preload.
+'''
+
+import json
+import sys
+
+from werkzeug.wrappers import Response
+
+try:
+    import psycopg2
+    from psycopg2 import extensions
+except ImportError:     # only the Postgres engine needs it
+    psycopg2 = None
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+
+def is_evented():
+    ''' Tells if gevent has patched this process, i.e. the app is served by
+        a gevent worker
+    '''
+    # a gevent worker has imported gevent before loading the app, no other
+    # worker needs to import it
+    monkey = sys.modules.get('gevent.monkey')
+    return monkey is not None and monkey.is_module_patched('socket')
+
+
+def wait_callback(connection, timeout=None):
+    """ Waits for a busy psycopg2 connection on the event loop. psycopg2
+        calls it instead of blocking until a query's result has arrived
+
+        :param object connection: The psycopg2 connection
+        :param float timeout: Seconds to wait at most, None for no limit
+    """
+    from gevent.socket import wait_read, wait_write
+
+    while True:
+        state = connection.poll()
+        if state == extensions.POLL_OK:
+            return
+        if state == extensions.POLL_READ:
+            wait_read(connection.fileno(), timeout=timeout)
+        elif state == extensions.POLL_WRITE:
+            wait_write(connection.fileno(), timeout=timeout)
+        else:
+            raise psycopg2.OperationalError(
+                f'Bad result from connection.poll(): {state}')
+
+
+class ReadOnly(object):
+    ''' WSGI middleware answering any request that may write with a 405 '''
+
+    def __init__(self, wsgi_app):
+        self.wsgi_app = wsgi_app
+
+    def __call__(self, environ, start_response):
+        if environ['REQUEST_METHOD'] in READ_METHODS:
+            return self.wsgi_app(environ, start_response)
+        response = Response(
+            json.dumps({'message': 'This server only serves reads'}) + '\n',
+            405, mimetype='application/json',
+            headers={'Allow': ', '.join(READ_METHODS)})
+        return response(environ, start_response)
+
+
+def init_green(app):
+    ''' Makes psycopg2 wait on the event loop and sizes the pool for the
+        requests in flight when the app is served by a gevent worker, and
+        takes only reads with READ_ONLY set
+    '''
+    if is_evented():
+        # the engines are created on first use, after this
+        app.config['SQLALCHEMY_POOL_SIZE'] = app.config['GREEN_POOL_SIZE']
+        app.config['SQLALCHEMY_MAX_OVERFLOW'] = \
+            app.config['GREEN_MAX_OVERFLOW']
+        if psycopg2 is not None:
+            # process wide, every connection of the worker waits on the loop
+            extensions.set_wait_callback(wait_callback)
+    if app.config.get('READ_ONLY'):
+        app.wsgi_app = ReadOnly(app.wsgi_app)
@@ -0,0 +1,323 @@
+''' This script handles bulk imports of categories and their recipes.
+
+    The request body is read incrementally, as NDJSON (one category per line)
+    or as a JSON array of categories, and written with multi-row INSERTs,
+    committing every batch.
+'''
+
+import codecs
+import json
+from functools import lru_cache
+
+from sqlalchemy import bindparam
+
+from .db import db
+from .ingredient_index import index_recipes
+from .models.category import Category
+from .models.recipe import Recipe
+from .sharding import assign_ids
+from .validation_helper import name_validator
+
+NDJSON_TYPES = ('application/x-ndjson', 'application/ndjson')
+READ_SIZE = 64 * 1024
+IMPORT_BATCH_SIZE = 500
+# an item of a JSON array spanning more characters is not valid, a
+# malformed one would otherwise be buffered to the end of the body
+MAX_ITEM_SIZE = 1024 * 1024
+# a parse error this close to the end of the buffer may be a literal or an
+# escape the chunk cut, e.g. tru or \u00
+CUT_OFF_MARGIN = 6
+WHITESPACE = ' \t\r\n'
+MALFORMED = 'The body is not a well formed JSON array'
+# the states of iter_json_array
+START, FIRST_ITEM, ITEM, SEPARATOR, END = range(5)
+
+
+class ImportParseError(ValueError):
+    ''' Raised when the body cannot be parsed any further '''
+
+
+def iter_ndjson(stream):
+    """ Yields the parsed lines of an NDJSON body, skipping blank lines.
+        A line that is not valid JSON is yielded as an ImportParseError so the
+        rest of the body can still be imported.
+
+        :param object stream: The request stream
+        :return: Pairs of line number and document
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    pending = ''
+    number = 0
+    while True:
+        chunk = stream.read(READ_SIZE)
+        pending += decoder.decode(chunk, final=not chunk)
+        lines = pending.split('\n')
+        pending = lines.pop() if chunk else ''
+        for line in lines:
+            number += 1
+            if not line.strip():
+                continue
+            try:
+                yield number, json.loads(line)
+            except ValueError:
+                yield number, ImportParseError('The line is not valid JSON')
+        if not chunk:
+            return
+
+
+def iter_json_array(stream, max_item_size=MAX_ITEM_SIZE):
+    """ Yields the items of a JSON array body one at a time, without reading
+        the whole body first.
+
+        :param object stream: The request stream
+        :param int max_item_size: The most characters an item may span
+        :return: Pairs of item number and document
+        :raises ImportParseError: If the body is not a well formed JSON array
+    """
+    decoder = codecs.getincrementaldecoder('utf-8')()
+    parser = json.JSONDecoder()
+    buffer = ''
+    position = 0
+    number = 0
+    # what the body may go on with: the '[', an item or the ']' closing an
+    # empty array, an item, a ',' or the ']', nothing but whitespace
+    expecting = START
+    while True:
+        chunk = stream.read(READ_SIZE)
+        buffer = buffer[position:] + decoder.decode(chunk, final=not chunk)
+        position = 0
+        while True:
+            while position < len(buffer) and buffer[position] in WHITESPACE:
+                position += 1
+            if position == len(buffer):
+                break
+            character = buffer[position]
+            if expecting == START:
+                if character != '[':
+                    raise ImportParseError('The body must be a JSON array')
+                expecting = FIRST_ITEM
+                position += 1
+            elif expecting == SEPARATOR or (
+                    expecting == FIRST_ITEM and character == ']'):
+                if character not in ',]':
+                    raise ImportParseError(MALFORMED)
+                expecting = ITEM if character == ',' else END
+                position += 1
+            elif expecting == END or character in ',]':
+                raise ImportParseError(MALFORMED)
+            else:
+                try:
+                    document, end = parser.raw_decode(buffer, position)
+                except ValueError as error:
+                    if not chunk or not _cut_off(error, len(buffer)) or \
+                            len(buffer) - position > max_item_size:
+                        raise ImportParseError(
+                            f'Item {number + 1} is not valid JSON')
+                    break       # the item continues in the next chunk
+                if end == len(buffer) and chunk:
+                    break       # a number may continue in the next chunk
+                position = end
+                expecting = SEPARATOR
+                number += 1
+                yield number, document
+        if not chunk:
+            if expecting != END:
+                raise ImportParseError('The JSON array is not closed')
+            return
+
+
+def _cut_off(error, length):
+    """ Tells if a parse error may only be the end of the buffer cutting an
+        item, e.g. in a string or a literal, rather than a malformed item
+
+        :param object error: The JSONDecodeError
+        :param int length: The length of the buffer parsed
+    """
+    return error.msg.startswith('Unterminated string') or \
+        error.pos >= length - CUT_OFF_MARGIN
+
+
+def _category_error(document):
+    ''' Returns why a category document cannot be imported, if it can't '''
+    if not isinstance(document, dict):
+        return 'Each item must be a category object'
+    category_name = document.get('category_name')
+    if not isinstance(category_name, str) or not name_validator(category_name):
+        return (f'{category_name} is not a valid name. Category names can '
+                'only comprise of alphabetical characters & can be more than '
+                'one word')
+    if not isinstance(document.get('description', ''), str):
+        return 'The description must be a string'
+    if not isinstance(document.get('recipes', []), list):
+        return 'The recipes must be a list'
+    return None
+
+
+def _recipe_error(document):
+    ''' Returns why a recipe document cannot be imported, if it can't '''
+    if not isinstance(document, dict):
+        return 'Each recipe must be an object'
+    recipe_name = document.get('recipe_name')
+    if not isinstance(recipe_name, str) or not name_validator(recipe_name):
+        return (f'{recipe_name} is not a valid name. Recipe names can only '
+                'comprise of alphabetical characters and can be more than '
+                'one word')
+    if not isinstance(document.get('ingredients', ''), str):
+        return 'The ingredients must be a string'
+    return None
+
+
+class CategoryImport(object):
+    ''' Imports category documents for a user in batches.
+
+        :param int user_id: The user the categories are imported for
+        :param int batch_size: Rows per INSERT and per transaction
+    '''
+
+    def __init__(self, user_id, batch_size=IMPORT_BATCH_SIZE):
+        self.user_id = user_id
+        self.batch_size = batch_size
+        self.categories_created = 0
+        self.recipes_created = 0
+        self.errors = []
+        self._categories = []
+        self._recipe_count = 0
+
+    def add(self, number, document):
+        """ Validates a category document and queues it for the next batch
+
+            :param int number: The line or item number, for the report
+            :param dict document: The category with its nested recipes
+        """
+        if isinstance(document, Exception):
+            self.errors.append({'item': number, 'message': str(document)})
+            return
+        error = _category_error(document)
+        if error:
+            self.errors.append({'item': number, 'message': error})
+            return
+        recipes = []
+        for index, a_recipe in enumerate(document.get('recipes', []), 1):
+            error = _recipe_error(a_recipe)
+            if error:
+                self.errors.append(
+                    {'item': number, 'recipe': index, 'message': error})
+            else:
+                recipes.append((index, a_recipe))
+        self._categories.append((number, document, recipes))
+        self._recipe_count += len(recipes)
+        if (len(self._categories) >= self.batch_size or
+                self._recipe_count >= self.batch_size):
+            self.flush()
+
+    def flush(self):
+        ''' Writes the queued categories and recipes and commits them '''
+        if not self._categories:
+            return
+        category_ids = self._insert_categories()
+        new_recipes = []
+        for number, document, recipes in self._categories:
+            category_id = category_ids[document['category_name']]
+            for index, a_recipe in recipes:
+                new_recipes.append((number, index, category_id, a_recipe))
+        self._insert_recipes(new_recipes)
+        db.session.commit()
+        self._categories = []
+        self._recipe_count = 0
+
+    def report(self):
+        ''' Returns the counts of rows created and the rows rejected '''
+        return {'categories_created': self.categories_created,
+                'recipes_created': self.recipes_created,
+                'errors': self.errors}
+
+    def _insert_categories(self):
+        names = {document['category_name']
+                 for _, document, _ in self._categories}
+        existing = self._category_ids(names)
+        rows = {}
+        for _, document, _ in self._categories:
+            name = document['category_name']
+            if name not in existing and name not in rows:
+                rows[name] = {'category_name': name,
+                              'description': document.get('description', ''),
+                              'created_by': self.user_id}
+        if rows:
+            self._insert(Category.__table__, list(rows.values()))
+            self.categories_created += len(rows)
+            existing.update(self._category_ids(rows))
+        return existing
+
+    def _category_ids(self, names):
+        return dict(db.session.query(
+            Category.category_name, Category.category_id).filter(
+                Category.created_by == self.user_id,
+                Category.category_name.in_(names)).all())
+
+    def _insert_recipes(self, new_recipes):
+        for start in range(0, len(new_recipes), self.batch_size):
+            batch = new_recipes[start:start + self.batch_size]
+            category_ids = {category_id for _, _, category_id, _ in batch}
+            names = {a_recipe['recipe_name'] for _, _, _, a_recipe in batch}
+            existing = set(db.session.query(
+                Recipe.category_id, Recipe.recipe_name).filter(
+                    Recipe.created_by == self.user_id,
+                    Recipe.category_id.in_(category_ids),
+                    Recipe.recipe_name.in_(names)).all())
+            rows = []
+            for number, index, category_id, a_recipe in batch:
+                key = (category_id, a_recipe['recipe_name'])
+                if key in existing:
+                    self.errors.append({'item': number, 'recipe': index,
+                                        'message': 'Recipe already exists'})
+                    continue
+                existing.add(key)
+                rows.append({'recipe_name': a_recipe['recipe_name'],
+                             'ingredients': a_recipe.get('ingredients', ''),
+                             'category_id': category_id,
+                             'created_by': self.user_id})
+            if rows:
+                self._insert(Recipe.__table__, rows)
+                self.recipes_created += len(rows)
+                self._index_recipes(rows)
+
+    def _index_recipes(self, rows):
+        # the multi-row INSERT skips the session events that index recipes
+        ids = dict(((category_id, recipe_name), recipe_id)
+                   for recipe_id, category_id, recipe_name in db.session.query(
+                       Recipe.recipe_id, Recipe.category_id,
+                       Recipe.recipe_name).filter(
+                           Recipe.created_by == self.user_id,
+                           Recipe.category_id.in_(
+                               {row['category_id'] for row in rows}),
+                           Recipe.recipe_name.in_(
+                               {row['recipe_name'] for row in rows})))
+        index_recipes(db.session.connection(), [
+            (ids[row['category_id'], row['recipe_name']], self.user_id,
+             row['ingredients']) for row in rows], replace=False)
+
+    @staticmethod
+    def _insert(table, rows):
+        assign_ids(table, rows)
+        connection = db.session.connection()
+        columns = tuple(rows[0])
+        compiled = _compiled_insert(table, columns, len(rows),
+                                    connection.dialect)
+        params = {f'{column}_{number}': row[column]
+                  for number, row in enumerate(rows) for column in columns}
+        if compiled.positional:
+            params = [params[name] for name in compiled.positiontup]
+        connection.execute(compiled.string, params)
+
+
+@lru_cache(maxsize=64)
+def _compiled_insert(table, columns, count, dialect):
+    """ Compiles a multi-row INSERT once per table, columns and row count.
+        Compiling a large VALUES clause costs more than running it.
+
+        :return: The compiled statement, its parameters named column_row
+    """
+    statement = table.insert().values([
+        {column: bindparam(f'{column}_{number}') for column in columns}
+        for number in range(count)])
+    return statement.compile(dialect=dialect)
@@ -0,0 +1,168 @@
+''' This script keeps the inverted index from ingredients to recipes.
+
+    A recipe's free-text ingredients are parsed into normalized names, e.g.
+    "2 cloves garlic, 3 tomatoes" into garlic and tomato, each linked to the
+    recipe in recipe_ingredients. Session events relink a recipe whenever it
+    is created or its ingredients are edited, so every ORM write keeps the
+    index current, and the links of deleted recipes are deleted with them by
+    their foreign key's ON DELETE CASCADE. Writes that skip the ORM call
+    index_recipes themselves.
+
+    Queries are answered from the index alone: the recipe ids of each wanted
+    ingredient are read from (created_by, ingredient_id, recipe_id) and
+    counted per recipe, which intersects them.
+'''
+
+import re
+
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+
+from .db import db
+from .models.ingredient import Ingredient, RecipeIngredient
+from .models.recipe import Recipe
+
+MATCHES = ('any', 'all', 'only')
+NAME_LENGTH = 100
+SEPARATORS = re.compile(r'[,;\n]|\band\b|&|\+')
+WORD = re.compile(r'[^\W\d_]+')
+# quantities, units and preparation words left out of ingredient names
+IGNORED = {
+    'a', 'an', 'of', 'the', 'some', 'few', 'to', 'taste', 'for', 'or',
+    'g', 'gram', 'grams', 'kg', 'mg', 'ml', 'l', 'litre', 'litres', 'liter',
+    'liters', 'oz', 'ounce', 'ounces', 'lb', 'lbs', 'pound', 'pounds',
+    'cup', 'cups', 'tbsp', 'tablespoon', 'tablespoons', 'tsp', 'teaspoon',
+    'teaspoons', 'pinch', 'dash', 'handful', 'clove', 'cloves', 'can',
+    'cans', 'slice', 'slices', 'piece', 'pieces', 'bunch', 'large',
+    'medium', 'small', 'fresh', 'chopped', 'diced', 'sliced', 'minced',
+    'grated', 'ground', 'whole',
+}
+
+INGREDIENTS = Ingredient.__table__
+LINKS = RecipeIngredient.__table__
+
+
+def _singular(word):
+    if word.endswith('ies') and len(word) > 4:
+        return word[:-3] + 'y'
+    if word.endswith('oes') and len(word) > 4:
+        return word[:-2]
+    if word.endswith('s') and not word.endswith(('ss', 'us', 'is')) and \
+            len(word) > 3:
+        return word[:-1]
+    return word
+
+
+def parse_ingredients(text):
+    """ Splits free-text ingredients into normalized ingredient names
+
+        :param str text: e.g. "2 cloves garlic, 3 tomatoes and salt"
+        :return: A set of names, e.g. {'garlic', 'tomato', 'salt'}
+    """
+    names = set()
+    for part in SEPARATORS.split((text or '').lower()):
+        words = [word for word in WORD.findall(part) if word not in IGNORED]
+        if words:
+            words[-1] = _singular(words[-1])
+            names.add(' '.join(words)[:NAME_LENGTH])
+    return names
+
+
+def _insert_ignoring_duplicates(dialect):
+    # another request may add the same ingredient at the same time
+    if dialect.name == 'postgresql':
+        from sqlalchemy.dialects import postgresql
+
+        return postgresql.insert(INGREDIENTS).on_conflict_do_nothing(
+            index_elements=['name'])
+    if dialect.name == 'sqlite':
+        return INGREDIENTS.insert().prefix_with('OR IGNORE')
+    return INGREDIENTS.insert()
+
+
+def _ingredient_ids(connection, names):
+    query = select([INGREDIENTS.c.name, INGREDIENTS.c.ingredient_id])
+    ids = dict(connection.execute(
+        query.where(INGREDIENTS.c.name.in_(names))).fetchall())
+    missing = names - set(ids)
+    if missing:
+        connection.execute(_insert_ignoring_duplicates(connection.dialect),
+                           [{'name': name} for name in sorted(missing)])
+        ids.update(connection.execute(
+            query.where(INGREDIENTS.c.name.in_(missing))).fetchall())
+    return ids
+
+
+def index_recipes(connection, recipes, replace=True):
+    """ Links recipes to the ingredients parsed from their text
+
+        :param object connection: The connection of the current transaction
+        :param list recipes: (recipe_id, created_by, ingredients) tuples
+        :param bool replace: Removes the recipes' current links first, False
+        for recipes that were just inserted
+    """
+    if not recipes:
+        return
+    if replace:
+        unindex_recipes(connection, [recipe_id for recipe_id, _, _ in recipes])
+    parsed = [(recipe_id, created_by, parse_ingredients(ingredients))
+              for recipe_id, created_by, ingredients in recipes]
+    names = set().union(*(names for _, _, names in parsed))
+    if not names:
+        return
+    ids = _ingredient_ids(connection, names)
+    connection.execute(LINKS.insert(), [
+        {'recipe_id': recipe_id, 'ingredient_id': ids[name],
+         'created_by': created_by}
+        for recipe_id, created_by, names in parsed for name in names])
+
+
+def unindex_recipes(connection, recipe_ids):
+    ''' Removes the links of recipes, before they are relinked '''
+    if recipe_ids:
+        connection.execute(LINKS.delete().where(
+            LINKS.c.recipe_id.in_(recipe_ids)))
+
+
+@event.listens_for(Session, 'after_flush')
+def _index_flushed(session, flush_context):
+    # the new and dirty sets and the attribute history still hold what the
+    # flush wrote
+    new = [instance for instance in session.new
+           if isinstance(instance, Recipe)]
+    edited = [instance for instance in session.dirty
+              if isinstance(instance, Recipe) and
+              db.inspect(instance).attrs.ingredients.history.has_changes()]
+    connection = session.connection()
+    index_recipes(connection, [(a_recipe.recipe_id, a_recipe.created_by,
+                                a_recipe.ingredients) for a_recipe in new],
+                  replace=False)
+    index_recipes(connection, [(a_recipe.recipe_id, a_recipe.created_by,
+                                a_recipe.ingredients) for a_recipe in edited])
+
+
+def recipes_with_ingredients(user_id, names, match='any'):
+    """ Builds a query of a user's recipes by the ingredients they use
+
+        :param int user_id: The user whose recipes are searched
+        :param set names: Normalized ingredient names, from parse_ingredients
+        :param str match: 'any' for recipes using any of the ingredients,
+        'all' for the ones using all of them and 'only' for the ones using
+        nothing else
+        :return: A BaseQuery of recipes, newest first
+    """
+    links = LINKS.join(INGREDIENTS,
+                       INGREDIENTS.c.ingredient_id == LINKS.c.ingredient_id)
+    recipe_ids = select([LINKS.c.recipe_id]).select_from(links).where(
+        db.and_(LINKS.c.created_by == user_id,
+                INGREDIENTS.c.name.in_(names))).group_by(LINKS.c.recipe_id)
+    if match == 'all':
+        recipe_ids = recipe_ids.having(func.count() == len(names))
+    elif match == 'only':
+        every_link = LINKS.alias('every_link')
+        recipe_ids = recipe_ids.having(func.count() == select(
+            [func.count()]).where(
+                every_link.c.recipe_id == LINKS.c.recipe_id).as_scalar())
+    return Recipe.query.filter(Recipe.created_by == user_id,
+                               Recipe.recipe_id.in_(recipe_ids)).order_by(
+                                   Recipe.recipe_id.desc())
@@ -0,0 +1,344 @@
+''' This script records the app's metrics and serves them on /metrics, in
+    the Prometheus text format.
+
+    Every request is timed and counted by endpoint (the restplus resource),
+    method and status, with the number of SQL statements it ran and their
+    time. SQL statement latency is also kept by database bind: the primary,
+    each shard and each read replica. bcrypt, the response cache and the
+    connection pool keep their own counters, which are read when /metrics is
+    scraped. Each process has its own metrics, so every worker is scraped on
+    its own.
+'''
+
+import time
+from bisect import bisect_left
+from functools import partial
+from threading import Lock, local
+
+from flask import Response, _request_ctx_stack, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+from .db import db
+from .db_pool import pool_stats
+
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0)
+QUERY_BUCKETS = (0, 1, 2, 3, 5, 10, 25, 50, 100)
+STATEMENT_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                     0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+
+class _Current(local):
+    ''' The state of the request being handled by this thread '''
+    request = None
+    metrics = None
+
+
+_current = _Current()
+
+
+class Histogram(object):
+    ''' Counts observations in buckets with upper bounds buckets '''
+
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value):
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self, name, labels):
+        ''' Returns the histogram's lines, its buckets cumulative '''
+        lines = []
+        total = 0
+        for bound, count in zip(self.buckets + ('+Inf',), self.counts):
+            total += count
+            lines.append(
+                f'{name}_bucket{_labels(labels + (("le", bound),))} {total}')
+        lines.append(f'{name}_sum{_labels(labels)} {self.sum}')
+        lines.append(f'{name}_count{_labels(labels)} {total}')
+        return lines
+
+
+class Route(object):
+    ''' The metrics of one endpoint and method '''
+
+    def __init__(self):
+        self.latency = Histogram(LATENCY_BUCKETS)
+        self.queries = Histogram(QUERY_BUCKETS)
+        self.statuses = {}
+        self.sql_seconds = 0.0
+
+
+class Metrics(object):
+    ''' The per-process registry of request metrics.
+        Collectors are called on every scrape to add metrics kept elsewhere.
+    '''
+
+    def __init__(self):
+        self._lock = Lock()
+        self._routes = {}
+        self._binds = {}
+        self.collectors = []
+
+    def observe_request(self, endpoint, method, status, seconds, queries,
+                        sql_seconds):
+        """ Records a finished request
+
+            :param str endpoint: The endpoint that handled it
+            :param str method: The HTTP method
+            :param int status: The response's status code
+            :param float seconds: Time spent handling it
+            :param int queries: SQL statements it ran
+            :param float sql_seconds: Time those statements took
+        """
+        with self._lock:
+            route = self._routes.get((endpoint, method))
+            if route is None:
+                route = self._routes[endpoint, method] = Route()
+            route.latency.observe(seconds)
+            route.queries.observe(queries)
+            route.statuses[status] = route.statuses.get(status, 0) + 1
+            route.sql_seconds += sql_seconds
+
+    def observe_statement(self, bind, seconds):
+        """ Records a SQL statement run in a request
+
+            :param str bind: The bind it ran on, 'primary' or a replica's
+            :param float seconds: Time it took
+        """
+        with self._lock:
+            histogram = self._binds.get(bind)
+            if histogram is None:
+                histogram = self._binds[bind] = Histogram(STATEMENT_BUCKETS)
+            histogram.observe(seconds)
+
+    def render(self):
+        ''' Returns every metric in the Prometheus text format '''
+        with self._lock:
+            routes = sorted(
+                (key, _copy(route.latency), _copy(route.queries),
+                 dict(route.statuses), route.sql_seconds)
+                for key, route in self._routes.items())
+            binds = sorted((bind, _copy(histogram))
+                           for bind, histogram in self._binds.items())
+
+        lines = _header('app_request_duration_seconds', 'histogram',
+                        'Time spent handling requests')
+        for (endpoint, method), latency, _, _, _ in routes:
+            lines += latency.samples(
+                'app_request_duration_seconds',
+                (('endpoint', endpoint), ('method', method)))
+        lines += _header('app_requests_total', 'counter',
+                         'Requests handled, by status code')
+        for (endpoint, method), _, _, statuses, _ in routes:
+            for status, count in sorted(statuses.items()):
+                lines.append('app_requests_total' + _labels((
+                    ('endpoint', endpoint), ('method', method),
+                    ('status', status))) + f' {count}')
+        lines += _header('app_request_sql_queries', 'histogram',
+                         'SQL statements run per request')
+        for (endpoint, method), _, queries, _, _ in routes:
+            lines += queries.samples(
+                'app_request_sql_queries',
+                (('endpoint', endpoint), ('method', method)))
+        lines += _header('app_request_sql_seconds_total', 'counter',
+                         'Time spent running SQL statements in requests')
+        for (endpoint, method), _, _, _, sql_seconds in routes:
+            lines.append('app_request_sql_seconds_total' + _labels((
+                ('endpoint', endpoint), ('method', method))) +
+                f' {sql_seconds}')
+        lines += _header('app_db_statement_duration_seconds', 'histogram',
+                         'Time SQL statements of requests took, by bind')
+        for bind, histogram in binds:
+            lines += histogram.samples('app_db_statement_duration_seconds',
+                                       (('bind', bind),))
+        for collector in self.collectors:
+            for name, kind, description, value in collector():
+                lines += _header(name, kind, description)
+                lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _copy(histogram):
+    copy = Histogram(histogram.buckets)
+    copy.counts = list(histogram.counts)
+    copy.sum = histogram.sum
+    return copy
+
+
+def _header(name, kind, description):
+    return [f'# HELP {name} {description}', f'# TYPE {name} {kind}']
+
+
+def _labels(pairs):
+    escaped = (str(value).replace('\\', r'\\').replace('"', r'\"').replace(
+        '\n', r'\n') for _, value in pairs)
+    return '{' + ','.join(f'{name}="{value}"' for (name, _), value
+                          in zip(pairs, escaped)) + '}'
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if _current.request is not None:
+        conn.info.setdefault('metrics_started', []).append(time.perf_counter())
+
+
+@event.listens_for(Engine, 'after_cursor_execute')
+def _after_cursor_execute(conn, cursor, statement, parameters, context,
+                          executemany):
+    state = _current.request
+    started = conn.info.get('metrics_started')
+    if state is not None and started:
+        seconds = time.perf_counter() - started.pop()
+        state[1] += 1
+        state[2] += seconds
+        # kept with the pooled connection, looked up on its first statement
+        bind = conn.info.get('metrics_bind')
+        if bind is None:
+            bind = conn.info['metrics_bind'] = db.bind_names.get(
+                conn.engine, 'primary')
+        _current.metrics.observe_statement(bind, seconds)
+
+
+@event.listens_for(Engine, 'handle_error')
+def _handle_error(context):
+    started = context.connection.info.get('metrics_started')
+    if started:
+        started.pop()
+
+
+def _start_request(metrics):
+    # started, statements run, seconds spent running them
+    _current.request = [time.perf_counter(), 0, 0.0]
+    _current.metrics = metrics
+
+
+def _finish_request(metrics, status):
+    state = _current.request
+    if state is None:
+        return
+    _current.request = None
+    # the request context is read directly, the request proxy costs more
+    # than the rest of the bookkeeping
+    the_request = _request_ctx_stack.top.request
+    rule = the_request.url_rule
+    metrics.observe_request(
+        rule.endpoint if rule is not None else 'none', the_request.method,
+        status, time.perf_counter() - state[0], state[1], state[2])
+
+
+def _after_request(metrics, response):
+    _finish_request(metrics, response.status_code)
+    return response
+
+
+def _teardown_request(metrics, exception):
+    # after_request is skipped when a view raised, record it as a 500
+    _finish_request(metrics, 500)
+
+
+def _bcrypt_metrics():
+    stats = current_app.extensions['password_pool'].stats()
+    return [
+        ('app_bcrypt_operations_total', 'counter',
+         'Password hashes and checks completed', stats['completed']),
+        ('app_bcrypt_rejected_total', 'counter',
+         'Password operations turned away by the full pool',
+         stats['rejected']),
+        ('app_bcrypt_seconds_total', 'counter',
+         'Time spent hashing and checking passwords', stats['run_seconds']),
+        ('app_bcrypt_wait_seconds_total', 'counter',
+         'Time password operations waited for a worker',
+         stats['wait_seconds']),
+        ('app_bcrypt_in_flight', 'gauge',
+         'Password operations running or waiting', stats['in_flight']),
+    ]
+
+
+def _response_cache_metrics():
+    cache = current_app.extensions.get('response_cache')
+    if cache is None:
+        return []
+    stats = cache.stats()
+    lookups = stats['hits'] + stats['misses']
+    return [
+        ('app_response_cache_hits_total', 'counter',
+         'GET responses served from the cache', stats['hits']),
+        ('app_response_cache_misses_total', 'counter',
+         'GET responses not found in the cache', stats['misses']),
+        ('app_response_cache_hit_ratio', 'gauge',
+         'Share of cache lookups that were hits',
+         stats['hits'] / lookups if lookups else 0.0),
+        ('app_response_cache_evictions_total', 'counter',
+         'Responses evicted from the cache', stats['evictions']),
+        ('app_response_cache_errors_total', 'counter',
+         'Failed calls to the cache backend', stats['errors']),
+    ]
+
+
+def _auth_cache_metrics():
+    samples = []
+    for name, description in (('token', 'Verified tokens'),
+                              ('user', 'Token users')):
+        cache = current_app.extensions.get(f'{name}_cache')
+        if cache is None:
+            continue
+        stats = cache.stats()
+        samples += [
+            (f'app_{name}_cache_hits_total', 'counter',
+             f'{description} read from the cache', stats['hits']),
+            (f'app_{name}_cache_misses_total', 'counter',
+             f'{description} not found in the cache', stats['misses']),
+            (f'app_{name}_cache_entries', 'gauge',
+             f'{description} in the cache', stats['entries']),
+        ]
+    return samples
+
+
+def _pool_metrics():
+    stats = pool_stats(db.engine)
+    if not stats:
+        return []
+    return [
+        ('app_db_pool_size', 'gauge', 'Connections the pool keeps open',
+         stats['size']),
+        ('app_db_pool_in_use', 'gauge', 'Connections checked out',
+         stats['in_use']),
+        ('app_db_pool_overflow', 'gauge', 'Connections opened past the size',
+         stats['overflow']),
+        ('app_db_pool_checkouts_total', 'counter', 'Connection checkouts',
+         stats['checkouts']),
+        ('app_db_pool_checkout_timeouts_total', 'counter',
+         'Checkouts that timed out waiting for a connection',
+         stats['timeouts']),
+        ('app_db_pool_checkout_wait_seconds_total', 'counter',
+         'Time spent waiting for a connection', stats['wait_seconds']),
+    ]
+
+
+def metrics_view():
+    ''' Serves the metrics of this process '''
+    return Response(current_app.extensions['metrics'].render(),
+                    content_type=CONTENT_TYPE)
+
+
+def init_metrics(app):
+    ''' Registers the request hooks and the /metrics endpoint on the app.
+        Call it before the other hooks are registered, so the timing covers
+        them.
+    '''
+    if not app.config.get('METRICS_ENABLED', True):
+        return
+    metrics = app.extensions['metrics'] = Metrics()
+    metrics.collectors += [_bcrypt_metrics, _response_cache_metrics,
+                           _auth_cache_metrics, _pool_metrics]
+    app.before_request(partial(_start_request, metrics))
+    app.after_request(partial(_after_request, metrics))
+    app.teardown_request(partial(_teardown_request, metrics))
+    app.add_url_rule('/metrics', 'metrics', metrics_view)
@@ -1,3 +1,5 @@
 from app.models.user import User              # noqa (so linter ignores the imports)
 from app.models.category import Category      # noqa
 from app.models.recipe import Recipe          # noqa
+from app.models.ingredient import Ingredient, RecipeIngredient  # noqa
+from app.models.id_block import IdBlock       # noqa
@@ -1,23 +1,39 @@
 ''' This script holds the category model '''
 
-from ..db import db
+from ..db import UtcNow, db
 
 
 class Category(db.Model):
     ''' Class representing the categories table '''
 
     __tablename__ = 'categories'
+    __table_args__ = (
+        # serves the per-user listing ordered by category_id desc
+        db.Index('ix_categories_created_by_category_id',
+                 'created_by', 'category_id'),
+        # serves the duplicate name checks and the import's name lookups
+        db.Index('ix_categories_created_by_category_name',
+                 'created_by', 'category_name'),
+    )
 
     category_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     category_name = db.Column(db.String(100), nullable=False)
     description = db.Column(db.String(256), nullable=False)
-    date_created = db.Column(db.DateTime, default=db.func.current_timestamp())
-    date_modified = db.Column(
-        db.DateTime, default=db.func.current_timestamp(),
-        onupdate=db.func.current_timestamp())
-    created_by = db.Column(db.Integer, db.ForeignKey('users.user_id'))
+    # in UTC, whatever the database server's time zone
+    date_created = db.Column(db.DateTime, default=UtcNow())
+    date_modified = db.Column(db.DateTime, default=UtcNow(),
+                              onupdate=UtcNow())
+    # bumped by every UPDATE, versions the row for conditional GETs where
+    # date_modified, to the second on SQLite, may miss an edit
+    version = db.Column(db.Integer, nullable=False, server_default='0',
+                        onupdate=db.literal_column('version') + 1)
+    created_by = db.Column(
+        db.Integer, db.ForeignKey('users.user_id', ondelete='CASCADE'))
+    # the database deletes a category's recipes with it, without them being
+    # loaded and deleted one by one
     recipes = db.relationship(
-        'Recipe', backref='category', cascade='all, delete-orphan')
+        'Recipe', backref='category', cascade='all, delete-orphan',
+        passive_deletes=True)
 
     def __init__(self, category_name, description, created_by):
         ''' Initialise the category with a name, description and created by '''
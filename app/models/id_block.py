@@ -0,0 +1,21 @@
+''' This script holds the id block model '''
+
+from ..db import db
+
+
+class IdBlock(db.Model):
+    ''' Class representing the id_blocks table, the next primary key of each
+        sharded table, which workers reserve ids from in blocks
+    '''
+
+    __tablename__ = 'id_blocks'
+
+    name = db.Column(db.String(50), primary_key=True)
+    next_id = db.Column(db.BigInteger, nullable=False)
+
+    def __init__(self, name, next_id):
+        self.name = name
+        self.next_id = next_id
+
+    def __repr__(self):
+        return '<IdBlock: {} {}>'.format(self.name, self.next_id)
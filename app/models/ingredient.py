@@ -0,0 +1,52 @@
+''' This script holds the ingredient models '''
+
+from ..db import db
+
+
+class Ingredient(db.Model):
+    ''' Class representing the ingredients table, the normalized names found
+        in every recipe's ingredients
+    '''
+
+    __tablename__ = 'ingredients'
+
+    ingredient_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+
+    def __init__(self, name):
+        self.name = name
+
+    def __repr__(self):
+        return '<Ingredient: {}>'.format(self.name)
+
+
+class RecipeIngredient(db.Model):
+    ''' Class representing the recipe_ingredients table, which links a recipe
+        to each ingredient it uses
+    '''
+
+    __tablename__ = 'recipe_ingredients'
+    __table_args__ = (
+        # the inverted index, a user's recipe ids for each ingredient
+        db.Index('ix_recipe_ingredients_created_by_ingredient_id_recipe_id',
+                 'created_by', 'ingredient_id', 'recipe_id'),
+    )
+
+    recipe_id = db.Column(
+        db.Integer, db.ForeignKey('recipes.recipe_id', ondelete='CASCADE'),
+        primary_key=True)
+    ingredient_id = db.Column(
+        db.Integer, db.ForeignKey('ingredients.ingredient_id'),
+        primary_key=True)
+    created_by = db.Column(
+        db.Integer, db.ForeignKey('users.user_id', ondelete='CASCADE'),
+        nullable=False)
+
+    def __init__(self, recipe_id, ingredient_id, created_by):
+        self.recipe_id = recipe_id
+        self.ingredient_id = ingredient_id
+        self.created_by = created_by
+
+    def __repr__(self):
+        return '<RecipeIngredient: {} {}>'.format(self.recipe_id,
+                                                  self.ingredient_id)
@@ -1,22 +1,39 @@
-from ..db import db
+from ..db import UtcNow, db
 
 
 class Recipe(db.Model):
     ''' Class representing the recipes table '''
 
     __tablename__ = 'recipes'
+    __table_args__ = (
+        # serve the per-user and per-category listings by recipe_id desc
+        db.Index('ix_recipes_created_by_recipe_id',
+                 'created_by', 'recipe_id'),
+        db.Index('ix_recipes_created_by_category_id_recipe_id',
+                 'created_by', 'category_id', 'recipe_id'),
+        # serves the duplicate name checks and the import's name lookups
+        db.Index('ix_recipes_created_by_category_id_recipe_name',
+                 'created_by', 'category_id', 'recipe_name'),
+        # serves loading a category's recipes and deleting them with it
+        db.Index('ix_recipes_category_id', 'category_id'),
+    )
 
     # table columns
     recipe_id = db.Column(db.Integer, primary_key=True, autoincrement=True)
     recipe_name = db.Column(db.String(100), nullable=False)
     ingredients = db.Column(db.String(256), nullable=False)
-    created_by = db.Column(db.Integer, db.ForeignKey('users.user_id'))
-    date_created = db.Column(db.DateTime, default=db.func.current_timestamp())
-    date_modified = db.Column(
-        db.DateTime, default=db.func.current_timestamp(),
-        onupdate=db.func.current_timestamp())
-    category_id = db.Column(
-        db.Integer, db.ForeignKey('categories.category_id'))
+    created_by = db.Column(
+        db.Integer, db.ForeignKey('users.user_id', ondelete='CASCADE'))
+    # in UTC, whatever the database server's time zone
+    date_created = db.Column(db.DateTime, default=UtcNow())
+    date_modified = db.Column(db.DateTime, default=UtcNow(),
+                              onupdate=UtcNow())
+    # bumped by every UPDATE, versions the row for conditional GETs where
+    # date_modified, to the second on SQLite, may miss an edit
+    version = db.Column(db.Integer, nullable=False, server_default='0',
+                        onupdate=db.literal_column('version') + 1)
+    category_id = db.Column(db.Integer, db.ForeignKey(
+        'categories.category_id', ondelete='CASCADE'))
 
     def __init__(self, recipe_name, ingredients, category_id, created_by):
         ''' Initialise the recipe with a name, ingredients and created by '''
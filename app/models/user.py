@@ -1,4 +1,4 @@
-from flask_bcrypt import Bcrypt
+from flask import current_app
 
 from ..db import db
 
@@ -13,10 +13,18 @@ class User(db.Model):
     username = db.Column(db.String(50), nullable=False, unique=True)
     password = db.Column(db.String(256), nullable=False)
     email = db.Column(db.String(256), nullable=False, unique=True)
+    # the shard holding the user's categories and recipes, None for the
+    # primary, and whether they are being moved, see app/sharding.py
+    shard = db.Column(db.String(50))
+    moving = db.Column(db.Boolean, nullable=False, default=False,
+                       server_default=db.false())
+    # the database deletes a user's categories and recipes with them
     categories = db.relationship(
-        'Category', backref='user', cascade='all, delete-orphan')
+        'Category', backref='user', cascade='all, delete-orphan',
+        passive_deletes=True)
     recipes = db.relationship(
-        'Recipe', backref='user', cascade='all, delete-orphan')
+        'Recipe', backref='user', cascade='all, delete-orphan',
+        passive_deletes=True)
 
     def __init__(self, username, email):
         ''' Initialise the user with a username '''
@@ -24,12 +32,16 @@ class User(db.Model):
         self.email = email
 
     def password_hasher(self, password):
-        ''' hashes the password '''
-        self.password = Bcrypt().generate_password_hash(password).decode('utf-8')
+        ''' hashes the password in the app's password pool '''
+        pool = current_app.extensions['password_pool']
+        self.password = pool.hash(password)
 
     def password_checker(self, password):
-        ''' Check if hashed password and password match '''
-        return Bcrypt().check_password_hash(self.password, password)
+        ''' Check if hashed password and password match, in the app's
+            password pool
+        '''
+        pool = current_app.extensions['password_pool']
+        return pool.check(self.password, password)
 
     def __repr__(self):
         return '<User: {}>'.format(self.username)
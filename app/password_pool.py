@@ -0,0 +1,131 @@
+''' This script runs password hashing and checking off the request thread,
+    in a bounded pool of worker processes.
+
+    bcrypt is deliberately slow, so a burst of logins would otherwise hold
+    every thread of a worker. The pool takes at most workers + max_queue
+    jobs at a time and rejects the rest at once with PasswordPoolBusy.
+'''
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+from functools import lru_cache
+from threading import BoundedSemaphore, Lock
+
+
+@lru_cache()
+def _bcrypt():
+    # imported where the first password is hashed, the pool's processes
+    from flask_bcrypt import Bcrypt
+
+    return Bcrypt()
+
+
+class PasswordPoolBusy(Exception):
+    ''' Raised when the password pool has no free slot for a job '''
+
+
+def hash_password(password):
+    ''' Hashes a password the way User.password_hasher always has '''
+    return _bcrypt().generate_password_hash(password).decode('utf-8')
+
+
+def check_password(hashed, password):
+    ''' Checks a password against its bcrypt hash '''
+    return _bcrypt().check_password_hash(hashed, password)
+
+
+def _timed(func, *args):
+    ''' Runs func in the worker and returns its result and run time '''
+    started = time.monotonic()
+    result = func(*args)
+    return result, time.monotonic() - started
+
+
+class PasswordPool(object):
+    ''' A bounded pool of processes running hash_password and check_password.
+
+        :param int workers: Number of processes, 0 runs jobs on the calling
+        thread, still bounded and timed
+        :param int max_queue: Jobs allowed to wait for a free process
+        :param float timeout: Seconds a caller waits for its job to finish
+    '''
+
+    def __init__(self, workers=2, max_queue=8, timeout=10):
+        self.workers = workers
+        self.timeout = timeout
+        self._slots = BoundedSemaphore(max(workers, 1) + max_queue)
+        self._executor = None
+        self._pid = None
+        self._lock = Lock()
+        self._stats = {'completed': 0, 'rejected': 0, 'in_flight': 0,
+                       'run_seconds': 0.0, 'wait_seconds': 0.0,
+                       'max_seconds': 0.0}
+
+    def hash(self, password):
+        ''' Hashes a password in the pool '''
+        return self._run(hash_password, password)
+
+    def check(self, hashed, password):
+        ''' Checks a password against its hash in the pool '''
+        return self._run(check_password, hashed, password)
+
+    def stats(self):
+        ''' Returns a copy of the pool's counters and timings '''
+        with self._lock:
+            return dict(self._stats)
+
+    def _get_executor(self):
+        # the executor is created on first use in each process, so a
+        # preloaded parent never hands its pool to forked workers
+        with self._lock:
+            if self._executor is None or self._pid != os.getpid():
+                self._executor = ProcessPoolExecutor(self.workers)
+                self._pid = os.getpid()
+            return self._executor
+
+    def _run(self, func, *args):
+        if not self._slots.acquire(blocking=False):
+            self._record(rejected=1)
+            raise PasswordPoolBusy('Too many password operations in progress')
+        self._record(in_flight=1)
+        started = time.monotonic()
+        if self.workers:
+            try:
+                future = self._get_executor().submit(_timed, func, *args)
+                result, run_seconds = future.result(self.timeout)
+            except TimeoutError:
+                # a job already running can not be cancelled, it keeps its
+                # slot and is counted in flight until it ends
+                future.add_done_callback(self._release)
+                future.cancel()
+                self._record(rejected=1)
+                raise PasswordPoolBusy(
+                    'Password operation timed out in the queue')
+            except BaseException:
+                self._release()
+                raise
+            self._release()
+        else:
+            try:
+                result, run_seconds = _timed(func, *args)
+            finally:
+                self._release()
+        total = time.monotonic() - started
+        self._record(completed=1, run_seconds=run_seconds,
+                     wait_seconds=max(total - run_seconds, 0.0),
+                     max_seconds=total)
+        return result
+
+    def _release(self, future=None):
+        ''' Frees the slot of a job that has ended '''
+        self._record(in_flight=-1)
+        self._slots.release()
+
+    def _record(self, max_seconds=None, **increments):
+        with self._lock:
+            for key, value in increments.items():
+                self._stats[key] += value
+            if max_seconds is not None:
+                self._stats['max_seconds'] = max(
+                    self._stats['max_seconds'], max_seconds)
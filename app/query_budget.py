@@ -0,0 +1,133 @@
+''' This script counts the SQL statements each request runs and checks them
+    against the budget its resource method declares with @query_budget.
+
+    Statements are recorded from engine events, tagged with the endpoint and
+    method that ran them. QUERY_BUDGETS picks what happens to a request
+    going over its budget: 'log' logs a warning, 'raise' fails it with
+    QueryBudgetExceeded and 'off' records nothing. The api turns the error
+    into a 500, so 'raise' also keeps the latest ones in
+    app.extensions['query_budget_errors'], which the tests check after every
+    test case.
+'''
+
+from collections import deque, namedtuple
+from contextlib import contextmanager
+from threading import local
+
+from flask import _request_ctx_stack, current_app
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+QueryRecord = namedtuple('QueryRecord', 'endpoint method statement')
+
+
+class QueryBudgetExceeded(Exception):
+    ''' Raised when a request runs more statements than its budget.
+
+        :param str endpoint: The endpoint that handled the request
+        :param str method: The HTTP method
+        :param int budget: The statements the method may run
+        :param list records: The QueryRecords of the statements it ran
+    '''
+
+    def __init__(self, endpoint, method, budget, records):
+        self.endpoint = endpoint
+        self.method = method
+        self.budget = budget
+        self.records = records
+        statements = '\n'.join(record.statement for record in records)
+        super().__init__(f'{method} {endpoint} ran {len(records)} queries, '
+                         f'its budget is {budget}:\n{statements}')
+
+
+class _Current(local):
+    ''' The statements of the request being handled by this thread '''
+    request = None
+    records = None
+    paused = 0
+
+
+_current = _Current()
+
+
+def query_budget(limit):
+    """ Declares the most statements a resource method may run per request
+
+        :param int limit: The budget
+        :return: The method, unchanged
+    """
+    def decorator(method):
+        method.query_budget = limit
+        return method
+    return decorator
+
+
+def budget_of(the_request):
+    ''' Returns the budget of the method handling a request, None if it has
+        none
+    '''
+    view = current_app.view_functions.get(the_request.endpoint)
+    resource = getattr(view, 'view_class', None)
+    method = getattr(resource, the_request.method.lower(), None)
+    return getattr(method, 'query_budget', None)
+
+
+@contextmanager
+def unbudgeted():
+    ''' Leaves the statements run inside it out of the request's count, for
+        work a request only happens to trigger, e.g. a periodic cache sync
+    '''
+    _current.paused += 1
+    try:
+        yield
+    finally:
+        _current.paused -= 1
+
+
+@event.listens_for(Engine, 'before_cursor_execute')
+def _before_cursor_execute(conn, cursor, statement, parameters, context,
+                           executemany):
+    if _current.records is not None and not _current.paused:
+        the_request = _current.request
+        _current.records.append(QueryRecord(
+            the_request.endpoint, the_request.method, statement))
+
+
+def _start_request():
+    _current.request = _request_ctx_stack.top.request
+    _current.records = []
+
+
+def _check_budget(response):
+    records = _current.records
+    if records is None:
+        return response
+    the_request = _current.request
+    _current.request = _current.records = None
+    budget = budget_of(the_request)
+    if budget is None or len(records) <= budget:
+        return response
+    error = QueryBudgetExceeded(the_request.endpoint, the_request.method,
+                                budget, records)
+    if current_app.config['QUERY_BUDGETS'] == 'raise':
+        current_app.extensions['query_budget_errors'].append(error)
+        raise error
+    current_app.logger.warning(str(error))
+    return response
+
+
+def _end_request(exception):
+    _current.request = _current.records = None
+
+
+def init_query_budgets(app):
+    ''' Registers the hooks counting each request's statements, unless
+        QUERY_BUDGETS is off
+    '''
+    app.config.setdefault('QUERY_BUDGETS', 'off')
+    if app.config['QUERY_BUDGETS'] == 'off':
+        return
+    app.extensions['query_budget_errors'] = deque(maxlen=100)
+    app.before_request(_start_request)
+    app.after_request(_check_budget)
+    app.teardown_request(_end_request)
@@ -0,0 +1,162 @@
+''' This script sends the reads of GET requests to read replicas.
+
+    REPLICA_DATABASE_URLS lists the replicas, which are added to
+    SQLALCHEMY_BINDS as replica_1, replica_2 and so on. The statements of a
+    GET or HEAD request run on one replica, picked per transaction. Other
+    requests, flushes, and work outside a request run on the primary. So do
+    the queries of PRIMARY_TABLES: the revocation check and the token's
+    user, which must not lag behind a logout or a registration.
+
+    A replica lags behind the primary. Once a user's write is committed,
+    their requests read from the primary for REPLICA_STICKY_SECONDS, so they
+    see their own writes. The window is kept in redis, shared by every
+    worker, or with the 'local' backend in each process, which is only
+    correct with a single worker.
+
+    Replication itself is the databases' business. Locally the primary and
+    the replica can be two Postgres instances streaming from one to the
+    other, or two SQLite files, the replica a copy of the primary:
+
+        DATABASE_URL=sqlite:////tmp/primary.db \\
+        REPLICA_DATABASE_URLS=sqlite:////tmp/replica.db python manage.py ...
+'''
+
+import random
+
+from flask import current_app, has_request_context, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event
+
+from .db import RoutingSession
+from .response_cache import LocalStore
+
+try:
+    import redis
+except ImportError:     # optional, only the redis backend needs it
+    redis = None
+
+READ_METHODS = ('GET', 'HEAD')
+# read on the primary whatever the request
+PRIMARY_TABLES = frozenset(('blacklisted', 'users'))
+# the session.info key of the bind the transaction reads from, None for
+# the primary
+BIND = 'replica_bind'
+# the session.info key set once the transaction has written
+WROTE = 'replica_wrote'
+
+
+class ReplicaRouter(object):
+    ''' Picks the bind a session's statements run on and keeps the window in
+        which a user who wrote reads from the primary
+
+        :param list binds: The names of the replicas' binds
+        :param object store: A client with redis' get and set(ex=)
+        :param int sticky_seconds: Seconds a user reads from the primary
+        after a write, 0 for not at all
+    '''
+
+    def __init__(self, binds, store, sticky_seconds=5,
+                 prefix='replica-sticky:'):
+        self.binds = binds
+        self.store = store
+        self.sticky_seconds = sticky_seconds
+        self.prefix = prefix
+
+    def bind_for(self, session, mapper):
+        """ Returns the bind the session's next statement runs on
+
+            :param object session: The session running it
+            :param object mapper: The mapper it queries, None for a
+            statement without one
+            :return: A replica's bind name, None for the primary
+        """
+        info = session.info
+        if session._flushing or not self._reads():
+            # a transaction that read from a replica and then writes, e.g.
+            # an atomic batch, reads what it wrote from the primary
+            info[WROTE] = True
+            info[BIND] = None
+            return None
+        if mapper is not None and mapper.local_table.name in PRIMARY_TABLES:
+            return None
+        if BIND not in info:
+            # picked once the token is decoded, the tables above are read
+            # while it is
+            info[BIND] = (None if self.is_sticky(get_jwt_identity())
+                          else random.choice(self.binds))
+        return info[BIND]
+
+    def stick(self, user_id):
+        ''' Has a user read from the primary for the next sticky_seconds '''
+        if user_id is None or not self.sticky_seconds:
+            return
+        try:
+            self.store.set(f'{self.prefix}{user_id}', 1,
+                           ex=self.sticky_seconds)
+        except Exception:
+            # the write is committed, its response is not failed for this
+            current_app.logger.exception('Could not record a write of user '
+                                         '%s', user_id)
+
+    def is_sticky(self, user_id):
+        ''' Tells if a user wrote in the last sticky_seconds '''
+        if user_id is None or not self.sticky_seconds:
+            return False
+        try:
+            return self.store.get(f'{self.prefix}{user_id}') is not None
+        except Exception:
+            # reading from the primary is never stale
+            return True
+
+    @staticmethod
+    def _reads():
+        return has_request_context() and request.method in READ_METHODS
+
+
+@event.listens_for(RoutingSession, 'after_commit')
+def _after_commit(session):
+    if session.info.pop(WROTE, False) and has_request_context():
+        router = session.app.extensions.get('replica_router')
+        if router is not None:
+            router.stick(get_jwt_identity())
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _after_transaction_end(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(BIND, None)
+        session.info.pop(WROTE, None)
+
+
+def make_store(config):
+    """ Builds the store named by REPLICA_STICKY_BACKEND
+
+        :param dict config: The app config
+        :return: A client with redis' get and set(ex=)
+    """
+    if config.get('REPLICA_STICKY_BACKEND', 'local') == 'redis':
+        if redis is None:
+            raise RuntimeError('The redis sticky window needs the redis '
+                               'package installed')
+        return redis.StrictRedis.from_url(config['REPLICA_STICKY_URL'])
+    return LocalStore()
+
+
+def init_replicas(app):
+    ''' Adds the binds of REPLICA_DATABASE_URLS and routes the app's reads to
+        them, if there are any
+    '''
+    urls = [url.strip() for url in
+            app.config.get('REPLICA_DATABASE_URLS', '').split(',')
+            if url.strip()]
+    if not urls:
+        return
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    names = []
+    for number, url in enumerate(urls, 1):
+        names.append(f'replica_{number}')
+        binds[names[-1]] = url
+    app.config['SQLALCHEMY_BINDS'] = binds
+    app.extensions['replica_router'] = ReplicaRouter(
+        names, make_store(app.config),
+        app.config.get('REPLICA_STICKY_SECONDS', 5))
@@ -0,0 +1,313 @@
+''' This script holds the cache of GET responses.
+
+    Every row belongs to the user in its created_by column, so a read
+    endpoint's response depends only on the user, the path and the query
+    args. Responses are cached under those and the user's data version, a
+    counter every write bumps, which invalidates all of a user's cached
+    responses in O(1) without finding their keys.
+'''
+
+import json
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+from functools import wraps
+from threading import Lock
+
+from flask import Response, current_app, g, request
+from flask_jwt_extended import get_jwt_identity
+from werkzeug.http import parse_date
+
+from .etag_helper import not_modified
+
+try:
+    import redis
+except ImportError:     # optional, only the redis backend needs it
+    redis = None
+
+# the g attribute set while writes are uncommitted, True once one has run
+DEFERRED = 'response_cache_deferred'
+
+
+class MemoryBackend(object):
+    ''' An in-process LRU of responses holding at most max_entries.
+        Versions are kept per process too, so it is only correct when one
+        process serves every request of a user, e.g. a single worker.
+
+        :param int max_entries: Responses kept before the least recently
+        used one is evicted
+    '''
+
+    def __init__(self, max_entries=1024):
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._versions = {}
+        self._lock = Lock()
+        self.evictions = 0
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key, entry):
+        with self._lock:
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def version(self, user_id):
+        return self._versions.get(user_id, 0)
+
+    def bump(self, user_id):
+        with self._lock:
+            self._versions[user_id] = self._versions.get(user_id, 0) + 1
+
+
+class SharedBackend(object):
+    ''' Responses and versions kept in a store shared by every worker, e.g.
+        redis. Entries expire after ttl seconds, which also clears the ones
+        left behind under old versions.
+
+        :param object client: A client with redis' get, set(ex=) and incr
+        :param int ttl: Seconds an entry is kept
+        :param str prefix: Prefix of every key written to the store
+    '''
+
+    def __init__(self, client, ttl=300, prefix='response-cache:'):
+        self.client = client
+        self.ttl = ttl
+        self.prefix = prefix
+        self.evictions = 0
+
+    def get(self, key):
+        value = self.client.get(self.prefix + key)
+        if value is None:
+            return None
+        return json.loads(value)
+
+    def set(self, key, entry):
+        self.client.set(self.prefix + key, json.dumps(entry), ex=self.ttl)
+
+    def version(self, user_id):
+        return int(self.client.get(f'{self.prefix}version:{user_id}') or 0)
+
+    def bump(self, user_id):
+        self.client.incr(f'{self.prefix}version:{user_id}')
+
+
+class LocalStore(object):
+    ''' A stand-in for the shared store, holding its keys in this process.
+        Lets SharedBackend run in development and tests without redis.
+    '''
+
+    def __init__(self):
+        self._data = {}
+        self._lock = Lock()
+
+    def get(self, key):
+        with self._lock:
+            value, expires = self._data.get(key, (None, None))
+            if expires is not None and expires <= time.monotonic():
+                del self._data[key]
+                return None
+            return value
+
+    def set(self, key, value, ex=None):
+        expires = time.monotonic() + ex if ex else None
+        with self._lock:
+            self._data[key] = (value, expires)
+
+    def incr(self, key):
+        with self._lock:
+            value, expires = self._data.get(key, (0, None))
+            self._data[key] = (int(value) + 1, expires)
+            return int(value) + 1
+
+
+class ResponseCache(object):
+    ''' Caches GET responses per user and data version, counting hits and
+        misses. A backend failing is counted and treated as a miss.
+
+        :param object backend: A MemoryBackend or SharedBackend
+    '''
+
+    def __init__(self, backend):
+        self.backend = backend
+        self._lock = Lock()
+        self._stats = {'hits': 0, 'misses': 0, 'stores': 0, 'bumps': 0,
+                       'errors': 0}
+
+    def get(self, key):
+        try:
+            entry = self.backend.get(key)
+        except Exception:
+            self._record('errors')
+            entry = None
+        self._record('misses' if entry is None else 'hits')
+        return entry
+
+    def set(self, key, entry):
+        try:
+            self.backend.set(key, entry)
+        except Exception:
+            self._record('errors')
+        else:
+            self._record('stores')
+
+    def version(self, user_id):
+        ''' Returns the user's data version, None if the backend failed '''
+        try:
+            return self.backend.version(user_id)
+        except Exception:
+            self._record('errors')
+            return None
+
+    def bump(self, user_id):
+        ''' Invalidates every cached response of the user '''
+        try:
+            self.backend.bump(user_id)
+        except Exception:
+            self._record('errors')
+        else:
+            self._record('bumps')
+
+    def stats(self):
+        ''' Returns a copy of the cache's counters '''
+        with self._lock:
+            stats = dict(self._stats)
+        stats['evictions'] = self.backend.evictions
+        return stats
+
+    def _record(self, key):
+        with self._lock:
+            self._stats[key] += 1
+
+
+def make_backend(config):
+    """ Builds the backend named by RESPONSE_CACHE_BACKEND
+
+        :param dict config: The app config
+        :return: A backend or None if caching is off
+    """
+    name = config.get('RESPONSE_CACHE_BACKEND', 'none')
+    if name == 'memory':
+        return MemoryBackend(config.get('RESPONSE_CACHE_SIZE', 1024))
+    if name == 'local':
+        return SharedBackend(LocalStore(), config.get('RESPONSE_CACHE_TTL', 300))
+    if name == 'redis':
+        if redis is None:
+            raise RuntimeError('The redis response cache needs the redis '
+                               'package installed')
+        return SharedBackend(
+            redis.StrictRedis.from_url(config['RESPONSE_CACHE_URL']),
+            config.get('RESPONSE_CACHE_TTL', 300))
+    return None
+
+
+def _entry(result):
+    ''' Turns a view's 200 result into a JSON serializable entry '''
+    if isinstance(result, Response):
+        if result.status_code != 200 or result.is_streamed:
+            return None
+        return {'body': result.get_data(as_text=True),
+                'mimetype': result.mimetype,
+                'headers': {name: value for name, value in result.headers
+                            if name not in ('Content-Type', 'Content-Length')}}
+    if not isinstance(result, tuple):
+        result = (result, 200, {})
+    if result[1] != 200:
+        return None
+    return {'data': result[0],
+            'headers': dict(result[2]) if len(result) > 2 else {}}
+
+
+def _result(entry):
+    ''' Turns an entry back into a view's result '''
+    if 'body' in entry:
+        response = Response(entry['body'], mimetype=entry['mimetype'])
+        response.headers.extend(entry['headers'])
+        return response
+    return entry['data'], 200, entry['headers']
+
+
+def _cached_not_modified(headers):
+    etag = headers.get('ETag', '').strip('"')
+    if not etag:
+        return False
+    last_modified = headers.get('Last-Modified')
+    return not_modified(etag, last_modified and parse_date(last_modified))
+
+
+def cached(method):
+    """ Serves a GET method from the response cache.
+        Goes under @jwt_required and over @conditional, a hit answers
+        conditional requests from the cached ETag without a query.
+    """
+    @wraps(method)
+    def wrapper(resource, *args, **kwargs):
+        cache = current_app.extensions.get('response_cache')
+        if cache is None or hasattr(g, DEFERRED):
+            # a response may hold writes that are not committed yet
+            return method(resource, *args, **kwargs)
+        user_id = get_jwt_identity()
+        # the version is read before the view queries, so a write committed
+        # in between can only leave its stale response under an old version
+        version = cache.version(user_id)
+        if version is None:
+            return method(resource, *args, **kwargs)
+        key = f'{user_id}:{version}:{request.full_path}'
+        entry = cache.get(key)
+        if entry is not None:
+            if _cached_not_modified(entry['headers']):
+                return Response(status=304, headers=entry['headers'])
+            return _result(entry)
+        result = method(resource, *args, **kwargs)
+        entry = _entry(result)
+        if entry is not None:
+            cache.set(key, entry)
+        return result
+    return wrapper
+
+
+def invalidates(method):
+    ''' Bumps the user's data version once a write method has run '''
+    @wraps(method)
+    def wrapper(resource, *args, **kwargs):
+        try:
+            return method(resource, *args, **kwargs)
+        finally:
+            cache = current_app.extensions.get('response_cache')
+            if hasattr(g, DEFERRED):
+                setattr(g, DEFERRED, True)
+            elif cache is not None:
+                cache.bump(get_jwt_identity())
+    return wrapper
+
+
+@contextmanager
+def deferred_invalidation():
+    ''' Bypasses the cache for the reads run in it and holds back the bumps
+        of its writes, bumping the user's version once on leaving, after the
+        writes are committed or rolled back
+    '''
+    setattr(g, DEFERRED, False)
+    try:
+        yield
+    finally:
+        wrote = getattr(g, DEFERRED)
+        delattr(g, DEFERRED)
+        cache = current_app.extensions.get('response_cache')
+        if wrote and cache is not None:
+            cache.bump(get_jwt_identity())
+
+
+def init_response_cache(app):
+    ''' Sets up the response cache named by the app's config '''
+    backend = make_backend(app.config)
+    if backend is not None:
+        app.extensions['response_cache'] = ResponseCache(backend)
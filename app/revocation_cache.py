@@ -0,0 +1,81 @@
+''' This script holds the in-process cache of revoked (blacklisted) tokens.
+
+    Every worker keeps the jtis found in the blacklisted table in memory and
+    polls the table for rows added since its last sync, so deciding that a
+    token has not been revoked is a set lookup instead of a database query.
+'''
+
+import time
+from threading import Lock
+
+from .db import db
+from .models.blacklist import Blacklist
+from .query_budget import unbudgeted
+
+
+GAP_TIMEOUT = 60
+
+
+class RevocationCache(object):
+    ''' A per-worker set of revoked jtis kept current by polling the
+        blacklisted table for ids greater than the last one seen.
+
+        Ids skipped over by a poll (a row whose transaction had not committed
+        yet) are polled again until GAP_TIMEOUT seconds have passed.
+
+        :param int max_staleness: Seconds a worker may go without polling the
+        table, i.e. how long a token revoked by another worker may still pass
+    '''
+
+    def __init__(self, max_staleness=5):
+        self.max_staleness = max_staleness
+        self._revoked = set()
+        self._last_id = 0
+        self._gaps = {}
+        self._synced_at = None
+        self._lock = Lock()
+
+    def is_revoked(self, jti):
+        ''' Checks if a jti has been revoked, polling the table first if the
+            cache is older than the staleness window
+
+            :param str jti: The unique identifier of the token
+            :return: Boolean
+        '''
+        if self._is_stale():
+            self.sync()
+        return jti in self._revoked
+
+    def add(self, jti):
+        ''' Records a token revoked by this worker so it is rejected at once '''
+        self._revoked.add(jti)
+
+    def sync(self):
+        ''' Loads the jtis blacklisted since the last sync '''
+        with self._lock:
+            if not self._is_stale():
+                return
+            now = time.monotonic()
+            self._gaps = {gap: seen for gap, seen in self._gaps.items()
+                          if now - seen < GAP_TIMEOUT}
+            condition = Blacklist.id > self._last_id
+            if self._gaps:
+                condition = db.or_(condition, Blacklist.id.in_(self._gaps))
+            # a poll lands on whichever request finds the cache stale, it
+            # does not count against that request's query budget
+            with unbudgeted():
+                rows = db.session.query(Blacklist.id, Blacklist.token).filter(
+                    condition).order_by(Blacklist.id).all()
+            for row_id, token in rows:
+                self._revoked.add(token)
+                self._gaps.pop(row_id, None)
+                if row_id > self._last_id:
+                    self._gaps.update(
+                        (gap, now) for gap in range(self._last_id + 1, row_id))
+                    self._last_id = row_id
+            self._synced_at = now
+
+    def _is_stale(self):
+        if self._synced_at is None:
+            return True
+        return time.monotonic() - self._synced_at >= self.max_staleness
@@ -0,0 +1,109 @@
+''' This script handles full-text search of recipes and categories.
+
+    On Postgres the searchable columns are covered by a GIN index over their
+    tsvector, on SQLite by an FTS5 table kept in sync with triggers. Both are
+    created alongside the tables and matched by prefix, ranked by relevance.
+'''
+
+import re
+
+from sqlalchemy import DDL, event, literal_column, select, table, column
+
+from .db import db
+from .models.category import Category
+from .models.recipe import Recipe
+
+# table name: (primary key, searchable columns)
+SEARCHABLE = {
+    'recipes': ('recipe_id', ('recipe_name', 'ingredients')),
+    'categories': ('category_id', ('category_name', 'description')),
+}
+
+
+def _postgres_ddl(name, columns):
+    document = " || ' ' || ".join(columns)
+    return [
+        DDL(f"CREATE INDEX {name}_search_idx ON {name} USING gin "
+            f"(to_tsvector('simple', {document}))"),
+    ]
+
+
+def _sqlite_ddl(name, pk, columns):
+    cols = ', '.join(columns)
+    new = ', '.join(f'new.{col}' for col in columns)
+    old = ', '.join(f'old.{col}' for col in columns)
+    delete = (f"INSERT INTO {name}_fts({name}_fts, rowid, {cols}) "
+              f"VALUES ('delete', old.{pk}, {old});")
+    insert = (f"INSERT INTO {name}_fts(rowid, {cols}) "
+              f"VALUES (new.{pk}, {new});")
+    return [
+        DDL(f"CREATE VIRTUAL TABLE {name}_fts USING fts5({cols}, "
+            f"content='{name}', content_rowid='{pk}')"),
+        DDL(f"CREATE TRIGGER {name}_fts_ai AFTER INSERT ON {name} "
+            f"BEGIN {insert} END"),
+        DDL(f"CREATE TRIGGER {name}_fts_ad AFTER DELETE ON {name} "
+            f"BEGIN {delete} END"),
+        DDL(f"CREATE TRIGGER {name}_fts_au AFTER UPDATE ON {name} "
+            f"BEGIN {delete} {insert} END"),
+    ]
+
+
+for _model in (Recipe, Category):
+    _name = _model.__tablename__
+    _pk, _columns = SEARCHABLE[_name]
+    for _ddl in _postgres_ddl(_name, _columns):
+        event.listen(_model.__table__, 'after_create',
+                     _ddl.execute_if(dialect='postgresql'))
+    for _ddl in _sqlite_ddl(_name, _pk, _columns):
+        event.listen(_model.__table__, 'after_create',
+                     _ddl.execute_if(dialect='sqlite'))
+    event.listen(_model.__table__, 'before_drop',
+                 DDL(f'DROP TABLE IF EXISTS {_name}_fts').execute_if(
+                     dialect='sqlite'))
+
+
+def search_terms(q):
+    ''' Splits a search string into lowercase word tokens '''
+    return re.findall(r'\w+', q.lower())
+
+
+def search(model, q, *criteria):
+    """ Builds a query of the rows of a model matching every word of q as a
+        prefix, best matches first.
+        Returns None if q holds no searchable words.
+
+        :param object model: Recipe or Category
+        :param str q: The search string
+        :param criteria: Extra filters, e.g. the created_by scope
+        :return: A BaseQuery that can be paginated
+    """
+    terms = search_terms(q)
+    if not terms:
+        return None
+    name = model.__tablename__
+    pk_name, columns = SEARCHABLE[name]
+    pk = getattr(model, pk_name)
+    dialect = db.session.get_bind(model.__mapper__).dialect.name
+
+    if dialect == 'postgresql':
+        document = literal_column(" || ' ' || ".join(
+            f'{name}.{col}' for col in columns))
+        vector = db.func.to_tsvector(literal_column("'simple'"), document)
+        query = db.func.to_tsquery(
+            literal_column("'simple'"),
+            ' & '.join(f'{term}:*' for term in terms))
+        return model.query.filter(vector.op('@@')(query), *criteria).order_by(
+            db.func.ts_rank(vector, query).desc(), pk.desc())
+
+    if dialect == 'sqlite':
+        fts = table(f'{name}_fts', column('rowid'), column('rank'))
+        matches = select([fts.c.rowid, fts.c.rank]).where(
+            literal_column(f'{name}_fts').op('MATCH')(
+                ' '.join(f'"{term}"*' for term in terms))).alias()
+        return model.query.join(matches, matches.c.rowid == pk).filter(
+            *criteria).order_by(matches.c.rank, pk.desc())
+
+    # no full-text support on this backend, fall back to matching the words
+    return model.query.filter(*criteria, *(
+        db.or_(*(getattr(model, col).ilike(f'%{term}%') for col in columns))
+        for term in terms)).order_by(pk.desc())
@@ -1,6 +1,11 @@
 ''' This script handles how data is formatted and returned on get requests '''
 
+from datetime import timezone
+
 from flask_marshmallow import Marshmallow
+from marshmallow import fields
+from marshmallow_sqlalchemy.fields import Related
+from sqlalchemy.orm.interfaces import MANYTOONE
 
 from app.models.category import Category
 from app.models.recipe import Recipe
@@ -20,6 +25,8 @@ class CategorySchema(ma.ModelSchema):
     """ Category model schema """
     class Meta:
         model = Category
+        # only the ETags are built from it
+        exclude = ('version',)
     recipes = ma.Nested('RecipeSchema', many=True, load=True)
 
 
@@ -27,3 +34,84 @@ class RecipeSchema(ma.ModelSchema):
     """ Recipe model schema """
     class Meta:
         model = Recipe
+        exclude = ('version',)
+
+
+def _field_getter(schema, name, field):
+    """ Returns a function pulling one field's dumped value from an object,
+        taking the shortest path that gives the same value as the field.
+
+        :param object schema: The schema instance the field is bound to
+        :param str name: The field name
+        :param object field: The bound marshmallow field
+        :return: A function of the object being dumped
+    """
+    attribute = field.attribute or name
+
+    if isinstance(field, fields.Nested):
+        dump = compile_serializer(field.schema)
+        if field.many:
+            return lambda obj: [dump(item) for item in getattr(obj, attribute)]
+        return lambda obj: (
+            None if getattr(obj, attribute) is None
+            else dump(getattr(obj, attribute)))
+
+    if isinstance(field, Related) and not field.columns:
+        prop = getattr(schema.opts.model, attribute).property
+        if prop.direction is MANYTOONE and len(prop.local_columns) == 1:
+            # the related object's primary key is the local foreign key, read
+            # it off the row instead of loading the related object
+            local_column = next(iter(prop.local_columns))
+            key = prop.parent.get_property_by_column(local_column).key
+            return lambda obj: getattr(obj, key)
+
+    if isinstance(field, fields.Integer) and not field.as_string:
+        def get_integer(obj):
+            value = getattr(obj, attribute)
+            return value if value is None else int(value)
+        return get_integer
+
+    if (isinstance(field, fields.DateTime) and not field.localtime and
+            (field.dateformat or field.DEFAULT_FORMAT) == 'iso'):
+        def get_datetime(obj):
+            # marshmallow.utils.isoformat, with datetime's own UTC
+            value = getattr(obj, attribute)
+            if value is None:
+                return None
+            if value.tzinfo is None:
+                return value.replace(tzinfo=timezone.utc).isoformat()
+            return value.astimezone(timezone.utc).isoformat()
+        return get_datetime
+
+    if isinstance(field, fields.String):
+        def get_string(obj):
+            value = getattr(obj, attribute)
+            if value is None or type(value) is str:
+                return value
+            return field._serialize(value, name, obj)
+        return get_string
+
+    return lambda obj: field.serialize(name, obj)
+
+
+def compile_serializer(schema):
+    """ Generates a function that dumps a model object to the same dict
+        schema.dump(obj).data gives, keys in the same order, without going
+        through marshmallow's per call field lookups and error handling.
+
+        :param object schema: A ModelSchema instance
+        :return: A function taking a model object and returning a dict
+    """
+    getters = tuple((name, _field_getter(schema, name, field))
+                    for name, field in schema.fields.items())
+
+    def serialize(obj):
+        return {name: getter(obj) for name, getter in getters}
+    return serialize
+
+
+dump_user = compile_serializer(UserSchema())
+dump_category = compile_serializer(CategorySchema())
+# the exports merge the recipes in from a second cursor
+dump_category_fields = compile_serializer(CategorySchema(exclude=('recipes',)))
+dump_recipe = compile_serializer(RecipeSchema())
@@ -0,0 +1,474 @@
+''' This script spreads the users' categories and recipes over shards.
+
+    SHARD_DATABASE_URLS names the shards, which are added to
+    SQLALCHEMY_BINDS. Every shard has the primary's schema. A new user is
+    placed on the shard a consistent-hash ring of their user_id gives, and
+    every statement of a request on the categories, recipes and ingredient
+    tables runs on the shard of the request's user. Adding a shard moves
+    about 1/n of the users to it instead of reshuffling them all.
+
+    The primary keeps the directory: the users table, which keeps usernames
+    and emails unique and holds the passwords and each user's shard, the
+    blacklist, and id_blocks. A shard has a stub row of each of its users,
+    with no personal data, for the foreign keys and their cascades. Users
+    on no shard, e.g. the ones registered before there were shards, stay
+    on the primary until they are moved.
+
+    Category and recipe ids come from blocks of SHARD_ID_BLOCK_SIZE ids a
+    worker reserves in id_blocks, so they are unique across the shards and
+    a user keeps them when moved. Ids are still increasing per worker, not
+    across workers.
+
+    python manage.py shard rebalance moves the users the ring places
+    elsewhere, while the app serves them. Their writes are turned away with
+    a 503 while they are copied, their reads carry on from the old shard.
+'''
+
+import bisect
+import hashlib
+import time
+from threading import Lock
+
+from flask import current_app, has_request_context, request
+from flask_jwt_extended import get_jwt_identity
+from sqlalchemy import event, func, select
+
+from .auth_cache import ExpiringLRU
+from .db import RoutingSession, db
+from .ingredient_index import index_recipes
+from .models.category import Category
+from .models.id_block import IdBlock
+from .models.recipe import Recipe
+from .models.user import User
+from .query_budget import unbudgeted
+
+READ_METHODS = ('GET', 'HEAD', 'OPTIONS')
+# the directory's tables, on the primary
+GLOBAL_TABLES = frozenset(('users', 'blacklisted', 'id_blocks'))
+# a user's rows, copied in this order when the user is moved
+USER_TABLES = (Category.__table__, Recipe.__table__)
+# the session.info key of the shard and moving flag of the transaction's
+# user
+SHARD = 'shard'
+# the password of a user's stub row on a shard, no password matches it
+STUB_PASSWORD = '!'
+COPY_ATTEMPTS = 3
+
+USERS = User.__table__
+ID_BLOCKS = IdBlock.__table__
+
+
+class UserMoving(Exception):
+    ''' Raised by a write of a user whose rows are being moved '''
+
+
+def moving_response():
+    ''' Returns the 503 a write of a user being moved is answered with,
+        retried once the workers see the move is over
+    '''
+    return ({'message': 'Your data is being moved, try again shortly'}, 503,
+            {'Retry-After': str(
+                current_app.extensions['shard_router'].cache_seconds)})
+
+
+class HashRing(object):
+    ''' A consistent-hash ring of the shards' names, each placed on it
+        replicas times so the keys are spread evenly
+
+        :param list nodes: The names of the shards
+        :param int replicas: Points on the ring per shard
+    '''
+
+    def __init__(self, nodes, replicas=64):
+        self._points = sorted((_hash(f'{node}#{number}'), node)
+                              for node in nodes for number in range(replicas))
+        self._hashes = [point for point, _ in self._points]
+
+    def node_for(self, key):
+        ''' Returns the shard of a key, the first point after its hash '''
+        index = bisect.bisect(self._hashes, _hash(str(key)))
+        return self._points[index % len(self._points)][1]
+
+
+def _hash(value):
+    return int.from_bytes(hashlib.md5(value.encode('utf-8')).digest()[:8],
+                          'big')
+
+
+class ShardRouter(object):
+    ''' Picks the shard of a session's statements, from a per-worker cache of
+        the directory, and gives out the ids of the sharded tables
+
+        :param list shards: The names of the shards' binds
+        :param object ring: The HashRing placing users on them
+        :param int cache_seconds: Seconds a user's shard is cached, i.e. how
+        long a worker may take to see a user move
+        :param int cache_size: Users whose shard is cached
+        :param int block_size: Ids reserved at a time per table
+    '''
+
+    def __init__(self, shards, ring, cache_seconds=5, cache_size=10000,
+                 block_size=100):
+        self.shards = shards
+        self.ring = ring
+        self.cache_seconds = cache_seconds
+        self.directory = ExpiringLRU(cache_size)
+        self.block_size = block_size
+        self._blocks = {}
+        self._lock = Lock()
+
+    def bind_for(self, session, mapper):
+        """ Returns the bind the session's next statement runs on
+
+            :param object session: The session running it
+            :param object mapper: The mapper it queries, None for a
+            statement without one
+            :return: The user's shard, None for the primary
+            :raises UserMoving: If it writes for a user being moved
+        """
+        if mapper is not None and mapper.local_table.name in GLOBAL_TABLES:
+            return None
+        info = session.info
+        if SHARD not in info:
+            user_id = get_jwt_identity() if has_request_context() else None
+            if user_id is None:
+                return None
+            info[SHARD] = self.locate(session.app, user_id)
+        shard, moving = info[SHARD]
+        if moving and (session._flushing or not (
+                has_request_context() and request.method in READ_METHODS)):
+            raise UserMoving()
+        return shard
+
+    def locate(self, app, user_id):
+        """ Looks up a user in the directory, in the worker's cache first
+
+            :param object app: The app whose primary holds the directory
+            :param int user_id: The user
+            :return: A tuple of the user's shard, None for the primary, and
+            whether they are being moved
+        """
+        entry = self.directory.get(user_id)
+        if entry is None:
+            # read outside the session, which may be flushing; a lookup
+            # lands on whichever request finds it missing or expired
+            with unbudgeted():
+                row = db.get_engine(app).execute(
+                    select([USERS.c.shard, USERS.c.moving]).where(
+                        USERS.c.user_id == user_id)).first()
+            entry = (row[0], bool(row[1])) if row else (None, False)
+            self.directory.set(user_id, entry,
+                               time.time() + self.cache_seconds)
+        return entry
+
+    def next_ids(self, app, name, count):
+        """ Returns unused ids of a sharded table, from the worker's block
+
+            :param object app: The app whose primary holds id_blocks
+            :param str name: The table's name
+            :param int count: Ids wanted
+            :return: A list of ids
+        """
+        with self._lock:
+            start, end = self._blocks.get(name, (0, 0))
+            if end - start < count:
+                size = max(self.block_size, count)
+                start = self._reserve(app, name, size)
+                end = start + size
+            self._blocks[name] = (start + count, end)
+        return list(range(start, start + count))
+
+    @staticmethod
+    def _reserve(app, name, size):
+        # committed at once, in a transaction of its own, so no other
+        # worker is handed the same block whatever the request does
+        with unbudgeted(), db.get_engine(app).begin() as connection:
+            reserved = connection.execute(ID_BLOCKS.update().where(
+                ID_BLOCKS.c.name == name).values(
+                    next_id=ID_BLOCKS.c.next_id + size))
+            if not reserved.rowcount:
+                raise RuntimeError(f'There are no ids for {name}, run '
+                                   'python manage.py shard init')
+            next_id = connection.execute(select([ID_BLOCKS.c.next_id]).where(
+                ID_BLOCKS.c.name == name)).scalar()
+        return next_id - size
+
+
+@event.listens_for(RoutingSession, 'before_flush')
+def _assign_ids(session, flush_context, instances):
+    router = session.app.extensions.get('shard_router')
+    if router is None:
+        return
+    for model, pk in ((Category, 'category_id'), (Recipe, 'recipe_id')):
+        new = [instance for instance in session.new if
+               isinstance(instance, model) and getattr(instance, pk) is None]
+        if new:
+            ids = router.next_ids(session.app, model.__tablename__, len(new))
+            for instance, new_id in zip(new, ids):
+                setattr(instance, pk, new_id)
+
+
+@event.listens_for(RoutingSession, 'after_transaction_end')
+def _after_transaction_end(session, transaction):
+    if transaction.parent is None:
+        session.info.pop(SHARD, None)
+
+
+def assign_ids(table, rows):
+    """ Gives rows about to be inserted into a sharded table their primary
+        keys, which the database picks when there are no shards
+
+        :param object table: The categories or recipes table
+        :param list rows: Dicts of the rows' columns, given their key
+    """
+    router = current_app.extensions.get('shard_router')
+    if router is None:
+        return
+    pk = table.primary_key.columns.values()[0].name
+    ids = router.next_ids(current_app, table.name, len(rows))
+    for row, new_id in zip(rows, ids):
+        row[pk] = new_id
+
+
+def place_user(user):
+    """ Puts a new user on the shard the ring gives them, before their row
+        is committed
+
+        :param object user: The User being registered, added to the session
+    """
+    router = current_app.extensions.get('shard_router')
+    if router is None:
+        return
+    # only apps with shards run these, they are not in the budget of
+    # registering
+    with unbudgeted():
+        # gives the user their user_id
+        db.session.flush()
+        shard = router.ring.node_for(user.user_id)
+        with db.get_engine(current_app, shard).begin() as connection:
+            _add_stub(connection, user.user_id)
+        user.shard = shard
+        db.session.flush()
+
+
+def _add_stub(connection, user_id):
+    # a registration rolled back after adding it may have left it behind
+    if connection.execute(select([USERS.c.user_id]).where(
+            USERS.c.user_id == user_id)).first() is None:
+        connection.execute(USERS.insert().values(
+            user_id=user_id, username=str(user_id), email=str(user_id),
+            password=STUB_PASSWORD))
+
+
+def _engine(shard):
+    return db.get_engine(current_app, shard)
+
+
+def _fingerprint(connection, user_id):
+    # the rows of a user, and the sum of their versions, which any edit
+    # changes
+    return [tuple(connection.execute(select(
+        [func.count(), func.sum(table.c.version)]).where(
+            table.c.created_by == user_id)).first())
+            for table in USER_TABLES]
+
+
+def _copy_user(user_id, source, target):
+    ''' Copies a user's rows from the source shard to the target, replacing
+        the ones a failed move may have left there, and returns the
+        fingerprint of what was copied
+    '''
+    with _engine(source).connect() as reader, \
+            _engine(target).begin() as writer:
+        _add_stub(writer, user_id)
+        for table in reversed(USER_TABLES):
+            writer.execute(table.delete().where(table.c.created_by == user_id))
+        copied = _fingerprint(reader, user_id)
+        recipes = []
+        for table in USER_TABLES:
+            rows = [dict(row) for row in reader.execute(
+                table.select().where(table.c.created_by == user_id))]
+            if rows:
+                writer.execute(table.insert(), rows)
+            if table is Recipe.__table__:
+                recipes = [(row['recipe_id'], user_id, row['ingredients'])
+                           for row in rows]
+        # a shard has ingredient ids of its own, the recipes are indexed
+        # again rather than their links copied
+        index_recipes(writer, recipes, replace=False)
+    return copied
+
+
+def _delete_user(user_id, shard):
+    with _engine(shard).begin() as connection:
+        if shard is None:
+            # the primary's row is the user's directory entry
+            for table in reversed(USER_TABLES):
+                connection.execute(
+                    table.delete().where(table.c.created_by == user_id))
+        else:
+            # the foreign keys delete the rows with the stub
+            connection.execute(USERS.delete().where(
+                USERS.c.user_id == user_id))
+
+
+def _update_directory(user_ids, **values):
+    with _engine(None).begin() as connection:
+        connection.execute(USERS.update().where(
+            USERS.c.user_id.in_(user_ids)).values(**values))
+
+
+def move_users(moves, wait):
+    """ Moves users to other shards, while the app serves them:
+
+        1. they are marked moving and their writes turned away, once every
+           worker's cache has seen it, after wait seconds, no more writes
+           reach their rows
+        2. their rows are copied, again if they changed meanwhile
+        3. the directory points at the new shards, the workers still reading
+           from the old ones for wait seconds
+        4. their rows are deleted from the old shards
+
+        :param list moves: Tuples of user_id, shard and the shard to move to
+        :param float wait: Seconds a worker may go without seeing a change of
+        the directory, plus the time the longest write request takes
+        :return: The number of users moved
+    """
+    user_ids = [user_id for user_id, _, _ in moves]
+    _update_directory(user_ids, moving=True)
+    time.sleep(wait)
+    try:
+        for user_id, source, target in moves:
+            for _ in range(COPY_ATTEMPTS):
+                copied = _copy_user(user_id, source, target)
+                with _engine(source).connect() as connection:
+                    if _fingerprint(connection, user_id) == copied:
+                        break
+            else:
+                raise RuntimeError(f'The rows of user {user_id} kept '
+                                   f'changing on {source or "the primary"}')
+    except Exception:
+        _update_directory(user_ids, moving=False)
+        raise
+    for target in {target for _, _, target in moves}:
+        _update_directory([user_id for user_id, _, to in moves
+                           if to == target], shard=target, moving=False)
+    time.sleep(wait)
+    for user_id, source, _ in moves:
+        _delete_user(user_id, source)
+    return len(moves)
+
+
+def rebalance(batch_size=100, wait=None, dry_run=False, log=print):
+    """ Moves every user the ring places on another shard than the
+        directory's, batch_size users at a time
+
+        :param int batch_size: Users moved together
+        :param float wait: Seconds waited for the workers to see the
+        directory change, SHARD_DIRECTORY_CACHE_SECONDS and one more by
+        default
+        :param bool dry_run: Lists the moves without making them
+        :param object log: Called with a line about each batch
+        :return: The number of users moved, or to move with dry_run
+    """
+    router = current_app.extensions['shard_router']
+    if wait is None:
+        wait = router.cache_seconds + 1
+    moved = 0
+    last_id = 0
+    while True:
+        with _engine(None).connect() as connection:
+            rows = connection.execute(
+                select([USERS.c.user_id, USERS.c.shard]).where(
+                    USERS.c.user_id > last_id).order_by(
+                        USERS.c.user_id).limit(batch_size)).fetchall()
+        if not rows:
+            return moved
+        last_id = rows[-1][0]
+        moves = [(user_id, shard, router.ring.node_for(user_id))
+                 for user_id, shard in rows
+                 if router.ring.node_for(user_id) != shard]
+        if not moves:
+            continue
+        if not dry_run:
+            move_users(moves, wait)
+        moved += len(moves)
+        log(f'{"Would move" if dry_run else "Moved"} {len(moves)} users, '
+            f'up to user {last_id}')
+
+
+def init_shard_schemas(migrate):
+    """ Migrates every shard to the primary's schema and seeds id_blocks
+        past the ids any database has handed out
+
+        :param object migrate: Called in turn with each shard as the app's
+        database, e.g. flask_migrate.upgrade
+    """
+    app = current_app._get_current_object()
+    primary = app.config['SQLALCHEMY_DATABASE_URI']
+    try:
+        for shard in current_app.extensions['shard_router'].shards:
+            app.config['SQLALCHEMY_DATABASE_URI'] = (
+                app.config['SQLALCHEMY_BINDS'][shard])
+            migrate()
+    finally:
+        app.config['SQLALCHEMY_DATABASE_URI'] = primary
+    seed_id_blocks()
+
+
+def seed_id_blocks():
+    ''' Sets each sharded table's next id past the largest one in use '''
+    router = current_app.extensions['shard_router']
+    for table in USER_TABLES:
+        pk = table.primary_key.columns.values()[0]
+        largest = 0
+        for shard in [None] + list(router.shards):
+            with _engine(shard).connect() as connection:
+                largest = max(largest, connection.execute(
+                    select([func.max(pk)])).scalar() or 0)
+        with _engine(None).begin() as connection:
+            next_id = connection.execute(select([ID_BLOCKS.c.next_id]).where(
+                ID_BLOCKS.c.name == table.name)).scalar()
+            if next_id is None:
+                connection.execute(ID_BLOCKS.insert().values(
+                    name=table.name, next_id=largest + 1))
+            elif next_id <= largest:
+                connection.execute(ID_BLOCKS.update().where(
+                    ID_BLOCKS.c.name == table.name).values(
+                        next_id=largest + 1))
+
+
+def parse_shards(value):
+    """ Parses SHARD_DATABASE_URLS
+
+        :param str value: Comma separated name=URI pairs
+        :return: A dict of the URIs by shard name
+    """
+    shards = {}
+    for pair in value.split(','):
+        if not pair.strip():
+            continue
+        name, separator, url = pair.partition('=')
+        if not separator or not name.strip() or not url.strip():
+            raise ValueError(f'{pair.strip()} is not a shard, name one '
+                             'with name=URI')
+        shards[name.strip()] = url.strip()
+    return shards
+
+
+def init_sharding(app):
+    ''' Adds the binds of SHARD_DATABASE_URLS and routes the users' rows to
+        them, if there are any
+    '''
+    shards = parse_shards(app.config.get('SHARD_DATABASE_URLS', ''))
+    if not shards:
+        return
+    binds = dict(app.config.get('SQLALCHEMY_BINDS') or {})
+    binds.update(shards)
+    app.config['SQLALCHEMY_BINDS'] = binds
+    app.extensions['shard_router'] = ShardRouter(
+        sorted(shards),
+        HashRing(sorted(shards), app.config.get('SHARD_RING_REPLICAS', 64)),
+        cache_seconds=app.config.get('SHARD_DIRECTORY_CACHE_SECONDS', 5),
+        cache_size=app.config.get('SHARD_DIRECTORY_CACHE_SIZE', 10000),
+        block_size=app.config.get('SHARD_ID_BLOCK_SIZE', 100))
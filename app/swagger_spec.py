@@ -0,0 +1,71 @@
+''' This script serves the Swagger specs of the APIs from a file.
+
+    flask-restplus builds an API's spec from its namespaces, models and
+    parsers on the first GET of swagger.json in every worker. The specs can
+    instead be written once at build time, with
+    python manage.py swagger -o instance/swagger.json, and loaded from
+    SWAGGER_SPEC_FILE when the app is created. The file records the app's
+    URL rules, a file written before endpoints were added or removed is
+    ignored and the specs are built as before.
+'''
+
+import json
+import os
+
+from flask import current_app, has_app_context
+from flask_restplus import Api as BaseApi
+from flask_restplus.swagger import Swagger
+
+
+class Api(BaseApi):
+    ''' An Api serving its spec from the app's spec file when it has one '''
+
+    @property
+    def __schema__(self):
+        if has_app_context():
+            specs = current_app.extensions.get('swagger_specs', {})
+            if self.blueprint.name in specs:
+                return specs[self.blueprint.name]
+        return super().__schema__
+
+
+def _rules(app):
+    # a set, restplus repeats rules on the apps created after the first
+    return sorted({f'{rule.rule} {",".join(sorted(rule.methods))}'
+                   for rule in app.url_map.iter_rules()})
+
+
+def build_specs(app):
+    """ Builds the spec of each API the app serves
+
+        :param object app: The app, with its blueprints registered
+        :return: A dict of the app's URL rules and the specs by blueprint name
+    """
+    from .apis import api, api_2
+
+    with app.test_request_context():
+        specs = {an_api.blueprint.name: Swagger(an_api).as_dict()
+                 for an_api in (api, api_2)}
+    return {'rules': _rules(app), 'specs': specs}
+
+
+def write_specs(app, path):
+    ''' Writes the specs of the app's APIs to a file SWAGGER_SPEC_FILE can
+        point to
+    '''
+    with open(path, 'w') as spec_file:
+        json.dump(build_specs(app), spec_file, sort_keys=True)
+
+
+def init_swagger_specs(app):
+    ''' Loads the specs from SWAGGER_SPEC_FILE, if it is set and current '''
+    path = app.config.get('SWAGGER_SPEC_FILE')
+    if not path or not os.path.exists(path):
+        return
+    with open(path) as spec_file:
+        document = json.load(spec_file)
+    if document.get('rules') != _rules(app):
+        app.logger.warning('%s was written for other endpoints, the Swagger '
+                           'specs are built instead', path)
+        return
+    app.extensions['swagger_specs'] = document['specs']
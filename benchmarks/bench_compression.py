@@ -0,0 +1,62 @@
+''' This script compares response sizes and compression CPU time for the
+    swagger spec, a page of categories and a single recipe, raw, gzipped at
+    a few levels and brotli encoded when brotli is installed.
+
+    Run it from the project root: python -m benchmarks.bench_compression
+'''
+
+import gzip
+import json
+import timeit
+
+from app import create_app
+from app.compression import brotli
+from app.serializers import dump_category, dump_recipe
+from benchmarks.bench_serializers import make_page
+
+NUMBER = 200
+GZIP_LEVELS = (1, 6, 9)
+BROTLI_LEVELS = (1, 4, 11)
+
+
+def payloads():
+    ''' Returns the bodies to compress, keyed by name '''
+    app = create_app('development')
+    app.config['COMPRESS_ENABLED'] = False
+    with app.test_client() as client:
+        spec = client.get('/api/v1/swagger.json').data
+    categories = make_page()
+    page = {'categories': [dump_category(c) for c in categories],
+            'nextCursor': None}
+    return {'swagger spec': spec,
+            'categories page': json.dumps(page).encode('utf-8'),
+            'single recipe': json.dumps(
+                dump_recipe(categories[0].recipes[0])).encode('utf-8')}
+
+
+def bench(label, data, func):
+    ''' Prints the compressed size and the time func takes per call '''
+    size = len(func(data))
+    seconds = min(timeit.repeat(lambda: func(data), number=NUMBER, repeat=3))
+    per_call = seconds / NUMBER * 1e6
+    print(f'  {label:<12} {size:8d} bytes {size / len(data):6.1%} '
+          f'{per_call:10.1f} us')
+
+
+def main():
+    for name, data in payloads().items():
+        print(f'{name}: {len(data)} bytes raw')
+        for level in GZIP_LEVELS:
+            bench(f'gzip -{level}', data,
+                  lambda body, level=level: gzip.compress(body, level))
+        if brotli is None:
+            print('  brotli is not installed')
+            continue
+        for level in BROTLI_LEVELS:
+            bench(f'br -{level}', data,
+                  lambda body, level=level: brotli.compress(
+                      body, quality=level))
+
+
+if __name__ == '__main__':
+    main()
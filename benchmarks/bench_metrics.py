@@ -0,0 +1,75 @@
+''' This script measures the overhead metrics add to a request and to each
+    SQL statement, and compares a request with metrics on and off.
+
+    Run it from the project root: python -m benchmarks.bench_metrics
+'''
+
+import timeit
+
+from instance.config import app_config
+
+from app import create_app
+from app.db import db
+from app.metrics import (
+    _after_cursor_execute, _before_cursor_execute, _finish_request,
+    _start_request)
+
+NUMBER = 20000
+
+
+class FakeConnection(object):
+    ''' Stands in for the Connection the cursor events are passed '''
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.info = {}
+
+
+def bench(label, func, number=NUMBER):
+    ''' Prints the time func takes per call in microseconds '''
+    seconds = min(timeit.repeat(func, number=number, repeat=3))
+    per_call = seconds / number * 1e6
+    print(f'{label:<36} {per_call:10.2f} us')
+    return per_call
+
+
+def main():
+    app = create_app('production')
+    metrics = app.extensions['metrics']
+
+    with app.test_request_context('/api/v1/categories/'):
+        def a_request():
+            _start_request(metrics)
+            _finish_request(metrics, 200)
+        bench('request hooks', a_request)
+
+        connection = FakeConnection(db.engine)
+        args = (connection, None, 'SELECT 1', (), None, False)
+
+        def a_statement():
+            _before_cursor_execute(*args)
+            _after_cursor_execute(*args)
+        _start_request(metrics)
+        bench('statement hooks', a_statement)
+        _finish_request(metrics, 200)
+
+    app_config['production'].METRICS_ENABLED = False
+    try:
+        without = create_app('production').test_client()
+    finally:
+        app_config['production'].METRICS_ENABLED = True
+    clients = {'with metrics': app.test_client(), 'without metrics': without}
+    # the apps take turns, so neither one is measured on a quieter machine
+    best = dict.fromkeys(clients, float('inf'))
+    for _ in range(5):
+        for label, client in clients.items():
+            seconds = timeit.timeit(lambda: client.get('/api/v2/hello/'),
+                                    number=1000)
+            best[label] = min(best[label], seconds / 1000 * 1e6)
+    for label, per_call in best.items():
+        print(f'{"GET /api/v2/hello/ " + label:<36} {per_call:10.2f} us')
+    print(f'difference: '
+          f'{best["with metrics"] - best["without metrics"]:.1f} us')
+
+if __name__ == '__main__':
+    main()
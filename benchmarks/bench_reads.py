@@ -0,0 +1,308 @@
+''' This script compares the read path served by gevent workers with sync
+    workers.
+
+    It seeds a database and serves the app with gunicorn twice, with sync
+    workers and with gevent workers taking only reads (see app/green.py).
+    Each server in turn gets the same GETs of categories and recipes from
+    many concurrent clients. The report has each server's throughput,
+    latency percentiles and failures, and lists the sampled requests the
+    servers answered with a different status or JSON body, and the
+    connection pool counters of a worker of each server, read from /metrics:
+    the checkouts that timed out and the time spent waiting tell if the
+    gevent workers' pool (GREEN_POOL_SIZE and GREEN_MAX_OVERFLOW) holds the
+    requests in flight.
+
+    Run it from the project root against Postgres, whose queries the gevent
+    workers wait on without blocking (SQLite's block the event loop):
+
+        python -m benchmarks.bench_reads \
+            --database postgresql://localhost/bench_db
+
+    It needs gunicorn and gevent installed. The database is emptied first
+    and the response cache is off, so every request reaches the database.
+'''
+
+import argparse
+import asyncio
+import http.client
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+
+from app.db import db
+from benchmarks.load import (
+    PASSWORD, PERCENTILES, _percentile, bench_app, seed)
+
+SERVERS = {
+    'sync': [],
+    # a connection is only read once the loop gets to it, the keep-alive
+    # timeout would reset the ones waiting behind a burst
+    'gevent': ['-k', 'gevent', '--keep-alive', '30'],
+}
+# gunicorn's console script, run by this interpreter
+GUNICORN = 'from gunicorn.app.wsgiapp import run; run()'
+# requests checked for the same status and body on both servers
+SAMPLE_SIZE = 100
+POOL_METRICS = 'app_db_pool_'
+
+
+def _free_port():
+    with socket.socket() as a_socket:
+        a_socket.bind(('127.0.0.1', 0))
+        return a_socket.getsockname()[1]
+
+
+def serve(name, database, workers, connections, pool_size, max_overflow):
+    """ Starts gunicorn serving the app on a free port
+
+        :param str name: sync or gevent
+        :param str database: The SQLAlchemy URI the app uses
+        :param int workers: Worker processes
+        :param int connections: Requests a gevent worker takes at once
+        :param int pool_size: Connections a gevent worker keeps open
+        :param int max_overflow: Connections a gevent worker may open past
+        pool_size
+        :return: The gunicorn process and its port
+    """
+    port = _free_port()
+    # the shards and replicas of the environment do not have the seeded rows
+    env = dict(os.environ, FLASK_CONFIG='production', DATABASE_URL=database,
+               RESPONSE_CACHE_BACKEND='off', READ_ONLY='0',
+               SHARD_DATABASE_URLS='', REPLICA_DATABASE_URLS='',
+               GREEN_POOL_SIZE=str(pool_size),
+               GREEN_MAX_OVERFLOW=str(max_overflow))
+    if name == 'gevent':
+        env['READ_ONLY'] = '1'
+    process = subprocess.Popen(
+        [sys.executable, '-c', GUNICORN, '-w', str(workers),
+         '-b', f'127.0.0.1:{port}', '--backlog', '4096',
+         '--worker-connections', str(connections), *SERVERS[name],
+         'wsgi:app'], env=env, stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL)
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port)
+            connection.request('GET', '/api/v2/hello/')
+            if connection.getresponse().status == 200:
+                return process, port
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f'The {name} server did not start')
+
+
+def log_in(port, username):
+    ''' Returns an access token of a seeded user '''
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    connection.request(
+        'POST', '/api/v1/auth/login/',
+        json.dumps({'username': username, 'password': PASSWORD}),
+        {'Content-Type': 'application/json'})
+    return json.loads(connection.getresponse().read())['access_token']
+
+
+def workload(seeded, tokens, clients, requests, seed_value):
+    ''' Lists every client's GETs, the same for both servers '''
+    chooser = random.Random(seed_value)
+    reads = []
+    for username, owned in seeded:
+        with_recipes = [(category_id, recipe_id)
+                        for category_id, recipe_ids in owned.items()
+                        for recipe_id in recipe_ids]
+        category_id, recipe_id = chooser.choice(with_recipes)
+        for path in ('/api/v1/categories/', '/api/v1/categories/?page=2',
+                     f'/api/v1/categories/{category_id}/',
+                     '/api/v1/recipes/', '/api/v1/recipes/?cursor=',
+                     f'/api/v1/recipes/{category_id}/',
+                     f'/api/v1/recipes/{category_id}/{recipe_id}/'):
+            reads.append((path, tokens[username]))
+    return [[chooser.choice(reads) for _ in range(requests)]
+            for _ in range(clients)]
+
+
+async def fetch(port, path, token):
+    ''' Sends a GET over a new connection, returns the status and body '''
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        writer.write(f'GET {path} HTTP/1.0\r\nHost: 127.0.0.1\r\n'
+                     f'Authorization: Bearer {token}\r\n\r\n'.encode('ascii'))
+        data = await reader.read()
+    finally:
+        writer.close()
+    head, _, body = data.partition(b'\r\n\r\n')
+    return int(head.split(b' ', 2)[1]), body
+
+
+async def _client(port, reads, latencies, statuses):
+    for path, token in reads:
+        started = time.perf_counter()
+        try:
+            status, _ = await fetch(port, path, token)
+        except (OSError, IndexError, ValueError):
+            status = 'failed'
+        latencies.append(time.perf_counter() - started)
+        statuses[str(status)] += 1
+
+
+async def _clients(port, clients, latencies, statuses):
+    # gathered on the running loop, gather no longer takes a loop
+    await asyncio.gather(*(_client(port, reads, latencies, statuses)
+                           for reads in clients))
+
+
+def load(port, clients):
+    """ Runs every client's GETs concurrently against a server
+
+        :param int port: The server's port
+        :param list clients: Each client's (path, token) GETs, sent in turn
+        :return: The throughput, latency percentiles and statuses
+    """
+    latencies = []
+    statuses = Counter()
+    loop = asyncio.new_event_loop()
+    started = time.perf_counter()
+    try:
+        loop.run_until_complete(
+            _clients(port, clients, latencies, statuses))
+    finally:
+        loop.close()
+    duration = time.perf_counter() - started
+    latencies.sort()
+    summary = {
+        'requests': len(latencies),
+        'failures': sum(count for status, count in statuses.items()
+                        if status == 'failed' or status >= '500'),
+        'statuses': dict(statuses),
+        'throughput_rps': round(len(latencies) / duration, 2),
+        'latency_ms': {f'p{percentile}': round(
+            _percentile(latencies, percentile) * 1000, 2)
+            for percentile in PERCENTILES},
+        'duration_seconds': round(duration, 2),
+    }
+    summary['latency_ms']['max'] = round(latencies[-1] * 1000, 2)
+    return summary
+
+
+def pool_metrics(port):
+    ''' Returns the connection pool counters of the worker answering '''
+    connection = http.client.HTTPConnection('127.0.0.1', port)
+    connection.request('GET', '/metrics')
+    samples = {}
+    for line in connection.getresponse().read().decode('utf-8').splitlines():
+        if line.startswith(POOL_METRICS):
+            name, value = line.split()
+            samples[name[len(POOL_METRICS):]] = float(value)
+    return samples
+
+
+def _decoded(status, body):
+    try:
+        return status, json.loads(body.decode('utf-8'))
+    except ValueError:
+        return status, body
+
+
+def differences(ports, reads):
+    ''' Lists the sampled GETs the servers answered differently '''
+    loop = asyncio.new_event_loop()
+    different = []
+    try:
+        for path, token in reads:
+            # decoded, the order of the keys differs between processes
+            answers = [_decoded(*loop.run_until_complete(
+                fetch(port, path, token))) for port in ports]
+            if answers[0] != answers[1]:
+                different.append(path)
+    finally:
+        loop.close()
+    return different
+
+
+def run(database=None, workers=2, connections=2000, pool_size=20,
+        max_overflow=20, users=20, categories=20, recipes=10, clients=1000,
+        requests=5, seed_value=0):
+    """ Seeds the database, loads both servers and returns the report
+
+        :param str database: A SQLAlchemy URI, a temporary SQLite file if None
+        :param int workers: Worker processes of each server
+        :param int connections: Requests a gevent worker takes at once
+        :param int pool_size: Connections a gevent worker keeps open
+        :param int max_overflow: Connections a gevent worker may open past
+        pool_size
+        :param int users: Users seeded
+        :param int categories: Categories seeded per user
+        :param int recipes: Recipes seeded per category
+        :param int clients: Concurrent clients
+        :param int requests: GETs each client sends, one after the other
+        :param int seed_value: Seeds the clients' choices
+        :return: The report as a dict
+    """
+    if database is None:
+        database = f'sqlite:///{tempfile.mkdtemp()}/bench.db'
+    app = bench_app('production', database)
+    with app.app_context():
+        seeded = seed(users, categories, recipes)
+        dialect = db.engine.dialect.name
+        db.session.remove()
+        db.engine.dispose()
+
+    processes = {}
+    try:
+        for name in SERVERS:
+            processes[name] = serve(name, database, workers, connections,
+                                    pool_size, max_overflow)
+        tokens = {username: log_in(processes['sync'][1], username)
+                  for username, _ in seeded}
+        reads = workload(seeded, tokens, clients, requests, seed_value)
+        report = {name: load(port, reads)
+                  for name, (_, port) in processes.items()}
+        for name, (_, port) in processes.items():
+            report[name]['pool'] = pool_metrics(port)
+        sample = random.Random(seed_value).sample(
+            [read for client in reads for read in client],
+            min(SAMPLE_SIZE, clients * requests))
+        report['different'] = differences(
+            [port for _, port in processes.values()], sample)
+    finally:
+        for process, _ in processes.values():
+            process.terminate()
+            process.wait()
+    report['settings'] = {
+        'database': dialect, 'workers': workers, 'connections': connections,
+        'pool_size': pool_size, 'max_overflow': max_overflow,
+        'users': users, 'categories': categories, 'recipes': recipes,
+        'clients': clients, 'requests': requests, 'seed': seed_value}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--database', help='SQLAlchemy URI of a database to '
+                        'empty and seed, a temporary SQLite file by default')
+    parser.add_argument('-w', '--workers', type=int, default=2)
+    parser.add_argument('--connections', type=int, default=2000,
+                        help='requests a gevent worker takes at once')
+    parser.add_argument('--pool-size', type=int, default=20,
+                        help='connections a gevent worker keeps open')
+    parser.add_argument('--max-overflow', type=int, default=20,
+                        help='connections a gevent worker may open past '
+                        'the pool size')
+    parser.add_argument('-u', '--users', type=int, default=20)
+    parser.add_argument('--categories', type=int, default=20)
+    parser.add_argument('--recipes', type=int, default=10)
+    parser.add_argument('-c', '--clients', type=int, default=1000)
+    parser.add_argument('-n', '--requests', type=int, default=5)
+    parser.add_argument('--seed', dest='seed_value', type=int, default=0)
+    report = run(**vars(parser.parse_args()))
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
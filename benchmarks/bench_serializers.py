@@ -0,0 +1,65 @@
+''' This script compares the compiled serializers against the marshmallow
+    schemas on a 10 item page of recipes and of categories.
+
+    Run it from the project root: python -m benchmarks.bench_serializers
+'''
+
+import timeit
+from datetime import datetime
+
+from app.models.category import Category
+from app.models.recipe import Recipe
+from app.serializers import (
+    CategorySchema, RecipeSchema, dump_category, dump_recipe)
+
+PAGE_SIZE = 10
+RECIPES_PER_CATEGORY = 3
+NUMBER = 2000
+
+
+def make_page():
+    ''' Builds a page of categories, each holding a few recipes, in memory '''
+    now = datetime.now()
+    categories = []
+    for category_id in range(1, PAGE_SIZE + 1):
+        a_category = Category(f'category {category_id}', 'description', 1)
+        a_category.category_id = category_id
+        a_category.date_created = a_category.date_modified = now
+        for index in range(RECIPES_PER_CATEGORY):
+            a_recipe = Recipe(f'recipe {index}', 'flour, milk, eggs',
+                              category_id, 1)
+            a_recipe.recipe_id = category_id * RECIPES_PER_CATEGORY + index
+            a_recipe.date_created = a_recipe.date_modified = now
+            a_category.recipes.append(a_recipe)
+        categories.append(a_category)
+    return categories
+
+
+def bench(label, func):
+    ''' Prints the time func takes per call in microseconds '''
+    seconds = min(timeit.repeat(func, number=NUMBER, repeat=3))
+    per_call = seconds / NUMBER * 1e6
+    print(f'{label:<32} {per_call:10.1f} us')
+    return per_call
+
+
+def main():
+    categories = make_page()
+    recipes = categories[0].recipes * 4
+    recipes = recipes[:PAGE_SIZE]
+    recipes_schema = RecipeSchema(many=True)
+    categories_schema = CategorySchema(many=True)
+
+    slow = bench('RecipeSchema(many=True).dump',
+                 lambda: recipes_schema.dump(recipes))
+    fast = bench('dump_recipe', lambda: [dump_recipe(r) for r in recipes])
+    print(f'recipes page speedup: {slow / fast:.1f}x')
+    slow = bench('CategorySchema(many=True).dump',
+                 lambda: categories_schema.dump(categories))
+    fast = bench('dump_category',
+                 lambda: [dump_category(c) for c in categories])
+    print(f'categories page speedup: {slow / fast:.1f}x')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,247 @@
+''' This script measures how fast the app starts and what a worker holds.
+
+    Each run starts a fresh interpreter, with nothing imported, which
+    imports the app package, creates the app and serves the first GET of
+    the Swagger spec, as a worker does after it is forked. The report has
+    the median of each step, the modules loaded and the peak RSS, the time
+    importing manage.py takes before any command runs, and the modules
+    slowest to import, by their own time without the modules they import.
+
+    With --gunicorn it also serves wsgi:app with gunicorn, with and without
+    --preload, and reports the memory of each worker from
+    /proc/<pid>/smaps_rollup (Linux): its RSS, its proportional share of the
+    pages shared with the master and its own pages (USS).
+
+    Run it from the project root:
+
+        python -m benchmarks.bench_startup --runs 5 --gunicorn
+'''
+
+import argparse
+import http.client
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+from benchmarks.bench_reads import GUNICORN, _free_port
+
+# runs in the fresh interpreter, prints its measurements as JSON
+PROBE = '''
+import importlib._bootstrap as bootstrap
+import json, resource, sys, time
+
+own = {}
+children = [0.0]
+find_and_load = bootstrap._find_and_load
+
+
+def timed(name, import_):
+    # every import of a module not loaded yet goes through here
+    children.append(0.0)
+    started = time.perf_counter()
+    try:
+        return find_and_load(name, import_)
+    finally:
+        elapsed = time.perf_counter() - started
+        own[name] = elapsed - children.pop()
+        children[-1] += elapsed
+
+
+bootstrap._find_and_load = timed
+started = time.perf_counter()
+import app
+imported = time.perf_counter()
+application = app.create_app(sys.argv[1])
+created = time.perf_counter()
+status = application.test_client().get('/api/v1/swagger.json').status_code
+served = time.perf_counter()
+print(json.dumps({
+    'import_ms': (imported - started) * 1000,
+    'create_app_ms': (created - imported) * 1000,
+    'first_request_ms': (served - created) * 1000,
+    'total_ms': (served - started) * 1000,
+    'status': status,
+    'modules': len(sys.modules),
+    'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss,
+    'own_ms': {name: seconds * 1000 for name, seconds in own.items()},
+}))
+'''
+MANAGE_PROBE = '''
+import json, sys, time
+started = time.perf_counter()
+import manage
+print(json.dumps({'import_ms': (time.perf_counter() - started) * 1000,
+                  'modules': len(sys.modules)}))
+'''
+# memory of a process, in kB, from /proc/<pid>/smaps_rollup
+SMAPS = {'Rss': 'rss_kb', 'Pss': 'pss_kb', 'Private_Clean': 'uss_kb',
+         'Private_Dirty': 'uss_kb'}
+
+
+def _probe(code, config_name, *args):
+    env = dict(os.environ, FLASK_CONFIG=config_name)
+    output = subprocess.check_output(
+        [sys.executable, '-c', code, config_name, *args], env=env)
+    return json.loads(output.decode('utf-8'))
+
+
+def _median(values):
+    return round(statistics.median(values), 2)
+
+
+def cold_start(config_name, runs, top):
+    """ Times the import of the app, create_app and the first request in
+        fresh interpreters
+
+        :param str config_name: The configuration the app is created with
+        :param int runs: Interpreters started, the medians are reported
+        :param int top: Number of slowest modules listed
+        :return: The medians and the slowest modules
+    """
+    probes = [_probe(PROBE, config_name) for _ in range(runs)]
+    if any(probe['status'] != 200 for probe in probes):
+        raise RuntimeError('The Swagger spec could not be served')
+    report = {key: _median([probe[key] for probe in probes]) for key in (
+        'import_ms', 'create_app_ms', 'first_request_ms', 'total_ms',
+        'modules', 'max_rss_kb')}
+    names = set().union(*(probe['own_ms'] for probe in probes))
+    own = {name: _median([probe['own_ms'].get(name, 0) for probe in probes])
+           for name in names}
+    report['slowest_modules_ms'] = dict(sorted(
+        own.items(), key=lambda item: item[1], reverse=True)[:top])
+    manage = [_probe(MANAGE_PROBE, config_name) for _ in range(runs)]
+    report['manage'] = {key: _median([probe[key] for probe in manage])
+                        for key in ('import_ms', 'modules')}
+    return report
+
+
+def memory(pid):
+    ''' Reads the RSS, PSS and USS of a process, in kB '''
+    usage = dict.fromkeys(SMAPS.values(), 0)
+    with open(f'/proc/{pid}/smaps_rollup') as smaps:
+        for line in smaps:
+            field, _, value = line.partition(':')
+            if field in SMAPS:
+                usage[SMAPS[field]] += int(value.split()[0])
+    return usage
+
+
+def _children(pid):
+    children = []
+    for entry in os.listdir('/proc'):
+        try:
+            with open(f'/proc/{entry}/stat') as stat:
+                # the parent's pid follows the state, after the command
+                fields = stat.read().rsplit(')', 1)[1].split()
+        except (OSError, IndexError):
+            continue
+        if fields[1] == str(pid):
+            children.append(int(entry))
+    return children
+
+
+def _settled(pid, workers, deadline):
+    # the workers still booting are forked but have not loaded the app yet,
+    # wait for every worker and for their memory to stop growing
+    usages = None
+    while time.monotonic() < deadline:
+        time.sleep(0.5)
+        children = _children(pid)
+        if len(children) < workers:
+            continue
+        previous, usages = usages, [memory(child) for child in children]
+        if previous == usages:
+            return usages
+    raise RuntimeError('The gunicorn workers did not settle')
+
+
+def serve(config_name, workers, preload, requests):
+    """ Serves wsgi:app with gunicorn, sends it some requests and measures
+        the master and its workers
+
+        :param str config_name: The configuration the app is created with
+        :param int workers: Worker processes
+        :param bool preload: Creates the app in the master with --preload
+        :param int requests: GETs of the Swagger spec sent before measuring
+        :return: The master's and the mean worker's memory and boot time
+    """
+    port = _free_port()
+    env = dict(os.environ, FLASK_CONFIG=config_name)
+    options = ['--preload'] if preload else []
+    started = time.perf_counter()
+    process = subprocess.Popen(
+        [sys.executable, '-c', GUNICORN, '-w', str(workers),
+         '-b', f'127.0.0.1:{port}', *options, 'wsgi:app'], env=env,
+        stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    try:
+        deadline = time.monotonic() + 30
+        while True:
+            try:
+                connection = http.client.HTTPConnection('127.0.0.1', port)
+                connection.request('GET', '/api/v2/hello/')
+                if connection.getresponse().status == 200:
+                    break
+            except OSError:
+                if time.monotonic() > deadline:
+                    raise RuntimeError('gunicorn did not start')
+                time.sleep(0.05)
+        ready = time.perf_counter() - started
+        for _ in range(requests):
+            connection = http.client.HTTPConnection('127.0.0.1', port)
+            connection.request('GET', '/api/v1/swagger.json')
+            connection.getresponse().read()
+        usages = _settled(process.pid, workers, time.monotonic() + 30)
+        report = {'ready_ms': round(ready * 1000, 2),
+                  'master': memory(process.pid), 'workers': len(usages),
+                  'worker': {key: round(statistics.mean(
+                      usage[key] for usage in usages)) for key in usages[0]}}
+    finally:
+        process.terminate()
+        process.wait()
+    return report
+
+
+def run(config_name='production', runs=5, top=15, gunicorn=False,
+        workers=4, requests=20):
+    """ Measures the cold start and, with gunicorn, the workers' memory
+
+        :param str config_name: The configuration the app is created with
+        :param int runs: Fresh interpreters timed
+        :param int top: Number of slowest modules listed
+        :param bool gunicorn: Also serves the app with gunicorn
+        :param int workers: gunicorn's worker processes
+        :param int requests: GETs sent to gunicorn before measuring
+        :return: The report as a dict
+    """
+    report = {'cold_start': cold_start(config_name, runs, top)}
+    if gunicorn:
+        report['gunicorn'] = {
+            'fork': serve(config_name, workers, False, requests),
+            'preload': serve(config_name, workers, True, requests)}
+    report['settings'] = {
+        'config': config_name, 'runs': runs, 'workers': workers,
+        'python': sys.version.split()[0],
+        'swagger_spec_file': os.environ.get('SWAGGER_SPEC_FILE')}
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--config', dest='config_name', default='production')
+    parser.add_argument('-r', '--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=15,
+                        help='slowest modules listed')
+    parser.add_argument('--gunicorn', action='store_true',
+                        help='also measure gunicorn workers, with and '
+                        'without --preload')
+    parser.add_argument('-w', '--workers', type=int, default=4)
+    parser.add_argument('-n', '--requests', type=int, default=20)
+    report = run(**vars(parser.parse_args()))
+    print(json.dumps(report, indent=2, sort_keys=True))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,429 @@
+''' This script load tests the API end to end.
+
+    It seeds a data set, serves the app over HTTP on a local port and has
+    many concurrent clients run a mix of reads and writes against it, then
+    reports each endpoint's throughput, latency percentiles and queries per
+    request as JSON, so two commits can be compared.
+
+    Run it through manage.py: python manage.py bench --help
+'''
+
+import http.client
+import json
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from collections import Counter, defaultdict
+from datetime import datetime
+from urllib.parse import urlencode
+
+from flask import g, has_request_context
+from sqlalchemy import event
+from werkzeug.serving import WSGIRequestHandler, make_server
+
+from app import create_app
+from app.db import ROUTERS, db
+from app.models.category import Category
+from app.models.recipe import Recipe
+from app.models.user import User
+from app.password_pool import hash_password
+
+PASSWORD = 'password'
+WORDS = ('pancake', 'soup', 'salad', 'bread', 'stew', 'curry', 'pie', 'cake')
+# the operations a client picks from, by Client method name, and their weights
+WORKLOAD = {
+    'list_categories': 12, 'search_categories': 6, 'page_categories': 6,
+    'get_category': 10, 'list_recipes': 12, 'list_category_recipes': 10,
+    'search_recipes': 6, 'page_recipes': 6, 'get_recipe': 12,
+    'create_category': 4, 'edit_category': 3, 'create_recipe': 6,
+    'edit_recipe': 4, 'delete_recipe': 2, 'register': 1,
+}
+PERCENTILES = (50, 95, 99)
+
+
+def letters(number):
+    ''' Spells a number in letters, names only take letters and spaces '''
+    word = ''
+    while True:
+        number, digit = divmod(number, 26)
+        word += chr(ord('a') + digit)
+        if not number:
+            return word
+
+
+def bench_app(config_name, database):
+    """ Creates an app whose every statement runs on the bench's database.
+        The shards and replicas of SHARD_DATABASE_URLS and
+        REPLICA_DATABASE_URLS are left out, the seeded rows are not on them.
+
+        :param str config_name: The configuration the app is created with
+        :param str database: The SQLAlchemy URI of the bench's database
+        :return: The app
+    """
+    app = create_app(config_name)
+    app.config['SQLALCHEMY_DATABASE_URI'] = database
+    app.config['SQLALCHEMY_BINDS'] = None
+    for name in ROUTERS:
+        app.extensions.pop(name, None)
+    return app
+
+
+def seed(users, categories, recipes):
+    """ Empties the database and adds users with their categories and recipes,
+        all the users share one password hash
+
+        :param int users: Number of users
+        :param int categories: Categories per user
+        :param int recipes: Recipes per category
+        :return: Per user the username and {category_id: [recipe_id]}
+    """
+    db.drop_all()
+    db.create_all()
+    now = datetime.now()
+    hashed = hash_password(PASSWORD)
+    db.session.execute(User.__table__.insert(), [
+        {'username': f'bench{number}', 'email': f'bench{number}@bench.com',
+         'password': hashed} for number in range(users)])
+    user_ids = dict(db.session.query(User.user_id, User.username))
+    db.session.execute(Category.__table__.insert(), [
+        {'category_name': f'{WORDS[number % len(WORDS)]} {letters(number)}',
+         'description': 'seeded', 'created_by': user_id,
+         'date_created': now, 'date_modified': now}
+        for user_id in user_ids for number in range(categories)])
+    category_rows = db.session.query(
+        Category.category_id, Category.created_by).all()
+    db.session.execute(Recipe.__table__.insert(), [
+        {'recipe_name': f'{WORDS[number % len(WORDS)]} {letters(number)}',
+         'ingredients': 'flour, eggs, milk', 'category_id': category_id,
+         'created_by': user_id, 'date_created': now, 'date_modified': now}
+        for category_id, user_id in category_rows
+        for number in range(recipes)])
+    db.session.commit()
+    data = {user_id: {} for user_id in user_ids}
+    for category_id, user_id in category_rows:
+        data[user_id][category_id] = []
+    for recipe_id, category_id, user_id in db.session.query(
+            Recipe.recipe_id, Recipe.category_id, Recipe.created_by):
+        data[user_id][category_id].append(recipe_id)
+    return [(user_ids[user_id], owned) for user_id, owned in data.items()]
+
+
+def count_queries(app):
+    ''' Adds the number of statements a request ran to its response, as the
+        X-Query-Count header
+    '''
+    with app.app_context():
+        engine = db.engine
+
+    @event.listens_for(engine, 'before_cursor_execute')
+    def count(*args):
+        if has_request_context():
+            g.bench_queries = g.get('bench_queries', 0) + 1
+
+    @app.after_request
+    def add_header(response):
+        response.headers['X-Query-Count'] = str(g.get('bench_queries', 0))
+        return response
+
+
+class Client(object):
+    ''' A user of the API running a random mix of operations.
+
+        :param int port: The port the app is served on
+        :param str username: The seeded user to log in as
+        :param dict owned: The user's {category_id: [recipe_id]}
+        :param object results: The Results the requests are recorded in
+        :param int number: Tells the client apart from the others and seeds
+        its choices, for repeatable runs
+    '''
+
+    def __init__(self, port, username, owned, results, number):
+        self.port = port
+        self.username = username
+        self.owned = {category_id: list(recipe_ids)
+                      for category_id, recipe_ids in owned.items()}
+        self.results = results
+        self.number = number
+        self.random = random.Random(number)
+        self.headers = {}
+        self.created = 0
+
+    def run(self, requests):
+        ''' Logs in and runs requests operations '''
+        status, body = self.request(
+            'login', 'POST', '/api/v1/auth/login/',
+            {'username': self.username, 'password': PASSWORD})
+        if status != 200:
+            return
+        self.headers = {'Authorization': 'Bearer ' + body['access_token']}
+        names = list(WORKLOAD)
+        weights = [WORKLOAD[name] for name in names]
+        for _ in range(requests):
+            getattr(self, self.random.choices(names, weights)[0])()
+
+    def request(self, name, method, path, form=None, query=None):
+        ''' Sends a request and records its latency under name '''
+        body = urlencode(form).encode('utf-8') if form else None
+        headers = dict(self.headers)
+        if body:
+            headers['Content-Type'] = 'application/x-www-form-urlencoded'
+        if query:
+            path += '?' + urlencode(query)
+        connection = http.client.HTTPConnection('127.0.0.1', self.port)
+        started = time.perf_counter()
+        try:
+            connection.request(method, path, body, headers)
+            response = connection.getresponse()
+            data = response.read()
+        finally:
+            connection.close()
+        elapsed = time.perf_counter() - started
+        self.results.record(name, elapsed, response.status,
+                            int(response.getheader('X-Query-Count', 0)))
+        try:
+            return response.status, json.loads(data)
+        except ValueError:
+            return response.status, None
+
+    def new_name(self):
+        self.created += 1
+        return f'{self.random.choice(WORDS)} {letters(self.created)} new'
+
+    def a_category(self):
+        return self.random.choice(list(self.owned))
+
+    def a_recipe(self):
+        with_recipes = [category_id for category_id, recipe_ids
+                        in self.owned.items() if recipe_ids]
+        if not with_recipes:
+            return None, None
+        category_id = self.random.choice(with_recipes)
+        return category_id, self.random.choice(self.owned[category_id])
+
+    def list_categories(self):
+        self.request('list_categories', 'GET', '/api/v1/categories/',
+                     query={'page': self.random.randint(1, 3)})
+
+    def search_categories(self):
+        self.request('search_categories', 'GET', '/api/v1/categories/',
+                     query={'q': self.random.choice(WORDS)})
+
+    def page_categories(self):
+        self.request('page_categories', 'GET', '/api/v1/categories/',
+                     query={'cursor': ''})
+
+    def get_category(self):
+        self.request('get_category', 'GET',
+                     f'/api/v1/categories/{self.a_category()}/')
+
+    def list_recipes(self):
+        self.request('list_recipes', 'GET', '/api/v1/recipes/',
+                     query={'page': self.random.randint(1, 3)})
+
+    def list_category_recipes(self):
+        self.request('list_category_recipes', 'GET',
+                     f'/api/v1/recipes/{self.a_category()}/')
+
+    def search_recipes(self):
+        self.request('search_recipes', 'GET', '/api/v1/recipes/',
+                     query={'q': self.random.choice(WORDS)})
+
+    def page_recipes(self):
+        self.request('page_recipes', 'GET',
+                     f'/api/v1/recipes/{self.a_category()}/',
+                     query={'cursor': ''})
+
+    def get_recipe(self):
+        category_id, recipe_id = self.a_recipe()
+        if recipe_id is not None:
+            self.request('get_recipe', 'GET',
+                         f'/api/v1/recipes/{category_id}/{recipe_id}/')
+
+    def create_category(self):
+        status, body = self.request(
+            'create_category', 'POST', '/api/v1/categories/',
+            {'category_name': self.new_name(), 'description': 'created'})
+        if status == 201:
+            self.owned[body['category_id']] = []
+
+    def edit_category(self):
+        self.request('edit_category', 'PUT',
+                     f'/api/v1/categories/{self.a_category()}/',
+                     {'description': self.new_name()})
+
+    def create_recipe(self):
+        category_id = self.a_category()
+        status, body = self.request(
+            'create_recipe', 'POST', f'/api/v1/recipes/{category_id}/',
+            {'recipe_name': self.new_name(), 'ingredients': 'flour, water'})
+        if status == 201:
+            self.owned[category_id].append(body['recipe_id'])
+
+    def edit_recipe(self):
+        category_id, recipe_id = self.a_recipe()
+        if recipe_id is not None:
+            self.request('edit_recipe', 'PUT',
+                         f'/api/v1/recipes/{category_id}/{recipe_id}/',
+                         {'ingredients': 'flour, water, salt'})
+
+    def delete_recipe(self):
+        category_id, recipe_id = self.a_recipe()
+        if recipe_id is not None:
+            self.owned[category_id].remove(recipe_id)
+            self.request('delete_recipe', 'DELETE',
+                         f'/api/v1/recipes/{category_id}/{recipe_id}/')
+
+    def register(self):
+        self.created += 1
+        name = f'new_{letters(self.number)}_{self.created}'
+        self.request('register', 'POST', '/api/v1/auth/register/',
+                     {'username': name, 'password': PASSWORD,
+                      'email': f'{name}@bench.com'})
+
+
+class QuietHandler(WSGIRequestHandler):
+    ''' Serves requests without logging each one '''
+
+    def log_request(self, *args, **kwargs):
+        pass
+
+
+class Results(object):
+    ''' The latencies, statuses and query counts of every request '''
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._requests = defaultdict(list)
+
+    def record(self, name, seconds, status, queries):
+        with self._lock:
+            self._requests[name].append((seconds, status, queries))
+
+    def report(self, duration):
+        """ Summarizes the requests per operation
+
+            :param float duration: Seconds the workload ran for
+            :return: A dict of the totals and of each operation's numbers
+        """
+        operations = {}
+        total = 0
+        for name, requests in sorted(self._requests.items()):
+            latencies = sorted(seconds for seconds, _, _ in requests)
+            statuses = Counter(str(status) for _, status, _ in requests)
+            summary = {
+                'requests': len(requests),
+                'errors': sum(count for status, count in statuses.items()
+                              if status >= '500'),
+                'statuses': dict(statuses),
+                'throughput_rps': round(len(requests) / duration, 2),
+                'latency_ms': {f'p{percentile}': round(
+                    _percentile(latencies, percentile) * 1000, 2)
+                    for percentile in PERCENTILES},
+                'queries_per_request': round(
+                    sum(queries for _, _, queries in requests) /
+                    len(requests), 2),
+            }
+            summary['latency_ms']['max'] = round(latencies[-1] * 1000, 2)
+            operations[name] = summary
+            total += len(requests)
+        return {'requests': total,
+                'throughput_rps': round(total / duration, 2),
+                'operations': operations}
+
+
+def _percentile(ordered, percentile):
+    ''' The nearest-rank percentile of a sorted list '''
+    rank = max(int(round(percentile / 100 * len(ordered))) - 1, 0)
+    return ordered[min(rank, len(ordered) - 1)]
+
+
+def _commit():
+    try:
+        return subprocess.check_output(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            stderr=subprocess.DEVNULL).decode('ascii').strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(database=None, config_name='production', users=20, categories=20,
+        recipes=10, clients=16, requests=100, seed_value=0):
+    """ Seeds the database, runs the workload and returns the report.
+        The database is emptied first.
+
+        :param str database: A SQLAlchemy URI, a temporary SQLite file if None
+        :param str config_name: The configuration the app is created with
+        :param int users: Users seeded, each client logs in as one of them
+        :param int categories: Categories seeded per user
+        :param int recipes: Recipes seeded per category
+        :param int clients: Concurrent clients
+        :param int requests: Requests each client sends after logging in
+        :param int seed_value: Seeds the clients' choices
+        :return: The report as a dict
+    """
+    if database is None:
+        database = f'sqlite:///{tempfile.mkdtemp()}/bench.db'
+    app = bench_app(config_name, database)
+    with app.app_context():
+        seeded = seed(users, categories, recipes)
+        dialect = db.engine.dialect.name
+    count_queries(app)
+
+    server = make_server('127.0.0.1', 0, app, threaded=True,
+                         request_handler=QuietHandler)
+    serving = threading.Thread(target=server.serve_forever, daemon=True)
+    serving.start()
+    results = Results()
+    threads = []
+    for number in range(clients):
+        username, owned = seeded[number % len(seeded)]
+        client = Client(server.server_port, username, owned, results,
+                        seed_value + number)
+        threads.append(threading.Thread(target=client.run, args=(requests,)))
+    started = time.perf_counter()
+    try:
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+    finally:
+        duration = time.perf_counter() - started
+        server.shutdown()
+
+    report = results.report(duration)
+    report.update(
+        commit=_commit(), database=dialect, duration_seconds=round(duration, 2),
+        settings={'config': config_name, 'users': users,
+                  'categories': categories, 'recipes': recipes,
+                  'clients': clients, 'requests': requests,
+                  'seed': seed_value})
+    return report
+
+
+def compare(baseline, report):
+    """ Lists each operation's change in throughput and p95 latency against
+        a report from another run
+
+        :return: Lines of text, one per operation
+    """
+    lines = [f"{'operation':<24}{'rps':>10}{'change':>9}"
+             f"{'p95 ms':>10}{'change':>9}"]
+    for name, summary in report['operations'].items():
+        before = baseline['operations'].get(name)
+        if before is None:
+            continue
+        rps = summary['throughput_rps']
+        p95 = summary['latency_ms']['p95']
+        lines.append(
+            f"{name:<24}{rps:>10.1f}"
+            f"{_change(before['throughput_rps'], rps):>9}"
+            f"{p95:>10.1f}{_change(before['latency_ms']['p95'], p95):>9}")
+    return lines
+
+
+def _change(before, after):
+    if not before:
+        return 'n/a'
+    return f'{(after - before) / before:+.0%}'
@@ -16,21 +16,155 @@ class Config(object):
     else:
         SQLALCHEMY_DATABASE_URI = os.environ['DATABASE_URL']
 
+    # Connections each process keeps open, and how many more it may open
+    # under load. A worker holds at most SQLALCHEMY_POOL_SIZE +
+    # SQLALCHEMY_MAX_OVERFLOW, size workers against the database's limit.
+    SQLALCHEMY_POOL_SIZE = int(os.environ.get('SQLALCHEMY_POOL_SIZE', 5))
+    SQLALCHEMY_MAX_OVERFLOW = int(os.environ.get('SQLALCHEMY_MAX_OVERFLOW', 10))
+    # Seconds a request waits for a free connection before failing
+    SQLALCHEMY_POOL_TIMEOUT = int(os.environ.get('SQLALCHEMY_POOL_TIMEOUT', 10))
+    # Seconds after which a connection is replaced, under server timeouts
+    SQLALCHEMY_POOL_RECYCLE = int(
+        os.environ.get('SQLALCHEMY_POOL_RECYCLE', 1800))
+    # Ping connections when they are checked out, replacing dropped ones
+    SQLALCHEMY_POOL_PRE_PING = os.environ.get(
+        'SQLALCHEMY_POOL_PRE_PING', '1') == '1'
+    # Milliseconds a Postgres statement may run before it is cancelled,
+    # 0 for no limit
+    SQLALCHEMY_STATEMENT_TIMEOUT = int(
+        os.environ.get('SQLALCHEMY_STATEMENT_TIMEOUT', 30000))
+
+    # Seconds a worker may serve revocation checks from memory before
+    # polling the blacklisted table for tokens revoked by other workers
+    JWT_BLACKLIST_CACHE_SECONDS = int(
+        os.environ.get('JWT_BLACKLIST_CACHE_SECONDS', 5))
+    # Verified tokens each worker keeps, by their SHA-256, so a token's
+    # signature is only checked on its first request. They are dropped when
+    # the token expires, 0 turns the cache off.
+    JWT_DECODE_CACHE_SIZE = int(os.environ.get('JWT_DECODE_CACHE_SIZE', 10000))
+    # Users each worker keeps by identity, and the seconds before one is
+    # looked up again, i.e. how long a deleted user's token may still pass
+    JWT_USER_CACHE_SIZE = int(os.environ.get('JWT_USER_CACHE_SIZE', 10000))
+    JWT_USER_CACHE_SECONDS = int(
+        os.environ.get('JWT_USER_CACHE_SECONDS', 60))
+
+    # Encode JSON responses with orjson (if installed) instead of json.dumps.
+    # Faster, but the output is compact rather than byte-identical.
+    RESTPLUS_FAST_JSON = os.environ.get('RESTPLUS_FAST_JSON') == '1'
+
+    # bcrypt runs in a pool of BCRYPT_POOL_WORKERS processes per worker.
+    # Up to BCRYPT_POOL_QUEUE more jobs may wait, further ones get a 503.
+    BCRYPT_POOL_WORKERS = int(os.environ.get('BCRYPT_POOL_WORKERS', 2))
+    BCRYPT_POOL_QUEUE = int(os.environ.get('BCRYPT_POOL_QUEUE', 8))
+    BCRYPT_POOL_TIMEOUT = float(os.environ.get('BCRYPT_POOL_TIMEOUT', 10))
+
+    # Rows per multi-row INSERT and per transaction in bulk imports
+    IMPORT_BATCH_SIZE = int(os.environ.get('IMPORT_BATCH_SIZE', 500))
+
+    # Responses are compressed with brotli (if installed) or gzip, as the
+    # client's Accept-Encoding allows. Buffered bodies smaller than
+    # COMPRESS_MIN_SIZE bytes are sent uncompressed.
+    COMPRESS_ENABLED = os.environ.get('COMPRESS_ENABLED', '1') == '1'
+    COMPRESS_MIN_SIZE = int(os.environ.get('COMPRESS_MIN_SIZE', 500))
+    COMPRESS_LEVEL = int(os.environ.get('COMPRESS_LEVEL', 6))
+    COMPRESS_BR_LEVEL = int(os.environ.get('COMPRESS_BR_LEVEL', 4))
+
+    # Serve request latency, status, SQL, bcrypt and cache metrics of each
+    # process on /metrics, in the Prometheus text format
+    METRICS_ENABLED = os.environ.get('METRICS_ENABLED', '1') == '1'
+
+    # Check the SQL statements of each request against the budget of its
+    # resource method: 'log' warns about a request over budget, 'raise'
+    # fails it, 'off' skips counting.
+    QUERY_BUDGETS = os.environ.get('QUERY_BUDGETS', 'off')
+
+    # A batch request holds at most BATCH_MAX_OPERATIONS operations. Runs of
+    # consecutive GETs in a batch that is not atomic are spread over
+    # BATCH_READ_WORKERS threads, 1 runs them in turn.
+    BATCH_MAX_OPERATIONS = int(os.environ.get('BATCH_MAX_OPERATIONS', 50))
+    BATCH_READ_WORKERS = int(os.environ.get('BATCH_READ_WORKERS', 4))
+
+    # A bulk edit or delete of recipes lists at most BULK_MAX_IDS ids, a
+    # filter can select any number of recipes.
+    BULK_MAX_IDS = int(os.environ.get('BULK_MAX_IDS', 1000))
+
+    # Serve the Swagger specs from this file, written at build time with
+    # python manage.py swagger, instead of building them in every worker
+    SWAGGER_SPEC_FILE = os.environ.get('SWAGGER_SPEC_FILE')
+
+    # Only take GET, HEAD and OPTIONS requests, for workers serving the read
+    # path from gevent's event loop, see app/green.py
+    READ_ONLY = os.environ.get('READ_ONLY') == '1'
+    # The pool of a gevent worker, in place of SQLALCHEMY_POOL_SIZE and
+    # SQLALCHEMY_MAX_OVERFLOW. Each request holds a connection until it
+    # ends, so these many run at once and the worker's other requests wait
+    # up to SQLALCHEMY_POOL_TIMEOUT for one. Size workers against the
+    # database's limit as well.
+    GREEN_POOL_SIZE = int(os.environ.get('GREEN_POOL_SIZE', 20))
+    GREEN_MAX_OVERFLOW = int(os.environ.get('GREEN_MAX_OVERFLOW', 20))
+
+    # GET responses are cached per user until the user's next write.
+    # 'redis' shares the cache between workers through RESPONSE_CACHE_URL,
+    # and is the default once RESPONSE_CACHE_URL is set. 'local' is an
+    # in-process stand-in for it. 'memory' is an LRU of RESPONSE_CACHE_SIZE
+    # responses in each process, only correct with a single worker: another
+    # worker's writes do not invalidate it. 'none' turns caching off.
+    RESPONSE_CACHE_BACKEND = os.environ.get(
+        'RESPONSE_CACHE_BACKEND',
+        'redis' if os.environ.get('RESPONSE_CACHE_URL') else 'none')
+    RESPONSE_CACHE_SIZE = int(os.environ.get('RESPONSE_CACHE_SIZE', 1024))
+    RESPONSE_CACHE_URL = os.environ.get('RESPONSE_CACHE_URL',
+                                        'redis://localhost:6379/0')
+    RESPONSE_CACHE_TTL = int(os.environ.get('RESPONSE_CACHE_TTL', 300))
+
+    # Read replicas, as comma separated URIs. GET requests read from them,
+    # everything else goes to the primary, see app/replicas.py
+    REPLICA_DATABASE_URLS = os.environ.get('REPLICA_DATABASE_URLS', '')
+    # Seconds a user reads from the primary after a write, longer than the
+    # replicas lag. 'redis' shares the window between workers through
+    # REPLICA_STICKY_URL, 'local' keeps it in each process, only correct
+    # with a single worker.
+    REPLICA_STICKY_SECONDS = int(os.environ.get('REPLICA_STICKY_SECONDS', 5))
+    REPLICA_STICKY_BACKEND = os.environ.get('REPLICA_STICKY_BACKEND', 'local')
+    REPLICA_STICKY_URL = os.environ.get('REPLICA_STICKY_URL',
+                                        'redis://localhost:6379/0')
+
+    # Shards holding the users' categories and recipes, as comma separated
+    # name=URI pairs. Users are placed by a consistent-hash ring with
+    # SHARD_RING_REPLICAS points per shard, see app/sharding.py.
+    SHARD_DATABASE_URLS = os.environ.get('SHARD_DATABASE_URLS', '')
+    SHARD_RING_REPLICAS = int(os.environ.get('SHARD_RING_REPLICAS', 64))
+    # Users whose shard each worker keeps, and the seconds before it is
+    # looked up again, i.e. how long a worker may take to see a user move
+    SHARD_DIRECTORY_CACHE_SIZE = int(
+        os.environ.get('SHARD_DIRECTORY_CACHE_SIZE', 10000))
+    SHARD_DIRECTORY_CACHE_SECONDS = int(
+        os.environ.get('SHARD_DIRECTORY_CACHE_SECONDS', 5))
+    # Category and recipe ids each worker reserves at a time
+    SHARD_ID_BLOCK_SIZE = int(os.environ.get('SHARD_ID_BLOCK_SIZE', 100))
+
 
 class DevelopmentConfig(Config):
     """Configurations for Development."""
     DEBUG = True
     RESTPLUS_VALIDATE = True
     RESTPLUS_MASK_SWAGGER = False
+    QUERY_BUDGETS = os.environ.get('QUERY_BUDGETS', 'log')
+    # the development server is a single process
+    RESPONSE_CACHE_BACKEND = os.environ.get('RESPONSE_CACHE_BACKEND',
+                                            'memory')
 
 
 class TestingConfig(Config):
     """Configurations for Testing, with a separate test database."""
     TESTING = True
-    SQLALCHEMY_DATABASE_URI = 'postgresql://localhost/test_db'
+    SQLALCHEMY_DATABASE_URI = 'sqlite:////tmp/test.db'
     DEBUG = True
     SQLALCHEMY_ECHO = False
     PRESERVE_CONTEXT_ON_EXCEPTION = False
+    QUERY_BUDGETS = 'raise'
+    BCRYPT_POOL_WORKERS = 0
+    RESPONSE_CACHE_BACKEND = 'memory'
 
 
 class ProductionConfig(Config):
@@ -1,8 +1,9 @@
 ''' This script manages migrations and starts the app '''
 
+import json
 import os
 from unittest import TestLoader, TextTestRunner
-from flask import redirect
+from flask import current_app
 from flask_script import Manager
 from flask_migrate import Migrate, MigrateCommand
 
@@ -10,14 +11,24 @@ from app import create_app
 from app.db import db
 
 
-# FLASK_CONFIG = development
-app = create_app(config_name=os.getenv('FLASK_CONFIG'))
-# print("This is the app", app)
-# print("This is the app type", type(app))
-# print("This is the app config", app.config)
-migrate = Migrate(app, db)
-manager = Manager(app)
+migrate = Migrate(db=db)
+
+
+def make_app():
+    ''' Creates the app a command runs in, once the command line is parsed.
+        The configuration is the one FLASK_CONFIG names, e.g. development.
+        gunicorn serves the app of wsgi.py.
+    '''
+    app = create_app(config_name=os.getenv('FLASK_CONFIG'))
+    migrate.init_app(app)
+    return app
+
+
+manager = Manager(make_app)
 manager.add_command('db', MigrateCommand)
+shard_manager = Manager(usage='Sets up the shards and moves users between '
+                        'them, see app/sharding.py')
+manager.add_command('shard', shard_manager)
 
 
 @manager.command
@@ -33,10 +44,82 @@ def test():
     return 1
 
 
-@app.route('/')
-def main():
-    ''' Load the documentation on heroku '''
-    return redirect('/api/v1/')
+@manager.option('-d', '--database', default=None,
+                help='SQLAlchemy URI of a database to empty and seed, e.g. '
+                'postgresql://localhost/bench_db. A temporary SQLite file '
+                'by default')
+@manager.option('--config', dest='config_name', default='production',
+                help='Configuration the app is created with')
+@manager.option('-u', '--users', type=int, default=20,
+                help='Users seeded')
+@manager.option('--categories', type=int, default=20,
+                help='Categories seeded per user')
+@manager.option('--recipes', type=int, default=10,
+                help='Recipes seeded per category')
+@manager.option('-c', '--clients', type=int, default=16,
+                help='Concurrent clients')
+@manager.option('-n', '--requests', type=int, default=100,
+                help='Requests per client')
+@manager.option('--seed', dest='seed_value', type=int, default=0,
+                help='Seeds the workload, for repeatable runs')
+@manager.option('-o', '--output', default=None,
+                help='File the JSON report is written to')
+@manager.option('-b', '--baseline', default=None,
+                help='JSON report of an earlier run to compare against')
+def bench(database, config_name, users, categories, recipes, clients,
+          requests, seed_value, output, baseline):
+    """Load tests the API and reports throughput, latency and queries."""
+    from benchmarks.load import compare, run
+
+    report = run(database, config_name, users, categories, recipes, clients,
+                 requests, seed_value)
+    text = json.dumps(report, indent=2, sort_keys=True)
+    if output:
+        with open(output, 'w') as report_file:
+            report_file.write(text + '\n')
+    else:
+        print(text)
+    if baseline:
+        with open(baseline) as baseline_file:
+            print('\n'.join(compare(json.load(baseline_file), report)))
+
+
+@manager.option('-o', '--output', default='instance/swagger.json',
+                help='File the specs are written to')
+def swagger(output):
+    """Writes the Swagger specs of the APIs for SWAGGER_SPEC_FILE."""
+    from app.swagger_spec import write_specs
+
+    write_specs(current_app, output)
+    print(f'Wrote the Swagger specs to {output}, serve them with '
+          f'SWAGGER_SPEC_FILE={output}')
+
+
+
+@shard_manager.command
+def init():
+    """Migrates the shards to the primary's schema and seeds their ids."""
+    from flask_migrate import upgrade
+    from app.sharding import init_shard_schemas
+
+    init_shard_schemas(upgrade)
+    print('The shards are migrated and their ids seeded')
+
+
+@shard_manager.option('-b', '--batch', dest='batch_size', type=int,
+                      default=100, help='Users moved together')
+@shard_manager.option('-w', '--wait', type=float, default=None,
+                      help='Seconds for the workers to see the directory '
+                      'change, SHARD_DIRECTORY_CACHE_SECONDS + 1 by default. '
+                      'Raise it over the longest write request')
+@shard_manager.option('-n', '--dry-run', dest='dry_run', action='store_true',
+                      help='Lists the moves without making them')
+def rebalance(batch_size, wait, dry_run):
+    """Moves the users the ring places on another shard, online."""
+    from app.sharding import rebalance as rebalance_users
+
+    moved = rebalance_users(batch_size, wait, dry_run)
+    print(f'{moved} users {"to move" if dry_run else "moved"}')
 
 
 if __name__ == '__main__':
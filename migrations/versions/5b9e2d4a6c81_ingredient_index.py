@@ -0,0 +1,70 @@
+"""ingredient index
+
+The ingredients table and recipe_ingredients, the inverted index from
+ingredients to the recipes using them, filled from the existing recipes.
+From then on the app keeps it current on every recipe write.
+
+Revision ID: 5b9e2d4a6c81
+Revises: c7e0b94f1a23
+Create Date: 2018-02-12 09:41:06.118342
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+from app.ingredient_index import index_recipes
+
+
+# revision identifiers, used by Alembic.
+revision = '5b9e2d4a6c81'
+down_revision = 'c7e0b94f1a23'
+branch_labels = None
+depends_on = None
+
+BACKFILL_BATCH_SIZE = 1000
+
+
+def upgrade():
+    op.create_table(
+        'ingredients',
+        sa.Column('ingredient_id', sa.Integer(), autoincrement=True,
+                  nullable=False),
+        sa.Column('name', sa.String(length=100), nullable=False),
+        sa.PrimaryKeyConstraint('ingredient_id'),
+        sa.UniqueConstraint('name'))
+    op.create_table(
+        'recipe_ingredients',
+        sa.Column('recipe_id', sa.Integer(), nullable=False),
+        sa.Column('ingredient_id', sa.Integer(), nullable=False),
+        sa.Column('created_by', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(['recipe_id'], ['recipes.recipe_id'],
+                                ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['ingredient_id'],
+                                ['ingredients.ingredient_id']),
+        sa.ForeignKeyConstraint(['created_by'], ['users.user_id']),
+        sa.PrimaryKeyConstraint('recipe_id', 'ingredient_id'))
+    op.create_index(
+        'ix_recipe_ingredients_created_by_ingredient_id_recipe_id',
+        'recipe_ingredients', ['created_by', 'ingredient_id', 'recipe_id'])
+
+    connection = op.get_bind()
+    recipes = sa.table('recipes', sa.column('recipe_id'),
+                       sa.column('created_by'), sa.column('ingredients'))
+    last_id = 0
+    while True:
+        rows = connection.execute(
+            sa.select([recipes.c.recipe_id, recipes.c.created_by,
+                       recipes.c.ingredients]).where(
+                recipes.c.recipe_id > last_id).order_by(
+                    recipes.c.recipe_id).limit(BACKFILL_BATCH_SIZE)).fetchall()
+        if not rows:
+            break
+        index_recipes(connection, [tuple(row) for row in rows], replace=False)
+        last_id = rows[-1][0]
+
+
+def downgrade():
+    op.drop_index('ix_recipe_ingredients_created_by_ingredient_id_recipe_id',
+                  table_name='recipe_ingredients')
+    op.drop_table('recipe_ingredients')
+    op.drop_table('ingredients')
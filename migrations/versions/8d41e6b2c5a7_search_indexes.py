@@ -0,0 +1,79 @@
+"""search indexes
+
+Full-text search of recipes and categories, as app/search.py sets it up
+for new databases: a GIN index over the tsvector of the searchable columns
+on Postgres, built concurrently, an FTS5 table kept in sync with triggers
+on SQLite.
+
+Revision ID: 8d41e6b2c5a7
+Revises: 3f2a9c1d7b10
+Create Date: 2018-01-29 09:40:03.118472
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = '8d41e6b2c5a7'
+down_revision = '3f2a9c1d7b10'
+branch_labels = None
+depends_on = None
+
+# table name: (primary key, searchable columns)
+SEARCHABLE = {
+    'recipes': ('recipe_id', ('recipe_name', 'ingredients')),
+    'categories': ('category_id', ('category_name', 'description')),
+}
+
+
+def _upgrade_postgresql():
+    # CREATE INDEX CONCURRENTLY cannot run in a transaction, end the one
+    # this revision runs in so writes are not blocked while it builds
+    op.execute('COMMIT')
+    for name, (_, columns) in SEARCHABLE.items():
+        document = " || ' ' || ".join(columns)
+        op.execute(f"CREATE INDEX CONCURRENTLY IF NOT EXISTS "
+                   f"{name}_search_idx ON {name} USING gin "
+                   f"(to_tsvector('simple', {document}))")
+
+
+def _upgrade_sqlite():
+    for name, (pk, columns) in SEARCHABLE.items():
+        cols = ', '.join(columns)
+        new = ', '.join(f'new.{col}' for col in columns)
+        old = ', '.join(f'old.{col}' for col in columns)
+        delete = (f"INSERT INTO {name}_fts({name}_fts, rowid, {cols}) "
+                  f"VALUES ('delete', old.{pk}, {old});")
+        insert = (f"INSERT INTO {name}_fts(rowid, {cols}) "
+                  f"VALUES (new.{pk}, {new});")
+        op.execute(f"CREATE VIRTUAL TABLE IF NOT EXISTS {name}_fts USING "
+                   f"fts5({cols}, content='{name}', content_rowid='{pk}')")
+        op.execute(f"CREATE TRIGGER IF NOT EXISTS {name}_fts_ai AFTER INSERT "
+                   f"ON {name} BEGIN {insert} END")
+        op.execute(f"CREATE TRIGGER IF NOT EXISTS {name}_fts_ad AFTER DELETE "
+                   f"ON {name} BEGIN {delete} END")
+        op.execute(f"CREATE TRIGGER IF NOT EXISTS {name}_fts_au AFTER UPDATE "
+                   f"ON {name} BEGIN {delete} {insert} END")
+        # index the rows written before the table existed
+        op.execute(f"INSERT INTO {name}_fts({name}_fts) VALUES ('rebuild')")
+
+
+def upgrade():
+    dialect = op.get_context().dialect.name
+    if dialect == 'postgresql':
+        _upgrade_postgresql()
+    elif dialect == 'sqlite':
+        _upgrade_sqlite()
+
+
+def downgrade():
+    dialect = op.get_context().dialect.name
+    if dialect == 'postgresql':
+        op.execute('COMMIT')
+        for name in SEARCHABLE:
+            op.execute(f'DROP INDEX CONCURRENTLY IF EXISTS {name}_search_idx')
+    elif dialect == 'sqlite':
+        for name in SEARCHABLE:
+            for trigger in ('ai', 'ad', 'au'):
+                op.execute(f'DROP TRIGGER IF EXISTS {name}_fts_{trigger}')
+            op.execute(f'DROP TABLE IF EXISTS {name}_fts')
@@ -0,0 +1,34 @@
+"""row versions
+
+Categories and recipes get a version every UPDATE bumps, which the ETags
+of the conditional GETs are built from. date_modified, to the second on
+SQLite, is the same for an edit made in the second of the last GET.
+
+Revision ID: a4d8e2f6b913
+Revises: f1b7c3a9d2e6
+Create Date: 2018-02-22 09:12:40.318274
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a4d8e2f6b913'
+down_revision = 'f1b7c3a9d2e6'
+branch_labels = None
+depends_on = None
+
+TABLES = ('categories', 'recipes')
+
+
+def upgrade():
+    for table in TABLES:
+        op.add_column(table, sa.Column('version', sa.Integer(),
+                                       nullable=False, server_default='0'))
+
+
+def downgrade():
+    for table in TABLES:
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('version')
@@ -0,0 +1,40 @@
+"""utc timestamps
+
+The dates of categories and recipes are stored in UTC, the Last-Modified
+of the conditional GETs is built from them. Postgres stored them in the
+server's time zone, the existing ones are converted. SQLite's were in UTC
+already.
+
+Revision ID: b6f1c9e3a057
+Revises: a4d8e2f6b913
+Create Date: 2018-02-22 14:41:05.527193
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'b6f1c9e3a057'
+down_revision = 'a4d8e2f6b913'
+branch_labels = None
+depends_on = None
+
+TABLES = ('categories', 'recipes')
+COLUMNS = ('date_created', 'date_modified')
+
+
+def _convert(source, target):
+    if op.get_bind().dialect.name != 'postgresql':
+        return
+    for table in TABLES:
+        op.execute('UPDATE {} SET {}'.format(table, ', '.join(
+            f"{column} = {column} AT TIME ZONE {source} AT TIME ZONE {target}"
+            for column in COLUMNS)))
+
+
+def upgrade():
+    _convert("current_setting('TimeZone')", "'UTC'")
+
+
+def downgrade():
+    _convert("'UTC'", "current_setting('TimeZone')")
@@ -0,0 +1,57 @@
+"""access path indexes
+
+Composite indexes for the per-user queries: every read and write filters on
+created_by together with category_id, recipe_id, recipe_name or
+category_name. Built concurrently on Postgres so the tables stay writable.
+IF NOT EXISTS skips the ones a database created by db.create_all already has.
+
+Revision ID: c7e0b94f1a23
+Revises: 8d41e6b2c5a7
+Create Date: 2018-02-05 14:22:57.904316
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'c7e0b94f1a23'
+down_revision = '8d41e6b2c5a7'
+branch_labels = None
+depends_on = None
+
+# name: (table, columns)
+INDEXES = {
+    'ix_categories_created_by_category_id': (
+        'categories', ('created_by', 'category_id')),
+    'ix_categories_created_by_category_name': (
+        'categories', ('created_by', 'category_name')),
+    'ix_recipes_created_by_recipe_id': (
+        'recipes', ('created_by', 'recipe_id')),
+    'ix_recipes_created_by_category_id_recipe_id': (
+        'recipes', ('created_by', 'category_id', 'recipe_id')),
+    'ix_recipes_created_by_category_id_recipe_name': (
+        'recipes', ('created_by', 'category_id', 'recipe_name')),
+    'ix_recipes_category_id': ('recipes', ('category_id',)),
+}
+
+
+def _concurrently():
+    if op.get_context().dialect.name != 'postgresql':
+        return ''
+    # CREATE INDEX CONCURRENTLY cannot run in a transaction, end the one
+    # this revision runs in so writes are not blocked while it builds
+    op.execute('COMMIT')
+    return 'CONCURRENTLY '
+
+
+def upgrade():
+    concurrently = _concurrently()
+    for name, (table, columns) in INDEXES.items():
+        op.execute(f"CREATE INDEX {concurrently}IF NOT EXISTS {name} "
+                   f"ON {table} ({', '.join(columns)})")
+
+
+def downgrade():
+    concurrently = _concurrently()
+    for name in INDEXES:
+        op.execute(f'DROP INDEX {concurrently}IF EXISTS {name}')
@@ -0,0 +1,88 @@
+"""cascade deletes
+
+Deleting a category deletes its recipes and deleting a user their
+categories, recipes and ingredient links in the database, with ON DELETE
+CASCADE, instead of the ORM loading and deleting the rows one by one.
+
+SQLite can not alter a constraint, its tables are copied with the new
+ones. Foreign keys are switched off meanwhile, dropping the old tables
+would otherwise delete the rows referencing them, and the full-text search
+triggers dropped with them are created again.
+
+Revision ID: e3c58f0a2d19
+Revises: 5b9e2d4a6c81
+Create Date: 2018-02-14 11:03:52.640187
+
+"""
+from alembic import op
+
+
+# revision identifiers, used by Alembic.
+revision = 'e3c58f0a2d19'
+down_revision = '5b9e2d4a6c81'
+branch_labels = None
+depends_on = None
+
+# table name: [(column, referred table, referred column)]
+FOREIGN_KEYS = {
+    'categories': [('created_by', 'users', 'user_id')],
+    'recipes': [('category_id', 'categories', 'category_id'),
+                ('created_by', 'users', 'user_id')],
+    'recipe_ingredients': [('created_by', 'users', 'user_id')],
+}
+# Postgres' names for the foreign keys, given to SQLite's unnamed ones
+NAMING_CONVENTION = {'fk': '%(table_name)s_%(column_0_name)s_fkey'}
+
+# table name: (primary key, searchable columns), as in app/search.py
+SEARCHABLE = {
+    'recipes': ('recipe_id', ('recipe_name', 'ingredients')),
+    'categories': ('category_id', ('category_name', 'description')),
+}
+
+
+def _create_search_triggers():
+    connection = op.get_bind()
+    for name, (pk, columns) in SEARCHABLE.items():
+        if not connection.execute(
+                "SELECT 1 FROM sqlite_master WHERE type = 'table' "
+                f"AND name = '{name}_fts'").fetchone():
+            continue
+        cols = ', '.join(columns)
+        new = ', '.join(f'new.{col}' for col in columns)
+        old = ', '.join(f'old.{col}' for col in columns)
+        delete = (f"INSERT INTO {name}_fts({name}_fts, rowid, {cols}) "
+                  f"VALUES ('delete', old.{pk}, {old});")
+        insert = (f"INSERT INTO {name}_fts(rowid, {cols}) "
+                  f"VALUES (new.{pk}, {new});")
+        op.execute(f"CREATE TRIGGER IF NOT EXISTS {name}_fts_ai AFTER INSERT "
+                   f"ON {name} BEGIN {insert} END")
+        op.execute(f"CREATE TRIGGER IF NOT EXISTS {name}_fts_ad AFTER DELETE "
+                   f"ON {name} BEGIN {delete} END")
+        op.execute(f"CREATE TRIGGER IF NOT EXISTS {name}_fts_au AFTER UPDATE "
+                   f"ON {name} BEGIN {delete} {insert} END")
+
+
+def _alter_foreign_keys(ondelete):
+    sqlite = op.get_context().dialect.name == 'sqlite'
+    if sqlite:
+        op.execute('PRAGMA foreign_keys=OFF')
+    for table, foreign_keys in FOREIGN_KEYS.items():
+        with op.batch_alter_table(
+                table, naming_convention=NAMING_CONVENTION) as batch_op:
+            for column, referred_table, referred_column in foreign_keys:
+                name = f'{table}_{column}_fkey'
+                batch_op.drop_constraint(name, type_='foreignkey')
+                batch_op.create_foreign_key(
+                    name, referred_table, [column], [referred_column],
+                    ondelete=ondelete)
+    if sqlite:
+        _create_search_triggers()
+        op.execute('PRAGMA foreign_keys=ON')
+
+
+def upgrade():
+    _alter_foreign_keys('CASCADE')
+
+
+def downgrade():
+    _alter_foreign_keys(None)
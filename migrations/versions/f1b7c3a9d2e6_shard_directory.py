@@ -0,0 +1,41 @@
+"""shard directory
+
+The users table becomes the directory of the shards: the shard each user's
+categories and recipes are on, None while they are on the primary, and
+whether they are being moved. id_blocks holds the next id of the sharded
+tables, which the workers reserve in blocks so ids stay unique across the
+shards. Its rows are seeded by python manage.py shard init.
+
+Revision ID: f1b7c3a9d2e6
+Revises: e3c58f0a2d19
+Create Date: 2018-02-20 10:37:14.902561
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f1b7c3a9d2e6'
+down_revision = 'e3c58f0a2d19'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column('users', sa.Column('shard', sa.String(length=50),
+                                     nullable=True))
+    op.add_column('users', sa.Column('moving', sa.Boolean(), nullable=False,
+                                     server_default=sa.false()))
+    op.create_table(
+        'id_blocks',
+        sa.Column('name', sa.String(length=50), nullable=False),
+        sa.Column('next_id', sa.BigInteger(), nullable=False),
+        sa.PrimaryKeyConstraint('name'))
+
+
+def downgrade():
+    op.drop_table('id_blocks')
+    with op.batch_alter_table('users') as batch_op:
+        batch_op.drop_column('moving')
+        batch_op.drop_column('shard')
@@ -2,6 +2,9 @@
 
 import json
 
+from app import db
+from app.models.blacklist import Blacklist
+from app.revocation_cache import RevocationCache
 from tests.test_base import BaseTestCase
 
 
@@ -77,3 +80,28 @@ class UserTestCase(BaseTestCase):
                                           Authorization="Bearer " + token,
                                           data=passwords))
         self.assertEqual(reset_res.status_code, 200)
+
+    def test_logged_out_token_is_rejected(self):
+        ''' Test that a token cannot be used once the user has logged out '''
+        self.user_registration()
+        loggedin_user = self.user_login()
+        token = json.loads(loggedin_user.data)['access_token']
+        headers = dict(Authorization="Bearer " + token)
+        self.client().delete('/api/v1/auth/logout/', headers=headers)
+        res = self.client().get('/api/v1/categories/', headers=headers)
+        output = json.loads(res.data)
+        self.assertEqual(output['message'],
+                         'You must be logged in to access this page')
+
+    def test_revocation_cache_polls_within_staleness_window(self):
+        ''' Test that tokens revoked by another worker are picked up once the
+            revocation cache's staleness window has passed
+        '''
+        cache = RevocationCache(max_staleness=3600)
+        with self.app.app_context():
+            self.assertFalse(cache.is_revoked('some-jti'))
+            db.session.add(Blacklist('some-jti'))
+            db.session.commit()
+            self.assertFalse(cache.is_revoked('some-jti'))
+            cache.max_staleness = 0
+            self.assertTrue(cache.is_revoked('some-jti'))
@@ -0,0 +1,83 @@
+''' This scripts tests the worker's caches of verified tokens and users '''
+
+import json
+import time
+from unittest.mock import patch
+
+from app import auth_cache, db
+from app.auth_cache import ExpiringLRU
+from app.models.user import User
+from tests.test_base import BaseTestCase
+
+
+class AuthCacheTestCase(BaseTestCase):
+    ''' Tests for authenticating requests from the caches '''
+
+    def setUp(self):
+        super().setUp()
+        self.user_registration()
+        token = json.loads(self.user_login().data)['access_token']
+        self.headers = {'Authorization': "Bearer " + token}
+
+    def get_categories(self, headers=None):
+        ''' Returns the response to a GET of the categories '''
+        return self.client().get('/api/v1/categories/',
+                                 headers=headers or self.headers)
+
+    def test_token_verified_once(self):
+        ''' Test that a token is verified on its first request only, and a
+            tampered one is never taken from the cache
+        '''
+        with patch.object(auth_cache, '_decode_jwt',
+                          wraps=auth_cache._decode_jwt) as decode:
+            for _ in range(3):
+                self.assertEqual(self.get_categories().status_code, 200)
+            self.assertEqual(decode.call_count, 1)
+            payload, signature = self.headers['Authorization'].rsplit('.', 1)
+            signature = ('B' if signature[0] == 'A' else 'A') + signature[1:]
+            tampered = {'Authorization': f'{payload}.{signature}'}
+            for _ in range(2):
+                self.assertNotEqual(
+                    self.get_categories(tampered).status_code, 200)
+            self.assertEqual(decode.call_count, 3)
+
+    def test_logout_takes_effect(self):
+        ''' Test that a cached token is rejected once logged out '''
+        self.assertEqual(self.get_categories().status_code, 200)
+        self.client().delete('/api/v1/auth/logout/', headers=self.headers)
+        res = self.get_categories()
+        self.assertEqual(json.loads(res.data)['message'],
+                         'You must be logged in to access this page')
+
+    def test_user_looked_up_once(self):
+        ''' Test that the user is looked up once per worker and a deleted
+            user's token is rejected once the lookup expires
+        '''
+        with self.count_queries() as statements:
+            for _ in range(3):
+                self.get_categories()
+        self.assertEqual(len([statement for statement in statements
+                              if 'FROM users' in statement]), 1)
+        with self.app.app_context():
+            db.session.delete(User.query.first())
+            db.session.commit()
+        self.assertEqual(self.get_categories().status_code, 200)
+        self.app.extensions['user_cache'].clear()
+        res = self.get_categories()
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(json.loads(res.data)['message'],
+                         'You must be logged in to access this page')
+
+    def test_expiry_and_size(self):
+        ''' Test that entries expire and the least recently used goes first
+        '''
+        cache = ExpiringLRU(2)
+        cache.set('expired', 1, time.time() - 1)
+        cache.set('a', 1)
+        cache.set('b', 2, time.time() + 60)
+        self.assertIsNone(cache.get('expired'))
+        self.assertEqual(cache.get('a'), 1)
+        cache.set('c', 3)
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.stats(), {'hits': 1, 'misses': 2,
+                                         'evictions': 2, 'entries': 2})
@@ -1,8 +1,11 @@
 ''' This script holds the universal configurations of the test cases '''
 
 import json
+from contextlib import contextmanager
 from unittest import TestCase
 
+from sqlalchemy import event
+
 from app import create_app, db
 
 
@@ -49,7 +52,30 @@ class BaseTestCase(TestCase):
                                       Authorization="Bearer " + token),
                                   data=self.category)
 
+    @contextmanager
+    def count_queries(self):
+        ''' Collects the statements run against the app's database,
+            leaving out the periodic revocation cache polls
+        '''
+        statements = []
+
+        def record(conn, cursor, statement, *args):
+            if 'blacklisted' not in statement:
+                statements.append(statement)
+
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            yield statements
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+
     def tearDown(self):
+        # a request over its query budget answers with a 500, which a test
+        # may not look at
+        errors = self.app.extensions.get('query_budget_errors')
+        self.assertFalse(errors, '\n\n'.join(map(str, errors or ())))
         with self.app.app_context():
 
             db.session.close()
@@ -0,0 +1,164 @@
+''' This scripts tests the batch endpoint '''
+
+import json
+from unittest.mock import patch
+
+from flask_jwt_extended import view_decorators
+
+from tests.test_base import BaseTestCase
+
+
+class BatchTestCase(BaseTestCase):
+    ''' Tests for running several operations in one request '''
+
+    def setUp(self):
+        super().setUp()
+        self.user_registration()
+        token = json.loads(self.user_login().data)['access_token']
+        self.headers = {'Authorization': "Bearer " + token}
+
+    def batch(self, operations, **options):
+        ''' Posts a batch and returns its status code and decoded body '''
+        res = self.client().post(
+            '/api/v1/batch/', headers=self.headers,
+            data=json.dumps(dict(options, operations=operations)),
+            content_type='application/json')
+        return res.status_code, json.loads(res.data)
+
+    def test_batch(self):
+        ''' Test that writes and concurrent reads run in order '''
+        code, body = self.batch([
+            {'method': 'POST', 'path': '/api/v1/categories/',
+             'body': self.category},
+            {'method': 'POST', 'path': '/api/v1/recipes/1/',
+             'body': self.recipe},
+            {'method': 'GET', 'path': '/api/v1/categories/'},
+            {'method': 'GET', 'path': '/api/v1/recipes/1/1/'},
+            {'method': 'GET', 'path': '/api/v1/recipes/1/2/'},
+            {'method': 'DELETE', 'path': '/api/v1/recipes/1/1/'},
+            {'method': 'GET', 'path': '/api/v1/recipes/1/'},
+        ])
+        self.assertEqual(code, 200)
+        self.assertNotIn('rolledBack', body)
+        results = body['results']
+        self.assertEqual([result['status'] for result in results],
+                         [201, 201, 200, 200, 404, 200, 404])
+        self.assertEqual(results[2]['body']['categories'][0]['recipes'][0][
+            'recipe_name'], 'recipe')
+        self.assertIn('ETag', results[3]['headers'])
+        self.assertEqual(results[3]['body']['recipe_name'], 'recipe')
+
+    def test_token_decoded_once(self):
+        ''' Test that the operations use the token verified for the batch '''
+        with patch.object(view_decorators, 'decode_jwt',
+                          wraps=view_decorators.decode_jwt) as decode:
+            code, body = self.batch([
+                {'method': 'POST', 'path': '/api/v1/categories/',
+                 'body': self.category},
+                {'method': 'GET', 'path': '/api/v1/categories/1/'},
+                {'method': 'GET', 'path': '/api/v1/recipes/'},
+            ])
+        self.assertEqual(code, 200)
+        self.assertEqual(decode.call_count, 1)
+
+    def test_without_token(self):
+        ''' Test that a batch needs a token '''
+        res = self.client().post(
+            '/api/v1/batch/', content_type='application/json',
+            data=json.dumps({'operations': [
+                {'method': 'GET', 'path': '/api/v1/categories/'}]}))
+        self.assertEqual(res.status_code, 401)
+
+    def test_atomic(self):
+        ''' Test that an atomic batch commits all of its writes or none '''
+        code, body = self.batch([
+            {'method': 'POST', 'path': '/api/v1/categories/',
+             'body': self.category},
+            {'method': 'POST', 'path': '/api/v1/recipes/1/',
+             'body': self.recipe},
+        ], atomic=True)
+        self.assertEqual(code, 200)
+        self.assertFalse(body['rolledBack'])
+
+        code, body = self.batch([
+            {'method': 'POST', 'path': '/api/v1/categories/',
+             'body': self.category1},
+            {'method': 'POST', 'path': '/api/v1/categories/',
+             'body': self.category},
+            {'method': 'DELETE', 'path': '/api/v1/categories/1/'},
+        ], atomic=True)
+        self.assertTrue(body['rolledBack'])
+        self.assertEqual([result['status'] for result in body['results']],
+                         [201, 409, 424])
+        res = self.client().get('/api/v1/categories/', headers=self.headers)
+        categories = json.loads(res.data)['categories']
+        self.assertEqual([category['category_name']
+                          for category in categories], ['category'])
+        self.assertEqual(len(categories[0]['recipes']), 1)
+
+    def test_rolled_back_reads_not_cached(self):
+        ''' Test that the reads of a rolled back batch are not served later '''
+        code, body = self.batch([
+            {'method': 'POST', 'path': '/api/v1/categories/',
+             'body': {'category_name': 'phantom'}},
+            {'method': 'GET', 'path': '/api/v1/categories/'},
+            {'method': 'GET', 'path': '/api/v1/categories/999/'},
+        ], atomic=True)
+        self.assertTrue(body['rolledBack'])
+        self.assertEqual(body['results'][1]['body']['categories'][0][
+            'category_name'], 'phantom')
+        res = self.client().get('/api/v1/categories/', headers=self.headers)
+        self.assertNotIn('categories', json.loads(res.data))
+        self.assertEqual(self.client().get(
+            '/api/v1/categories/1/', headers=self.headers).status_code, 404)
+
+    def test_atomic_import_commits_once(self):
+        ''' Test that an import committing every category is rolled back
+            with the rest of an atomic batch
+        '''
+        self.app.config['IMPORT_BATCH_SIZE'] = 1
+        categories = [{'category_name': name}
+                      for name in ('breakfast', 'lunch', 'dinner')]
+        code, body = self.batch([
+            {'method': 'POST', 'path': '/api/v1/categories/import/',
+             'body': categories},
+            {'method': 'GET', 'path': '/api/v1/categories/999/'},
+        ], atomic=True)
+        self.assertTrue(body['rolledBack'])
+        self.assertEqual(body['results'][0]['body']['categories_created'], 3)
+        res = self.client().get('/api/v1/categories/', headers=self.headers)
+        self.assertNotIn('categories', json.loads(res.data))
+
+        code, body = self.batch([
+            {'method': 'POST', 'path': '/api/v1/categories/import/',
+             'body': categories},
+            {'method': 'GET', 'path': '/api/v1/categories/'},
+        ], atomic=True)
+        self.assertFalse(body['rolledBack'])
+        res = self.client().get('/api/v1/categories/', headers=self.headers)
+        self.assertEqual(len(json.loads(res.data)['categories']), 3)
+
+    def test_invalid_batches(self):
+        ''' Test that malformed batches are rejected '''
+        self.app.config['BATCH_MAX_OPERATIONS'] = 2
+        self.assertEqual(self.batch([])[0], 400)
+        self.assertEqual(self.batch([{'method': 'PATCH',
+                                      'path': '/api/v1/categories/'}])[0], 400)
+        self.assertEqual(self.batch([{'method': 'GET'}])[0], 400)
+        code, body = self.batch([{'path': '/api/v1/recipes/'}] * 3)
+        self.assertEqual(code, 400)
+        self.assertEqual(body['message'],
+                         'A batch can hold at most 2 operations')
+
+    def test_operations_not_batched(self):
+        ''' Test that batches, streams and unknown paths fail on their own '''
+        code, body = self.batch([
+            {'method': 'POST', 'path': '/api/v1/batch/',
+             'body': {'operations': []}},
+            {'method': 'GET', 'path': '/api/v1/recipes/export/'},
+            {'method': 'GET', 'path': '/api/v1/unknown/'},
+            {'method': 'GET', 'path': '/api/v1/recipes/'},
+        ])
+        self.assertEqual(code, 200)
+        self.assertEqual([result['status'] for result in body['results']],
+                         [400, 400, 404, 200])
@@ -0,0 +1,46 @@
+''' This scripts tests the load benchmark behind manage.py bench '''
+
+import os
+import tempfile
+from unittest import TestCase
+from unittest.mock import patch
+
+from benchmarks.load import compare, run
+from instance.config import app_config
+
+
+class BenchTestCase(TestCase):
+    ''' Tests for running the load benchmark '''
+
+    def test_report(self):
+        ''' Test that a short run reports every operation it ran '''
+        report = run(f'sqlite:///{tempfile.mkdtemp()}/bench.db', 'testing',
+                     users=2, categories=3, recipes=2, clients=2, requests=10)
+        self.assertEqual(report['database'], 'sqlite')
+        self.assertEqual(report['operations']['login']['statuses'],
+                         {'200': 2})
+        self.assertEqual(report['requests'], sum(
+            summary['requests'] for summary in report['operations'].values()))
+        for summary in report['operations'].values():
+            self.assertEqual(summary['errors'], 0)
+            self.assertLessEqual(summary['latency_ms']['p50'],
+                                 summary['latency_ms']['p99'])
+            self.assertGreater(summary['queries_per_request'], 0)
+        self.assertEqual(len(compare(report, report)),
+                         len(report['operations']) + 1)
+
+    def test_without_shards_and_replicas(self):
+        ''' Test that the bench runs on its database alone when shards and
+            replicas are configured
+        '''
+        directory = tempfile.mkdtemp()
+        with patch.multiple(
+                app_config['testing'],
+                SHARD_DATABASE_URLS=f'alpha=sqlite:///{directory}/alpha.db',
+                REPLICA_DATABASE_URLS=f'sqlite:///{directory}/replica.db'):
+            report = run(f'sqlite:///{directory}/bench.db', 'testing',
+                         users=2, categories=3, recipes=2, clients=2,
+                         requests=20)
+        for summary in report['operations'].values():
+            self.assertEqual(summary['errors'], 0)
+        self.assertEqual(sorted(os.listdir(directory)), ['bench.db'])
@@ -0,0 +1,105 @@
+''' This scripts tests editing and deleting many recipes at once '''
+
+import json
+
+from tests.test_base import BaseTestCase
+
+
+class BulkTestCase(BaseTestCase):
+    ''' Tests for the bulk recipe endpoints '''
+
+    def setUp(self):
+        super().setUp()
+        self.user_registration()
+        token = json.loads(self.user_login().data)['access_token']
+        self.headers = {'Authorization': "Bearer " + token}
+        for a_category in (self.category, self.category1):
+            self.client().post('/api/v1/categories/', headers=self.headers,
+                               data=a_category)
+        for name in ('apple cake', 'carrot cake', 'tomato soup'):
+            self.client().post('/api/v1/recipes/1/', headers=self.headers,
+                               data={'recipe_name': name,
+                                     'ingredients': 'flour, eggs'})
+
+    def bulk(self, method, body):
+        ''' Sends a bulk request and returns its status code and body '''
+        res = self.client().open(
+            '/api/v1/recipes/bulk/', method=method, headers=self.headers,
+            data=json.dumps(body), content_type='application/json')
+        return res.status_code, json.loads(res.data)
+
+    def recipe_names(self, category_id):
+        ''' Returns the names of the recipes in a category '''
+        res = self.client().get(f'/api/v1/recipes/{category_id}/',
+                                headers=self.headers)
+        return sorted(a_recipe['recipe_name'] for a_recipe in
+                      json.loads(res.data).get('recipes', []))
+
+    def test_move_by_filter(self):
+        ''' Test that the recipes matching a filter are moved in one UPDATE
+        '''
+        with self.count_queries() as statements:
+            code, body = self.bulk('PUT', {'filter': {'category_id': 1,
+                                                      'q': 'cake'},
+                                           'set': {'category_id': 2}})
+        self.assertEqual(code, 200)
+        self.assertEqual(body['updated'], 2)
+        self.assertEqual(len([statement for statement in statements
+                              if statement.startswith('UPDATE')]), 1)
+        self.assertEqual(self.recipe_names(1), ['tomato soup'])
+        self.assertEqual(self.recipe_names(2), ['apple cake', 'carrot cake'])
+
+    def test_edit_by_ids(self):
+        ''' Test that new names are validated and ingredients reindexed '''
+        code, body = self.bulk('PUT', {'ids': [1, 2], 'set': {
+            'recipe_name': 'cake 2'}})
+        self.assertEqual(code, 400)
+        code, body = self.bulk('PUT', {'ids': [1, 2], 'set': {
+            'recipe_name': 'Cake', 'ingredients': 'Sugar, butter'}})
+        self.assertEqual(code, 200)
+        self.assertEqual(body['updated'], 2)
+        self.assertEqual(self.recipe_names(1), ['cake', 'cake', 'tomato soup'])
+        res = self.client().get(
+            '/api/v1/recipes/ingredients/?ingredients=butter,sugar&match=only',
+            headers=self.headers)
+        self.assertEqual(len(json.loads(res.data)['recipes']), 2)
+
+    def test_delete(self):
+        ''' Test that the selected recipes are deleted and counted '''
+        code, body = self.bulk('DELETE', {'ids': [1, 3, 99]})
+        self.assertEqual(code, 200)
+        self.assertEqual(body['deleted'], 2)
+        self.assertEqual(self.recipe_names(1), ['carrot cake'])
+        code, body = self.bulk('DELETE', {'filter': {
+            'created_after': '2000-01-01', 'created_before': '2000-02-01'}})
+        self.assertEqual(body['deleted'], 0)
+        code, body = self.bulk('DELETE', {'filter': {
+            'created_after': '2000-01-01'}})
+        self.assertEqual(body['deleted'], 1)
+
+    def test_other_users_recipes(self):
+        ''' Test that only the user's own recipes are changed '''
+        self.user = {'username': 'another', 'password': 'password',
+                     'email': 'another@email.com'}
+        self.user_registration()
+        own_headers = self.headers
+        token = json.loads(self.user_login().data)['access_token']
+        self.headers = {'Authorization': "Bearer " + token}
+        code, body = self.bulk('DELETE', {'ids': [1, 2, 3]})
+        self.assertEqual(body['deleted'], 0)
+        code, body = self.bulk('PUT', {'ids': [1], 'set': {'category_id': 1}})
+        self.assertEqual(code, 404)
+        self.headers = own_headers
+        self.assertEqual(len(self.recipe_names(1)), 3)
+
+    def test_invalid_requests(self):
+        ''' Test that a bulk request must select recipes and valid values '''
+        self.app.config['BULK_MAX_IDS'] = 2
+        for body in ({}, {'ids': []}, {'ids': ['one']}, {'ids': [1, 2, 3]},
+                     {'filter': {'owner': 1}}, {'filter': {'q': '!'}},
+                     {'filter': {'created_after': 'yesterday'}}):
+            self.assertEqual(self.bulk('DELETE', body)[0], 400, body)
+        self.assertEqual(self.bulk('PUT', {'ids': [1]})[0], 400)
+        self.assertEqual(self.bulk('PUT', {'ids': [1], 'set': {
+            'created_by': 2}})[0], 400)
+        self.assertEqual(len(self.recipe_names(1)), 3)
@@ -1,7 +1,16 @@
 ''' This scripts tests the category crud functionality '''
 
+import io
 import json
+from unittest import TestCase
+from unittest.mock import patch
 
+from app import db, import_helper
+from app.import_helper import ImportParseError, iter_json_array
+from app.models.category import Category
+from app.models.ingredient import RecipeIngredient
+from app.models.recipe import Recipe
+from app.models.user import User
 from tests.test_base import BaseTestCase
 
 
@@ -121,3 +130,270 @@ class CategoryTestCase(BaseTestCase):
         self.assertEqual(delete_res.status_code, 200)
         delete_res = json.loads(delete_res.data)
         self.assertEqual(delete_res['message'], 'Category was deleted')
+
+    def test_delete_category_with_its_recipes(self):
+        ''' Test that a category is deleted with its recipes in a single
+            statement, whatever the number of recipes
+        '''
+        self.user_registration()
+        loggedin_user = self.user_login()
+        token = json.loads(loggedin_user.data)['access_token']
+        headers = dict(Authorization="Bearer " + token)
+        self.client().post('/api/v1/categories/', headers=headers,
+                           data=self.category)
+        for letter in 'abcdef':
+            self.client().post('/api/v1/recipes/1/', headers=headers,
+                               data={"recipe_name": "recipe " + letter,
+                                     "ingredients": "garlic, " + letter})
+        with self.count_queries() as statements:
+            delete_res = self.client().delete('/api/v1/categories/1/',
+                                              headers=headers)
+        self.assertEqual(delete_res.status_code, 200)
+        self.assertEqual(len(statements), 1)
+        with self.app.app_context():
+            self.assertEqual(Recipe.query.count(), 0)
+            self.assertEqual(RecipeIngredient.query.count(), 0)
+
+        delete_res = self.client().delete('/api/v1/categories/1/',
+                                          headers=headers)
+        self.assertEqual(json.loads(delete_res.data)['message'],
+                         'Category with id 1 does not exist')
+
+    def test_delete_user_with_their_rows(self):
+        ''' Test that deleting a user deletes their categories and recipes
+        '''
+        self.user_registration()
+        self.create_category()
+        token = json.loads(self.user_login().data)['access_token']
+        self.client().post('/api/v1/recipes/1/', headers=dict(
+            Authorization="Bearer " + token), data=self.recipe)
+        with self.app.app_context():
+            db.session.delete(User.query.first())
+            db.session.commit()
+            self.assertEqual(Category.query.count(), 0)
+            self.assertEqual(Recipe.query.count(), 0)
+
+    def test_search_categories(self):
+        ''' Test that the API can search categories by name and description '''
+        self.user_registration()
+        loggedin_user = self.user_login()
+        token = json.loads(loggedin_user.data)['access_token']
+        for a_category in (self.category, self.category1):
+            self.client().post('/api/v1/categories/',
+                               headers=dict(Authorization="Bearer " + token),
+                               data=a_category)
+        search_res = self.client().get('/api/v1/categories/?q=one',
+                                       headers=dict(
+                                           Authorization="Bearer " + token))
+        self.assertEqual(search_res.status_code, 200)
+        search_res = json.loads(search_res.data)
+        self.assertEqual(
+            search_res['message'], 'These are the category search results')
+        self.assertEqual([a_category['category_name'] for a_category
+                          in search_res['categories']], ['category one'])
+
+    def test_cursor_pagination(self):
+        ''' Test that the API can page through categories with a cursor '''
+        self.user_registration()
+        loggedin_user = self.user_login()
+        token = json.loads(loggedin_user.data)['access_token']
+        headers = dict(Authorization="Bearer " + token)
+        names = ['category ' + letter for letter in 'abcdefg']
+        for name in names:
+            self.client().post('/api/v1/categories/', headers=headers,
+                               data={"category_name": name,
+                                     "description": "description"})
+        page_1 = self.client().get('/api/v1/categories/?per_page=5&cursor=',
+                                   headers=headers)
+        self.assertEqual(page_1.status_code, 200)
+        page_1 = json.loads(page_1.data)
+        self.assertNotIn('categoryPages', page_1)
+        page_2 = self.client().get(
+            '/api/v1/categories/?per_page=5&cursor={}'.format(
+                page_1['nextCursor']), headers=headers)
+        page_2 = json.loads(page_2.data)
+        self.assertIsNone(page_2['nextCursor'])
+        seen = [a_category['category_name'] for a_category
+                in page_1['categories'] + page_2['categories']]
+        self.assertEqual(seen, names[::-1])
+
+        bad_cursor = self.client().get('/api/v1/categories/?cursor=abc',
+                                       headers=headers)
+        self.assertEqual(bad_cursor.status_code, 400)
+
+    def test_category_queries_do_not_grow_with_page_size(self):
+        ''' Test that a page of categories and their recipes is loaded in the
+            same number of queries whatever the page size
+        '''
+        self.user_registration()
+        loggedin_user = self.user_login()
+        token = json.loads(loggedin_user.data)['access_token']
+        headers = dict(Authorization="Bearer " + token)
+        for letter in 'abcdefghij':
+            create_res = self.client().post(
+                '/api/v1/categories/', headers=headers,
+                data={"category_name": "category " + letter,
+                      "description": "description"})
+            create_res = json.loads(create_res.data)
+            for recipe_name in ('recipe', 'recipe one'):
+                self.client().post('/api/v1/recipes/{}/'.format(
+                    create_res['category_id']), headers=headers,
+                    data={"recipe_name": recipe_name,
+                          "ingredients": "description"})
+
+        query_counts = []
+        for per_page in (5, 10):
+            with self.count_queries() as statements:
+                view_res = self.client().get(
+                    '/api/v1/categories/?per_page={}'.format(per_page),
+                    headers=headers)
+            view_res = json.loads(view_res.data)
+            self.assertEqual(len(view_res['categories']), per_page)
+            self.assertEqual(len(view_res['categories'][0]['recipes']), 2)
+            query_counts.append(len(statements))
+        self.assertEqual(query_counts[0], query_counts[1])
+
+    def test_import_ndjson(self):
+        ''' Test that the API imports categories and recipes from NDJSON and
+            reports the rows it rejected
+        '''
+        self.user_registration()
+        loggedin_user = self.user_login()
+        token = json.loads(loggedin_user.data)['access_token']
+        headers = dict(Authorization="Bearer " + token)
+        lines = [
+            {"category_name": "breakfast", "description": "mornings",
+             "recipes": [{"recipe_name": "pancakes", "ingredients": "flour"},
+                         {"recipe_name": "pancakes", "ingredients": "eggs"},
+                         {"recipe_name": "bad name 1"}]},
+            {"category_name": "123"},
+        ]
+        body = '\n'.join(json.dumps(line) for line in lines) + '\n{oops\n'
+        import_res = self.client().post(
+            '/api/v1/categories/import/', headers=headers, data=body,
+            content_type='application/x-ndjson')
+        self.assertEqual(import_res.status_code, 200)
+        report = json.loads(import_res.data)
+        self.assertEqual(report['categories_created'], 1)
+        self.assertEqual(report['recipes_created'], 1)
+        self.assertEqual(
+            [(error['item'], error.get('recipe')) for error in report['errors']],
+            [(1, 3), (2, None), (3, None), (1, 2)])
+
+        view_res = self.client().get('/api/v1/categories/', headers=headers)
+        view_res = json.loads(view_res.data)
+        self.assertEqual(view_res['categories'][0]['category_name'],
+                         'breakfast')
+        self.assertEqual(len(view_res['categories'][0]['recipes']), 1)
+
+    def test_import_json_array_in_batches(self):
+        ''' Test that the API imports a JSON array read in small chunks and
+            written in small batches
+        '''
+        self.user_registration()
+        loggedin_user = self.user_login()
+        token = json.loads(loggedin_user.data)['access_token']
+        headers = dict(Authorization="Bearer " + token)
+        self.app.config['IMPORT_BATCH_SIZE'] = 3
+        categories = [{"category_name": "category " + letter,
+                       "recipes": [{"recipe_name": "recipe " + other}
+                                   for other in 'abc']}
+                      for letter in 'abcd']
+        read_size = import_helper.READ_SIZE
+        import_helper.READ_SIZE = 16
+        try:
+            import_res = self.client().post(
+                '/api/v1/categories/import/', headers=headers,
+                data=json.dumps(categories), content_type='application/json')
+        finally:
+            import_helper.READ_SIZE = read_size
+        report = json.loads(import_res.data)
+        self.assertEqual(report, {'categories_created': 4,
+                                  'recipes_created': 12, 'errors': []})
+
+    def test_export_round_trips_through_import(self):
+        ''' Test that the NDJSON export holds every category with its recipes
+            in the shape the import endpoint takes
+        '''
+        self.user_registration()
+        loggedin_user = self.user_login()
+        token = json.loads(loggedin_user.data)['access_token']
+        headers = dict(Authorization="Bearer " + token)
+        categories = [{"category_name": "category " + letter,
+                       "description": "description",
+                       "recipes": [{"recipe_name": "recipe " + other,
+                                    "ingredients": "description"}
+                                   for other in 'abc'[:index]]}
+                      for index, letter in enumerate('abcd')]
+        self.client().post('/api/v1/categories/import/', headers=headers,
+                           data=json.dumps(categories),
+                           content_type='application/json')
+
+        export_res = self.client().get('/api/v1/categories/export/',
+                                       headers=headers)
+        self.assertEqual(export_res.status_code, 200)
+        self.assertEqual(export_res.mimetype, 'application/x-ndjson')
+        exported = [json.loads(line) for line
+                    in export_res.data.decode('utf-8').splitlines()]
+        self.assertEqual(
+            [(a_category['category_name'],
+              [a_recipe['recipe_name'] for a_recipe in a_category['recipes']])
+             for a_category in exported],
+            [(a_category['category_name'],
+              [a_recipe['recipe_name'] for a_recipe in a_category['recipes']])
+             for a_category in categories])
+
+        csv_res = self.client().get('/api/v1/categories/export/?format=csv',
+                                    headers=headers)
+        self.assertEqual(csv_res.mimetype, 'text/csv')
+        csv_lines = csv_res.data.decode('utf-8').splitlines()
+        self.assertEqual(len(csv_lines), 5)
+        self.assertIn('category_name', csv_lines[0])
+
+
+class JsonArrayTestCase(TestCase):
+    ''' Tests for reading a JSON array body item by item '''
+
+    def items(self, body, **options):
+        ''' Parses a body read in chunks of 4 bytes '''
+        with patch.object(import_helper, 'READ_SIZE', 4):
+            return [document for _, document in iter_json_array(
+                io.BytesIO(body.encode('utf-8')), **options)]
+
+    def test_items_cut_by_chunks(self):
+        ''' Test that items, literals, escapes and numbers split between
+            chunks are read whole
+        '''
+        self.assertEqual(self.items(
+            ' [ {"a": true, "b": "\\u00e9t\\u00e9"} , 12345, [] ]\n'),
+            [{'a': True, 'b': 'été'}, 12345, []])
+        self.assertEqual(self.items('[]'), [])
+
+    def test_malformed_arrays(self):
+        ''' Test that commas, trailing data and a malformed item are not
+            passed over
+        '''
+        for body in ('[{"a":1} {"b":2}]', '[{"a":1},,{"c":3}]',
+                     '[,{"a":1}]', '[{"a":1}] trailing garbage',
+                     '[{"a":1}][]'):
+            with self.assertRaises(ImportParseError, msg=body) as raised:
+                self.items(body)
+            self.assertEqual(str(raised.exception),
+                             import_helper.MALFORMED)
+        with self.assertRaises(ImportParseError):
+            self.items('{"a":1}')
+        with self.assertRaises(ImportParseError):
+            self.items('[{"a":1}')
+
+    def test_malformed_item_not_buffered(self):
+        ''' Test that a malformed item fails without the rest of the body
+            being read
+        '''
+        body = io.BytesIO(('[{"a": x}, ' + '{"b": 2}, ' * 1000 + '{}]').encode(
+            'utf-8'))
+        with patch.object(import_helper, 'READ_SIZE', 16):
+            with self.assertRaises(ImportParseError):
+                list(iter_json_array(body))
+        self.assertLess(body.tell(), 64)
+        with self.assertRaises(ImportParseError):
+            self.items('["' + 'a' * 100 + '"]', max_item_size=50)
@@ -0,0 +1,55 @@
+''' This scripts tests the negotiated response compression '''
+
+import gzip
+import json
+
+from tests.test_base import BaseTestCase
+
+
+class CompressionTestCase(BaseTestCase):
+    ''' Tests for compressing responses '''
+
+    def test_large_response_is_gzipped(self):
+        ''' Test that the swagger spec is gzipped when the client takes it '''
+        plain = self.client().get('/api/v1/swagger.json')
+        self.assertNotIn('Content-Encoding', plain.headers)
+        self.assertIn('Accept-Encoding', plain.headers['Vary'])
+
+        res = self.client().get('/api/v1/swagger.json',
+                                headers={'Accept-Encoding': 'gzip'})
+        self.assertEqual(res.headers['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(res.data), plain.data)
+
+    def test_small_response_is_not_compressed(self):
+        ''' Test that bodies under COMPRESS_MIN_SIZE are sent as they are '''
+        res = self.client().get('/api/v2/hello/',
+                                headers={'Accept-Encoding': 'gzip'})
+        self.assertNotIn('Content-Encoding', res.headers)
+
+    def test_streamed_export_and_etag(self):
+        ''' Test that a streamed export is compressed and that the ETag of a
+            compressed response still matches on a conditional request
+        '''
+        self.user_registration()
+        loggedin_user = self.user_login()
+        token = json.loads(loggedin_user.data)['access_token']
+        headers = {'Authorization': "Bearer " + token,
+                   'Accept-Encoding': 'gzip'}
+        self.create_category()
+
+        export_res = self.client().get('/api/v1/categories/export/',
+                                       headers=headers)
+        self.assertEqual(export_res.headers['Content-Encoding'], 'gzip')
+        line = gzip.decompress(export_res.data).decode('utf-8')
+        self.assertEqual(json.loads(line)['category_name'], 'category')
+
+        self.app.config['COMPRESS_MIN_SIZE'] = 0
+        view_res = self.client().get('/api/v1/categories/', headers=headers)
+        self.assertEqual(view_res.headers['Content-Encoding'], 'gzip')
+        etag = view_res.headers['ETag']
+        self.assertTrue(etag.endswith('-gzip"'))
+        not_modified = self.client().get(
+            '/api/v1/categories/', headers=dict(headers, **{
+                'If-None-Match': etag}))
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.headers['ETag'], etag)
@@ -0,0 +1,52 @@
+''' This scripts tests the timed connection pool '''
+
+from unittest import TestCase
+
+from sqlalchemy import create_engine, exc
+from sqlalchemy.engine.url import make_url
+
+from app.db_pool import TimedQueuePool, pool_options, pool_stats
+
+
+class TimedQueuePoolTestCase(TestCase):
+    ''' Tests for the pool's gauges, pings and fork safety '''
+
+    def setUp(self):
+        self.engine = create_engine(
+            'sqlite://', poolclass=TimedQueuePool, pool_size=1,
+            max_overflow=0, pool_timeout=0.1, pre_ping=True)
+
+    def test_gauges_count_checkouts_and_timeouts(self):
+        ''' Test that checkouts, connections in use and timeouts are counted
+        '''
+        connection = self.engine.connect()
+        self.assertEqual(pool_stats(self.engine)['in_use'], 1)
+        with self.assertRaises(exc.TimeoutError):
+            self.engine.connect()
+        connection.close()
+        stats = pool_stats(self.engine)
+        self.assertEqual(stats['in_use'], 0)
+        self.assertEqual(stats['checkouts'], 1)
+        self.assertEqual(stats['timeouts'], 1)
+        self.assertGreaterEqual(stats['max_wait_seconds'], 0.1)
+
+    def test_connection_from_another_process_is_replaced(self):
+        ''' Test that a connection opened before a fork is not reused '''
+        connection = self.engine.connect()
+        first = connection.connection.connection
+        connection.connection._connection_record.info['pid'] = -1
+        connection.close()
+        connection = self.engine.connect()
+        self.assertIsNot(connection.connection.connection, first)
+        self.assertEqual(connection.scalar('SELECT 1'), 1)
+        connection.close()
+
+    def test_pool_options(self):
+        ''' Test that the settings only apply to pooled databases '''
+        config = {'SQLALCHEMY_POOL_PRE_PING': True,
+                  'SQLALCHEMY_STATEMENT_TIMEOUT': 5000}
+        self.assertEqual(pool_options(config, make_url('sqlite://')), {})
+        options = pool_options(config, make_url('postgresql://localhost/db'))
+        self.assertIs(options['poolclass'], TimedQueuePool)
+        self.assertEqual(options['connect_args'],
+                         {'options': '-c statement_timeout=5000'})
@@ -0,0 +1,97 @@
+''' This scripts tests the read path workers '''
+
+import json
+import sys
+from unittest import TestCase
+from unittest.mock import Mock, call, patch
+
+import psycopg2
+from psycopg2 import extensions
+
+from app.green import init_green, is_evented, wait_callback
+from tests.test_base import BaseTestCase
+
+
+class ReadPathTestCase(BaseTestCase):
+    ''' Tests for the workers serving only reads '''
+
+    def test_read_only(self):
+        ''' Test that a READ_ONLY app serves reads and refuses writes '''
+        self.user_registration()
+        token = json.loads(self.user_login().data)['access_token']
+        headers = {'Authorization': "Bearer " + token}
+        self.create_category()
+        self.app.config['READ_ONLY'] = True
+        init_green(self.app)
+
+        res = self.client().get('/api/v1/categories/1/', headers=headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(json.loads(res.data)['category_name'], 'category')
+        for method in ('POST', 'PUT', 'DELETE'):
+            res = self.client().open('/api/v1/categories/1/', method=method,
+                                     headers=headers, data=self.category1)
+            self.assertEqual(res.status_code, 405)
+            self.assertEqual(res.headers['Allow'], 'GET, HEAD, OPTIONS')
+        res = self.client().post('/api/v1/auth/login/', data=self.user)
+        self.assertEqual(res.status_code, 405)
+
+    def test_not_evented(self):
+        ''' Test that the sync workers leave psycopg2 blocking '''
+        self.assertFalse(is_evented())
+
+    def test_evented_pool(self):
+        ''' Test that a gevent worker sizes its pool for the requests in
+            flight and has psycopg2 wait on the event loop
+        '''
+        self.addCleanup(extensions.set_wait_callback, None)
+        with patch('app.green.is_evented', return_value=True):
+            init_green(self.app)
+
+        self.assertEqual(self.app.config['SQLALCHEMY_POOL_SIZE'],
+                         self.app.config['GREEN_POOL_SIZE'])
+        self.assertEqual(self.app.config['SQLALCHEMY_MAX_OVERFLOW'],
+                         self.app.config['GREEN_MAX_OVERFLOW'])
+        self.assertIs(extensions.get_wait_callback(), wait_callback)
+
+
+class FakeConnection(object):
+    ''' Stands in for a psycopg2 connection, polling the given states '''
+
+    def __init__(self, *states):
+        self.states = list(states)
+
+    def poll(self):
+        return self.states.pop(0)
+
+    def fileno(self):
+        return 7
+
+
+class WaitCallbackTestCase(TestCase):
+    ''' Tests for psycopg2 waiting on the event loop '''
+
+    def setUp(self):
+        # gevent is only installed where the gevent workers run
+        self.socket = Mock()
+        patcher = patch.dict(sys.modules, {'gevent.socket': self.socket})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_poll_loop(self):
+        ''' Test that the loop waits on the socket until the query is done '''
+        connection = FakeConnection(
+            extensions.POLL_WRITE, extensions.POLL_READ,
+            extensions.POLL_READ, extensions.POLL_OK)
+        wait_callback(connection, timeout=5)
+
+        self.assertEqual(connection.states, [])
+        self.socket.wait_write.assert_called_once_with(7, timeout=5)
+        self.assertEqual(self.socket.wait_read.call_args_list,
+                         [call(7, timeout=5)] * 2)
+
+    def test_bad_state(self):
+        ''' Test that a state psycopg2 does not document is an error '''
+        connection = FakeConnection(extensions.POLL_READ, 99)
+        with self.assertRaises(psycopg2.OperationalError):
+            wait_callback(connection)
+        self.socket.wait_read.assert_called_once_with(7, timeout=None)
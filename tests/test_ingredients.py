@@ -0,0 +1,103 @@
+''' This scripts tests the ingredient index and finding recipes with it '''
+
+import io
+import json
+
+from app.ingredient_index import parse_ingredients
+from tests.test_base import BaseTestCase
+
+
+class IngredientsTestCase(BaseTestCase):
+    ''' Tests for finding recipes by their ingredients '''
+
+    def setUp(self):
+        super().setUp()
+        self.user_registration()
+        token = json.loads(self.user_login().data)['access_token']
+        self.headers = {'Authorization': "Bearer " + token}
+        self.create_category()
+        for name, ingredients in (
+                ('pasta', '200g spaghetti, 2 cloves garlic, 3 tomatoes'),
+                ('salad', 'tomato, cucumber and olive oil'),
+                ('toast', 'bread & garlic')):
+            self.client().post('/api/v1/recipes/1/', headers=self.headers,
+                               data={'recipe_name': name,
+                                     'ingredients': ingredients})
+
+    def find(self, ingredients, match='any'):
+        ''' Returns the names of the recipes using the ingredients '''
+        res = self.client().get(
+            f'/api/v1/recipes/ingredients/?ingredients={ingredients}'
+            f'&match={match}', headers=self.headers)
+        self.assertEqual(res.status_code, 200)
+        return [a_recipe['recipe_name']
+                for a_recipe in json.loads(res.data)['recipes']]
+
+    def test_parse_ingredients(self):
+        ''' Test that quantities and units are left out of the names '''
+        self.assertEqual(
+            parse_ingredients('2 cloves garlic; 3 Tomatoes\n1 cup of '
+                              'chopped berries and salt to taste'),
+            {'garlic', 'tomato', 'berry', 'salt'})
+        self.assertEqual(parse_ingredients('olive oil + grass'),
+                         {'olive oil', 'grass'})
+        self.assertEqual(parse_ingredients('2 cups, 1'), set())
+
+    def test_matches(self):
+        ''' Test finding the recipes using any, all or only the ingredients
+        '''
+        self.assertEqual(self.find('garlic,tomatoes'),
+                         ['toast', 'salad', 'pasta'])
+        self.assertEqual(self.find('garlic,tomato', 'all'), ['pasta'])
+        self.assertEqual(self.find('garlic,bread,salt', 'only'), ['toast'])
+        self.assertEqual(self.find('garlic,tomato,spaghetti', 'only'),
+                         ['pasta'])
+
+    def test_no_match(self):
+        ''' Test the messages of searches finding nothing or nothing to find
+        '''
+        res = self.client().get(
+            '/api/v1/recipes/ingredients/?ingredients=saffron',
+            headers=self.headers)
+        self.assertEqual(json.loads(res.data)['message'],
+                         'There are no recipes on page 1')
+        res = self.client().get(
+            '/api/v1/recipes/ingredients/?ingredients=2 cups',
+            headers=self.headers)
+        self.assertEqual(res.status_code, 400)
+        res = self.client().get(
+            '/api/v1/recipes/ingredients/?ingredients=garlic&match=some',
+            headers=self.headers)
+        self.assertEqual(res.status_code, 400)
+
+    def test_edit_and_delete(self):
+        ''' Test that edited recipes are reindexed and deleted ones dropped
+        '''
+        self.client().put('/api/v1/recipes/1/3/', headers=self.headers,
+                          data={'ingredients': 'bread, butter'})
+        self.assertEqual(self.find('garlic'), ['pasta'])
+        self.assertEqual(self.find('butter'), ['toast'])
+        self.client().delete('/api/v1/recipes/1/1/', headers=self.headers)
+        self.assertEqual(self.find('garlic,tomato'), ['salad'])
+
+    def test_other_users(self):
+        ''' Test that only the user's own recipes are found '''
+        self.user = {'username': 'another', 'password': 'password',
+                     'email': 'another@email.com'}
+        self.user_registration()
+        token = json.loads(self.user_login().data)['access_token']
+        self.headers = {'Authorization': "Bearer " + token}
+        res = self.client().get(
+            '/api/v1/recipes/ingredients/?ingredients=garlic',
+            headers=self.headers)
+        self.assertNotIn('recipes', json.loads(res.data))
+
+    def test_imported_recipes(self):
+        ''' Test that imported recipes are indexed '''
+        self.client().post(
+            '/api/v1/categories/import/', headers=self.headers,
+            data=io.BytesIO(b'{"category_name": "imported", "recipes": ['
+                            b'{"recipe_name": "soup", '
+                            b'"ingredients": "leeks, potatoes"}]}'),
+            content_type='application/x-ndjson')
+        self.assertEqual(self.find('potato,leek', 'only'), ['soup'])
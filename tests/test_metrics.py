@@ -0,0 +1,61 @@
+''' This scripts tests the /metrics endpoint '''
+
+import json
+import re
+
+from tests.test_base import BaseTestCase
+
+
+class MetricsTestCase(BaseTestCase):
+    ''' Tests for recording and serving the app's metrics '''
+
+    def sample(self, text, name, **labels):
+        ''' Returns the value of a sample in the metrics text '''
+        for line in text.splitlines():
+            match = re.match(r'^(\w+)(?:\{(.*)\})? (\S+)$', line)
+            if not match or match.group(1) != name:
+                continue
+            found = dict(re.findall(r'(\w+)="([^"]*)"', match.group(2) or ''))
+            if all(found.get(key) == str(value)
+                   for key, value in labels.items()):
+                return float(match.group(3))
+        return None
+
+    def test_metrics(self):
+        ''' Test that requests, SQL, bcrypt and the cache are measured '''
+        self.user_registration()
+        token = json.loads(self.user_login().data)['access_token']
+        headers = {'Authorization': "Bearer " + token}
+        self.create_category()
+        self.client().get('/api/v1/categories/', headers=headers)
+        self.client().get('/api/v1/categories/', headers=headers)
+        self.client().get('/api/v1/categories/1000/', headers=headers)
+
+        res = self.client().get('/metrics')
+        self.assertEqual(res.status_code, 200)
+        self.assertTrue(res.content_type.startswith('text/plain'))
+        text = res.get_data(as_text=True)
+        endpoint = 'api_v1.categories_categories'
+        self.assertEqual(self.sample(
+            text, 'app_request_duration_seconds_count',
+            endpoint=endpoint, method='GET'), 2)
+        self.assertEqual(self.sample(
+            text, 'app_request_duration_seconds_bucket',
+            endpoint=endpoint, method='GET', le='+Inf'), 2)
+        self.assertEqual(self.sample(
+            text, 'app_requests_total', endpoint=endpoint, method='POST',
+            status=201), 1)
+        self.assertEqual(self.sample(
+            text, 'app_requests_total', endpoint='api_v1.categories_categoryy',
+            method='GET', status=404), 1)
+        self.assertGreater(self.sample(
+            text, 'app_request_sql_queries_sum', endpoint=endpoint,
+            method='POST'), 0)
+        self.assertGreater(self.sample(
+            text, 'app_request_sql_seconds_total', endpoint=endpoint,
+            method='POST'), 0)
+        self.assertEqual(self.sample(text, 'app_bcrypt_operations_total'), 3)
+        self.assertGreater(self.sample(text, 'app_bcrypt_seconds_total'), 0)
+        # the repeated listing is a hit, the first one and the 404 are misses
+        self.assertAlmostEqual(
+            self.sample(text, 'app_response_cache_hit_ratio'), 1 / 3)
@@ -0,0 +1,63 @@
+''' This scripts tests the bounded password hashing pool '''
+
+import json
+import time
+from unittest import TestCase
+
+from app.password_pool import PasswordPool, PasswordPoolBusy
+from tests.test_base import BaseTestCase
+
+
+class PasswordPoolTestCase(TestCase):
+    ''' Tests for hashing passwords in worker processes '''
+
+    def test_hash_and_check_in_worker_process(self):
+        ''' Test that a password hashed in the pool checks out '''
+        pool = PasswordPool(workers=1, max_queue=0)
+        hashed = pool.hash('password')
+        self.assertTrue(pool.check(hashed, 'password'))
+        self.assertFalse(pool.check(hashed, 'wrong_password'))
+        stats = pool.stats()
+        self.assertEqual(stats['completed'], 3)
+        self.assertEqual(stats['in_flight'], 0)
+        self.assertGreater(stats['run_seconds'], 0)
+
+    def test_saturated_pool_rejects(self):
+        ''' Test that a job is rejected at once when every slot is taken '''
+        pool = PasswordPool(workers=0, max_queue=0)
+        pool._slots.acquire()
+        with self.assertRaises(PasswordPoolBusy):
+            pool.hash('password')
+        self.assertEqual(pool.stats()['rejected'], 1)
+
+    def test_timed_out_job_keeps_its_slot(self):
+        ''' Test that a job the caller gave up on holds its slot until it
+            ends
+        '''
+        pool = PasswordPool(workers=1, max_queue=0, timeout=0.2)
+        with self.assertRaises(PasswordPoolBusy):
+            pool._run(time.sleep, 1)
+        self.assertEqual(pool.stats()['in_flight'], 1)
+        with self.assertRaises(PasswordPoolBusy):
+            pool.hash('password')
+        deadline = time.monotonic() + 10
+        while pool.stats()['in_flight'] and time.monotonic() < deadline:
+            time.sleep(0.05)
+        self.assertEqual(pool.stats()['in_flight'], 0)
+        self.assertIsNone(pool._run(time.sleep, 0))
+        self.assertEqual(pool.stats()['rejected'], 2)
+
+
+class PasswordPoolBusyTestCase(BaseTestCase):
+    ''' Tests for the response when the password pool is saturated '''
+
+    def test_login_gets_503_when_pool_is_busy(self):
+        ''' Test that logins are turned away with a 503 when saturated '''
+        self.user_registration()
+        pool = self.app.extensions['password_pool']
+        while pool._slots.acquire(blocking=False):
+            pass
+        res = self.user_login()
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(json.loads(res.data)['message'],
+                         'The server is busy, try again shortly')
@@ -0,0 +1,100 @@
+''' This scripts tests the per-request query budgets '''
+
+import json
+from unittest.mock import patch
+
+from app.apis.categories import Categories
+from app.query_budget import QueryBudgetExceeded
+from tests.test_base import BaseTestCase
+
+# resource methods whose statements grow with their input or run while the
+# response streams, after the budget is checked
+UNBUDGETED = {'ImportCategories.post', 'ExportCategories.get',
+              'ExportRecipes.get', 'Batch.post', 'Hello.get'}
+
+
+class QueryBudgetTestCase(BaseTestCase):
+    ''' Tests for counting each request's statements against its budget '''
+
+    def setUp(self):
+        super().setUp()
+        # every response runs its queries, none is served from the cache
+        self.app.extensions.pop('response_cache', None)
+        self.user_registration()
+        token = json.loads(self.user_login().data)['access_token']
+        self.headers = {'Authorization': "Bearer " + token}
+
+    def test_every_method_has_a_budget(self):
+        ''' Test that each resource method declares a query budget '''
+        missing = []
+        for view in self.app.view_functions.values():
+            resource = getattr(view, 'view_class', None)
+            if not getattr(resource, '__module__', '').startswith('app.'):
+                continue
+            for method in getattr(resource, 'methods', None) or ():
+                name = f'{resource.__name__}.{method.lower()}'
+                handler = getattr(resource, method.lower())
+                if not hasattr(handler, 'query_budget') and \
+                        name not in UNBUDGETED:
+                    missing.append(name)
+        self.assertEqual(missing, [])
+
+    def test_full_pages_within_budget(self):
+        ''' Test that listings stay within budget when a page is full and
+            paginating needs a count
+        '''
+        for letter in 'abcdefghijkl':
+            self.client().post('/api/v1/categories/', headers=self.headers,
+                               data={'category_name': f'category {letter}',
+                                     'description': 'description'})
+            self.client().post('/api/v1/recipes/1/', headers=self.headers,
+                               data={'recipe_name': f'recipe {letter}',
+                                     'ingredients': 'salt'})
+        for path in ('/api/v1/categories/', '/api/v1/categories/?page=2',
+                     '/api/v1/categories/?q=category',
+                     '/api/v1/categories/?cursor=', '/api/v1/categories/1/',
+                     '/api/v1/recipes/', '/api/v1/recipes/?q=recipe',
+                     '/api/v1/recipes/1/', '/api/v1/recipes/1/?page=2',
+                     '/api/v1/recipes/1/?q=recipe', '/api/v1/recipes/1/1/'):
+            res = self.client().get(path, headers=self.headers)
+            self.assertEqual(res.status_code, 200, path)
+
+    def test_over_budget(self):
+        ''' Test that a request over its budget fails, listing its statements
+            tagged with the endpoint
+        '''
+        with patch.object(Categories.get, 'query_budget', 1):
+            res = self.client().get('/api/v1/categories/',
+                                    headers=self.headers)
+        self.assertEqual(res.status_code, 500)
+        errors = self.app.extensions['query_budget_errors']
+        error = errors.pop()
+        self.assertIsInstance(error, QueryBudgetExceeded)
+        self.assertEqual(error.budget, 1)
+        self.assertGreater(len(error.records), 1)
+        self.assertEqual({(record.endpoint, record.method)
+                          for record in error.records},
+                         {('api_v1.categories_categories', 'GET')})
+
+    def test_over_budget_logged(self):
+        ''' Test that QUERY_BUDGETS set to log only warns '''
+        self.app.config['QUERY_BUDGETS'] = 'log'
+        with patch.object(Categories.get, 'query_budget', 1), \
+                patch.object(self.app.logger, 'warning') as warning:
+            res = self.client().get('/api/v1/categories/',
+                                    headers=self.headers)
+        self.assertEqual(res.status_code, 200)
+        self.assertIn('api_v1.categories_categories', warning.call_args[0][0])
+
+    def test_empty_category(self):
+        ''' Test that listing an empty category is a 404 without querying it
+            twice
+        '''
+        self.create_category()
+        with self.count_queries() as statements:
+            res = self.client().get('/api/v1/recipes/1/', headers=self.headers)
+        self.assertEqual(res.status_code, 404)
+        self.assertEqual(json.loads(res.data)['message'],
+                         'No recipes in category 1')
+        # the version and the page
+        self.assertEqual(len(statements), 2)
@@ -0,0 +1,177 @@
+''' This scripts checks the query plans of every endpoint's queries.
+
+    The tables are seeded with a realistic number of rows for many users,
+    then each endpoint is called and the plan of every statement it ran is
+    captured with EXPLAIN. A statement reading a whole table fails the test.
+'''
+
+import io
+import json
+import re
+from datetime import datetime
+
+from sqlalchemy import event
+
+from app import db
+from app.ingredient_index import index_recipes
+from app.models.category import Category
+from app.models.recipe import Recipe
+from app.models.user import User
+from tests.test_base import BaseTestCase
+
+SEED_USERS = 50
+CATEGORIES_PER_USER = 20
+RECIPES_PER_CATEGORY = 10
+TABLES = ('users', 'categories', 'recipes', 'blacklisted', 'ingredients',
+          'recipe_ingredients')
+SQLITE_SCAN = re.compile(r'^SCAN (\w+)')
+
+
+def _sqlite_scans(cursor, statement, parameters):
+    cursor.execute('EXPLAIN QUERY PLAN ' + statement, parameters)
+    details = [row[-1] for row in cursor.fetchall()]
+    scans = [SQLITE_SCAN.match(detail) for detail in details]
+    return [scan.group(1) for scan in scans
+            if scan and scan.group(1) in TABLES], details
+
+
+def _postgresql_scans(cursor, statement, parameters):
+    cursor.execute('EXPLAIN (FORMAT JSON) ' + statement, parameters)
+    plan = cursor.fetchone()[0][0]['Plan']
+    scans = []
+    nodes = [plan]
+    while nodes:
+        node = nodes.pop()
+        if (node['Node Type'] == 'Seq Scan' and
+                node['Relation Name'] in TABLES):
+            scans.append(node['Relation Name'])
+        nodes.extend(node.get('Plans', []))
+    return scans, plan
+
+
+class QueryPlanTestCase(BaseTestCase):
+    ''' Tests that no endpoint scans a whole table '''
+
+    def setUp(self):
+        super().setUp()
+        # every request must reach the database
+        self.app.extensions.pop('response_cache', None)
+        self.user_registration()
+        token = json.loads(self.user_login().data)['access_token']
+        self.headers = {'Authorization': "Bearer " + token}
+        self.category_id = json.loads(
+            self.create_category().data)['category_id']
+        self.client().post(f'/api/v1/recipes/{self.category_id}/',
+                           headers=self.headers, data=self.recipe)
+        with self.app.app_context():
+            self.seed()
+
+    def seed(self):
+        ''' Adds SEED_USERS users with their categories and recipes '''
+        now = datetime.now()
+        db.session.execute(User.__table__.insert(), [
+            {'username': f'seed{number}', 'email': f'seed{number}@email.com',
+             'password': 'x'} for number in range(SEED_USERS)])
+        user_ids = [user_id for user_id, in db.session.query(
+            User.user_id).filter(User.username.like('seed%'))]
+        db.session.execute(Category.__table__.insert(), [
+            {'category_name': f'category {number}', 'description': 'seeded',
+             'created_by': user_id, 'date_created': now, 'date_modified': now}
+            for user_id in user_ids for number in range(CATEGORIES_PER_USER)])
+        categories = db.session.query(
+            Category.category_id, Category.created_by).filter(
+                Category.created_by.in_(user_ids)).all()
+        db.session.execute(Recipe.__table__.insert(), [
+            {'recipe_name': f'recipe {number}', 'ingredients': 'flour, eggs',
+             'category_id': category_id, 'created_by': user_id,
+             'date_created': now, 'date_modified': now}
+            for category_id, user_id in categories
+            for number in range(RECIPES_PER_CATEGORY)])
+        index_recipes(db.session.connection(), db.session.query(
+            Recipe.recipe_id, Recipe.created_by, Recipe.ingredients).filter(
+                Recipe.created_by.in_(user_ids)).all(), replace=False)
+        db.session.commit()
+        db.session.execute('ANALYZE')
+        db.session.commit()
+
+    def call_endpoints(self):
+        ''' Calls every endpoint that reads or writes categories and recipes
+        '''
+        client = self.client()
+        headers = self.headers
+        category = f'/api/v1/categories/{self.category_id}/'
+        recipes = f'/api/v1/recipes/{self.category_id}/'
+        client.post('/api/v1/auth/register/', data={
+            'username': 'another', 'password': 'password',
+            'email': 'another@email.com'})
+        self.user_login()
+        client.get('/api/v1/categories/', headers=headers)
+        client.get('/api/v1/categories/?q=categ', headers=headers)
+        client.get('/api/v1/categories/?cursor=', headers=headers)
+        client.get('/api/v1/categories/export/', headers=headers).get_data()
+        client.post('/api/v1/categories/', headers=headers,
+                    data=self.category1)
+        client.post('/api/v1/categories/import/', headers=headers,
+                    data=io.BytesIO(b'{"category_name": "imported", '
+                                    b'"recipes": [{"recipe_name": "one"}]}'),
+                    content_type='application/x-ndjson')
+        client.get(category, headers=headers)
+        client.put(category, headers=headers, data={'description': 'edited'})
+        client.get('/api/v1/recipes/', headers=headers)
+        client.get('/api/v1/recipes/?q=rec', headers=headers)
+        client.get('/api/v1/recipes/export/', headers=headers).get_data()
+        for match in ('any', 'all', 'only'):
+            client.get('/api/v1/recipes/ingredients/?ingredients=flour,eggs'
+                       f'&match={match}', headers=headers)
+        client.post(recipes, headers=headers, data=self.recipe1)
+        client.get(recipes, headers=headers)
+        client.get(recipes + '?q=rec', headers=headers)
+        client.get(recipes + '?cursor=', headers=headers)
+        client.get(recipes + '1/', headers=headers)
+        client.put(recipes + '1/', headers=headers,
+                   data={'ingredients': 'edited'})
+        client.delete(recipes + '1/', headers=headers)
+        for method, body in (
+                ('PUT', {'filter': {'category_id': self.category_id,
+                                    'q': 'rec'},
+                         'set': {'category_id': self.category_id}}),
+                ('PUT', {'ids': [2, 3], 'set': {'ingredients': 'eggs'}}),
+                ('DELETE', {'filter': {'category_id': self.category_id,
+                                       'created_after': '2000-01-01'}})):
+            client.open('/api/v1/recipes/bulk/', method=method,
+                        headers=headers, data=json.dumps(body),
+                        content_type='application/json')
+        client.delete(category, headers=headers)
+        client.delete('/api/v1/auth/logout/', headers=headers)
+
+    def test_no_sequential_scans(self):
+        ''' Test that every statement the endpoints run uses an index '''
+        statements = {}
+
+        def record(conn, cursor, statement, parameters, context, executemany):
+            if not executemany and statement.lstrip().upper().startswith(
+                    ('SELECT', 'UPDATE', 'DELETE')):
+                statements.setdefault(statement, parameters)
+
+        with self.app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            self.call_endpoints()
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        self.assertTrue(statements)
+
+        explain = (_postgresql_scans if engine.dialect.name == 'postgresql'
+                   else _sqlite_scans)
+        connection = engine.raw_connection()
+        failures = []
+        try:
+            cursor = connection.cursor()
+            for statement, parameters in statements.items():
+                scans, plan = explain(cursor, statement, parameters)
+                if scans:
+                    failures.append(f'{statement}\n{plan}')
+        finally:
+            connection.close()
+        self.assertEqual(failures, [], '\n\n'.join(failures))
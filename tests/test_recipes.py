@@ -1,5 +1,7 @@
 ''' This scripts tests the recipe crud functionality '''
 
+import csv
+import io
 import json
 
 from tests.test_base import BaseTestCase
@@ -141,3 +143,138 @@ class RecipeTestCase(BaseTestCase):
         delete_res = json.loads(delete_res.data)
         # print(self.recipe)
         self.assertEqual(delete_res['message'], 'Recipe was deleted')
+
+    def test_search_recipes(self):
+        """ Test that the API ranks recipes matching every search word """
+
+        self.user_registration()
+        loggedin_user = self.user_login()
+        token = json.loads(loggedin_user.data)['access_token']
+        category_res = self.create_category()
+        category_res = json.loads(category_res.data)
+        recipes = [{"recipe_name": "tomato soup",
+                    "ingredients": "tomato, garlic, water"},
+                   {"recipe_name": "garlic bread",
+                    "ingredients": "bread, garlic, butter"},
+                   {"recipe_name": "pancakes",
+                    "ingredients": "flour, milk, eggs"}]
+        for a_recipe in recipes:
+            self.client().post('/api/v1/recipes/{}/'.format(
+                category_res['category_id']), headers=dict(
+                    Authorization="Bearer " + token), data=a_recipe)
+
+        search_res = self.client().get('/api/v1/recipes/?q=garl',
+                                       headers=dict(
+                                           Authorization="Bearer " + token))
+        self.assertEqual(search_res.status_code, 200)
+        search_res = json.loads(search_res.data)
+        names = [a_recipe['recipe_name'] for a_recipe in search_res['recipes']]
+        self.assertCountEqual(names, ['tomato soup', 'garlic bread'])
+
+        search_res = self.client().get('/api/v1/recipes/{}/?q=garlic+tom'.format(
+            category_res['category_id']), headers=dict(
+                Authorization="Bearer " + token))
+        search_res = json.loads(search_res.data)
+        names = [a_recipe['recipe_name'] for a_recipe in search_res['recipes']]
+        self.assertEqual(names, ['tomato soup'])
+
+    def test_cursor_pagination(self):
+        """ Test that the API can page through recipes with a cursor """
+
+        self.user_registration()
+        loggedin_user = self.user_login()
+        token = json.loads(loggedin_user.data)['access_token']
+        headers = dict(Authorization="Bearer " + token)
+        category_res = json.loads(self.create_category().data)
+        names = ['recipe ' + letter for letter in 'abcdef']
+        for name in names:
+            self.client().post('/api/v1/recipes/{}/'.format(
+                category_res['category_id']), headers=headers,
+                data={"recipe_name": name, "ingredients": "description"})
+        seen = []
+        cursor = ''
+        while cursor is not None:
+            page = self.client().get('/api/v1/recipes/{}/?cursor={}'.format(
+                category_res['category_id'], cursor), headers=headers)
+            self.assertEqual(page.status_code, 200)
+            page = json.loads(page.data)
+            seen.extend(a_recipe['recipe_name'] for a_recipe in page['recipes'])
+            cursor = page['nextCursor']
+        self.assertEqual(seen, names[::-1])
+
+    def test_export_recipes(self):
+        """ Test that the API streams every recipe of a user as CSV """
+
+        self.user_registration()
+        loggedin_user = self.user_login()
+        token = json.loads(loggedin_user.data)['access_token']
+        headers = dict(Authorization="Bearer " + token)
+        category_res = json.loads(self.create_category().data)
+        for a_recipe in (self.recipe, self.recipe1):
+            self.client().post('/api/v1/recipes/{}/'.format(
+                category_res['category_id']), headers=headers, data=a_recipe)
+
+        export_res = self.client().get('/api/v1/recipes/export/?format=csv',
+                                       headers=headers)
+        self.assertEqual(export_res.status_code, 200)
+        rows = list(csv.DictReader(
+            io.StringIO(export_res.data.decode('utf-8'))))
+        self.assertEqual([row['recipe_name'] for row in rows],
+                         ['recipe', 'recipe one'])
+        self.assertEqual(rows[0]['category'],
+                         str(category_res['category_id']))
+
+    def test_conditional_get(self):
+        """ Test that an unchanged recipe is answered with a 304 and an
+            edited one with a new ETag
+        """
+
+        self.user_registration()
+        loggedin_user = self.user_login()
+        token = json.loads(loggedin_user.data)['access_token']
+        headers = dict(Authorization="Bearer " + token)
+        category_res = json.loads(self.create_category().data)
+        create_res = self.client().post('/api/v1/recipes/{}/'.format(
+            category_res['category_id']), headers=headers, data=self.recipe)
+        create_res = json.loads(create_res.data)
+        url = '/api/v1/recipes/{}/{}/'.format(category_res['category_id'],
+                                               create_res['recipe_id'])
+
+        view_res = self.client().get(url, headers=headers)
+        self.assertEqual(view_res.status_code, 200)
+        etag = view_res.headers['ETag']
+        self.assertEqual(view_res.headers['Cache-Control'], 'private, no-cache')
+        self.assertEqual(view_res.headers['Vary'],
+                         'Authorization, Accept-Encoding')
+
+        not_modified = self.client().get(
+            url, headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertEqual(not_modified.status_code, 304)
+        self.assertEqual(not_modified.data, b'')
+        since = self.client().get(url, headers=dict(
+            headers, **{'If-Modified-Since': view_res.headers['Last-Modified']}))
+        self.assertEqual(since.status_code, 304)
+
+        # an edit in the second of the last GET
+        self.client().put(url, headers=headers,
+                          data={'recipe_name': 'recipe',
+                                'ingredients': 'new ingredients'})
+        edited = self.client().get(
+            url, headers=dict(headers, **{'If-None-Match': etag}))
+        self.assertEqual(edited.status_code, 200)
+        self.assertEqual(json.loads(edited.data)['ingredients'],
+                         'new ingredients')
+        etag = edited.headers['ETag']
+
+        list_res = self.client().get('/api/v1/recipes/', headers=headers)
+        # a deletion leaves the latest date_modified of a list as it was
+        self.assertNotIn('Last-Modified', list_res.headers)
+        self.client().delete(url, headers=headers)
+        changed = self.client().get('/api/v1/recipes/', headers=dict(
+            headers, **{'If-None-Match': list_res.headers['ETag']}))
+        self.assertEqual(changed.status_code, 200)
+        self.assertNotEqual(changed.headers['ETag'], list_res.headers['ETag'])
+        last_modified = view_res.headers['Last-Modified']
+        since = self.client().get('/api/v1/recipes/', headers=dict(
+            headers, **{'If-Modified-Since': last_modified}))
+        self.assertEqual(since.status_code, 200)
@@ -0,0 +1,112 @@
+''' This scripts tests routing reads to a replica, a second SQLite file '''
+
+import json
+import os
+import tempfile
+from unittest.mock import patch
+
+from sqlalchemy import event
+
+from app import create_app, db
+from app.response_cache import LocalStore
+from app.revocation_cache import RevocationCache
+from instance.config import app_config
+from tests.test_base import BaseTestCase
+
+
+class ReplicaTestCase(BaseTestCase):
+    ''' Tests for reading from the replica and writing to the primary '''
+
+    def setUp(self):
+        replica = os.path.join(tempfile.mkdtemp(), 'replica.db')
+        # the responses are not cached, every GET reaches the database
+        with patch.multiple(app_config['testing'],
+                            REPLICA_DATABASE_URLS=f'sqlite:///{replica}',
+                            RESPONSE_CACHE_BACKEND='none'):
+            super().setUp()
+        with self.app.app_context():
+            self.primary = db.engine
+            self.replica = db.get_engine(self.app, 'replica_1')
+        db.Model.metadata.create_all(self.replica)
+        self.router = self.app.extensions['replica_router']
+        self.user_registration()
+        token = json.loads(self.user_login().data)['access_token']
+        self.headers = {'Authorization': "Bearer " + token}
+
+    def get_category(self):
+        ''' Returns the status code of a GET of the first category '''
+        return self.client().get('/api/v1/categories/1/',
+                                 headers=self.headers).status_code
+
+    def replicate(self):
+        ''' Copies the primary's rows to the replica '''
+        for table in reversed(db.Model.metadata.sorted_tables):
+            self.replica.execute(table.delete())
+        for table in db.Model.metadata.sorted_tables:
+            rows = [dict(row) for row in self.primary.execute(table.select())]
+            if rows:
+                self.replica.execute(table.insert(), rows)
+
+    def test_reads_replica_after_sticky_window(self):
+        ''' Test that a user reads their write from the primary, and from
+            the replica once the window is over
+        '''
+        self.client().post('/api/v1/categories/', headers=self.headers,
+                           data=self.category)
+        self.assertEqual(self.get_category(), 200)
+        # the window is over
+        self.router.store = LocalStore()
+        self.assertEqual(self.get_category(), 404)
+        self.replicate()
+        self.assertEqual(self.get_category(), 200)
+
+    def test_writes_and_auth_on_primary(self):
+        ''' Test that writes, the token's user and the revocation check never
+            run on the replica, which has no users
+        '''
+        statements = []
+        event.listen(self.replica, 'before_cursor_execute',
+                     lambda conn, cursor, statement, *args:
+                     statements.append(statement))
+        self.client().post('/api/v1/categories/', headers=self.headers,
+                           data=self.category)
+        self.router.store = LocalStore()
+        self.assertEqual(self.get_category(), 404)
+        self.client().delete('/api/v1/auth/logout/', headers=self.headers)
+        # a worker that did not log the token out polls the blacklist
+        self.router.store = LocalStore()
+        self.app.extensions['revocation_cache'] = RevocationCache(0)
+        self.assertNotEqual(self.get_category(), 404)
+        self.assertTrue(statements)
+        self.assertFalse([statement for statement in statements
+                          if 'users' in statement or 'blacklisted' in statement
+                          or not statement.startswith('SELECT')])
+
+    def test_atomic_batch_reads_its_writes(self):
+        ''' Test that a transaction that wrote reads from the primary '''
+        res = self.client().post(
+            '/api/v1/batch/', headers=self.headers,
+            data=json.dumps({'atomic': True, 'operations': [
+                {'method': 'POST', 'path': '/api/v1/categories/',
+                 'body': self.category},
+                {'method': 'GET', 'path': '/api/v1/categories/1/'}]}),
+            content_type='application/json')
+        self.assertEqual([result['status'] for result in
+                          json.loads(res.data)['results']], [201, 200])
+
+    def test_latency_by_bind(self):
+        ''' Test that statements are timed by the bind they ran on '''
+        self.client().post('/api/v1/categories/', headers=self.headers,
+                           data=self.category)
+        self.router.store = LocalStore()
+        self.get_category()
+        text = self.client().get('/metrics').get_data(as_text=True)
+        for bind in ('primary', 'replica_1'):
+            self.assertIn(f'app_db_statement_duration_seconds_count'
+                          f'{{bind="{bind}"}}', text)
+
+    def test_without_replicas(self):
+        ''' Test that an app without replicas reads from the primary '''
+        app = create_app('testing')
+        self.assertNotIn('replica_router', app.extensions)
+        self.assertFalse(app.config['SQLALCHEMY_BINDS'])
@@ -0,0 +1,84 @@
+''' This scripts tests the per-user cache of GET responses '''
+
+import json
+from unittest import TestCase
+
+from app.response_cache import (
+    LocalStore, MemoryBackend, ResponseCache, SharedBackend, make_backend)
+from tests.test_base import BaseTestCase
+
+
+class BackendTestCase(TestCase):
+    ''' Tests for the cache backends '''
+
+    def test_memory_backend_evicts_least_recently_used(self):
+        ''' Test that the LRU keeps at most max_entries responses '''
+        cache = ResponseCache(MemoryBackend(max_entries=2))
+        cache.set('a', {'data': 1})
+        cache.set('b', {'data': 2})
+        cache.get('a')
+        cache.set('c', {'data': 3})
+        self.assertIsNone(cache.get('b'))
+        self.assertEqual(cache.get('a'), {'data': 1})
+        stats = cache.stats()
+        self.assertEqual(stats['evictions'], 1)
+        self.assertEqual((stats['hits'], stats['misses']), (2, 1))
+
+    def test_shared_backend_bumps_version(self):
+        ''' Test that a bump is seen by every cache on the same store '''
+        store = LocalStore()
+        first = ResponseCache(SharedBackend(store))
+        second = ResponseCache(SharedBackend(store))
+        first.set('1:0:/path', {'data': {'a': 1}, 'headers': {}})
+        self.assertEqual(second.get('1:0:/path'),
+                         {'data': {'a': 1}, 'headers': {}})
+        first.bump(1)
+        self.assertEqual(second.version(1), 1)
+        self.assertEqual(second.version(2), 0)
+
+    def test_no_cache_by_default(self):
+        ''' Test that nothing is cached without a cache the workers share '''
+        self.assertIsNone(make_backend({}))
+        self.assertIsNone(make_backend({'RESPONSE_CACHE_BACKEND': 'none'}))
+
+
+class ResponseCacheTestCase(BaseTestCase):
+    ''' Tests for caching the read endpoints '''
+
+    def login(self):
+        ''' Registers and logs in the test user, returns the auth header '''
+        self.user_registration()
+        loggedin_user = self.user_login()
+        token = json.loads(loggedin_user.data)['access_token']
+        return {'Authorization': "Bearer " + token}
+
+    def test_repeated_get_is_served_from_cache(self):
+        ''' Test that a repeated GET runs no queries '''
+        headers = self.login()
+        self.create_category()
+        first = self.client().get('/api/v1/categories/', headers=headers)
+        with self.count_queries() as statements:
+            second = self.client().get('/api/v1/categories/', headers=headers)
+        self.assertEqual(statements, [])
+        self.assertEqual(second.data, first.data)
+        self.assertEqual(second.headers['ETag'], first.headers['ETag'])
+        stats = self.app.extensions['response_cache'].stats()
+        self.assertEqual(stats['hits'], 1)
+
+        not_modified = self.client().get('/api/v1/categories/', headers=dict(
+            headers, **{'If-None-Match': first.headers['ETag']}))
+        self.assertEqual(not_modified.status_code, 304)
+
+    def test_write_invalidates_users_responses(self):
+        ''' Test that a write is seen by the next GET '''
+        headers = self.login()
+        self.create_category()
+        self.client().get('/api/v1/categories/', headers=headers)
+        self.client().get('/api/v1/categories/1/', headers=headers)
+        self.client().put('/api/v1/categories/1/', headers=headers,
+                          data={'category_name': 'renamed'})
+        res = self.client().get('/api/v1/categories/', headers=headers)
+        self.assertEqual(
+            json.loads(res.data)['categories'][0]['category_name'], 'renamed')
+        res = self.client().get('/api/v1/categories/1/', headers=headers)
+        self.assertEqual(json.loads(res.data)['category_name'], 'renamed')
@@ -0,0 +1,41 @@
+''' This scripts tests that the compiled serializers match the schemas '''
+
+import json
+
+from app import db
+from app.models.category import Category
+from app.models.recipe import Recipe
+from app.models.user import User
+from app.serializers import (
+    CategorySchema, RecipeSchema, UserSchema, dump_category, dump_recipe,
+    dump_user)
+from tests.test_base import BaseTestCase
+
+
+class SerializerTestCase(BaseTestCase):
+    ''' Tests for the compiled model serializers '''
+
+    def test_compiled_serializers_match_schemas(self):
+        ''' Test that the compiled serializers dump the same data, in the same
+            key order, as the marshmallow schemas
+        '''
+        self.user_registration()
+        loggedin_user = self.user_login()
+        token = json.loads(loggedin_user.data)['access_token']
+        category_res = json.loads(self.create_category().data)
+        for a_recipe in (self.recipe, self.recipe1):
+            self.client().post('/api/v1/recipes/{}/'.format(
+                category_res['category_id']), headers=dict(
+                    Authorization="Bearer " + token), data=a_recipe)
+
+        with self.app.app_context():
+            pairs = [(UserSchema(), dump_user, User.query.all()),
+                     (CategorySchema(), dump_category, Category.query.all()),
+                     (RecipeSchema(), dump_recipe, Recipe.query.all())]
+            for schema, dump, rows in pairs:
+                self.assertTrue(rows)
+                for row in rows:
+                    expected = schema.dump(row).data
+                    self.assertEqual(dump(row), expected)
+                    self.assertEqual(list(dump(row)), list(expected))
+            db.session.close()
@@ -0,0 +1,237 @@
+''' This scripts tests sharding the users' data over two SQLite files '''
+
+import json
+import tempfile
+from collections import Counter
+from unittest.mock import patch
+
+from sqlalchemy import select
+
+from app import db
+from app.models.category import Category
+from app.models.recipe import Recipe
+from app.models.user import User
+from app.sharding import HashRing, parse_shards, rebalance, seed_id_blocks
+from instance.config import app_config
+from tests.test_base import BaseTestCase
+
+SHARDS = ('alpha', 'beta')
+
+
+class HashRingTestCase(BaseTestCase):
+    ''' Tests for placing users on shards '''
+
+    def test_spread_and_moves(self):
+        ''' Test that users are spread evenly and a new shard only takes
+            users from the others
+        '''
+        ring = HashRing(['alpha', 'beta', 'gamma'])
+        counts = Counter(ring.node_for(user_id) for user_id in range(30000))
+        self.assertGreater(min(counts.values()), 8500)
+        bigger = HashRing(['alpha', 'beta', 'gamma', 'delta'])
+        moved = [user_id for user_id in range(30000)
+                 if ring.node_for(user_id) != bigger.node_for(user_id)]
+        self.assertEqual({bigger.node_for(user_id) for user_id in moved},
+                         {'delta'})
+        self.assertLess(len(moved), 30000 / 3)
+
+    def test_parse_shards(self):
+        ''' Test that shards are named '''
+        self.assertEqual(parse_shards('a=sqlite:///a.db, b=sqlite:///b.db'),
+                         {'a': 'sqlite:///a.db', 'b': 'sqlite:///b.db'})
+        with self.assertRaises(ValueError):
+            parse_shards('sqlite:///a.db')
+
+
+class ShardingTestCase(BaseTestCase):
+    ''' Tests for routing each user's rows to their shard '''
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        shards = ','.join(f'{name}=sqlite:///{directory}/{name}.db'
+                          for name in SHARDS)
+        with patch.object(app_config['testing'], 'SHARD_DATABASE_URLS',
+                          shards):
+            super().setUp()
+        self.router = self.app.extensions['shard_router']
+        with self.app.app_context():
+            self.engines = {name: db.get_engine(self.app, name)
+                            for name in (None,) + SHARDS}
+            for name in SHARDS:
+                db.Model.metadata.create_all(self.engines[name])
+            seed_id_blocks()
+
+    def tearDown(self):
+        super().tearDown()
+        for name in SHARDS:
+            db.Model.metadata.drop_all(self.engines[name])
+
+    def register(self, username):
+        ''' Registers and logs in a user, returns their id and headers '''
+        user = {'username': username, 'password': 'password',
+                'email': f'{username}@email.com'}
+        self.assertEqual(self.client().post(
+            '/api/v1/auth/register/', data=user).status_code, 201)
+        token = json.loads(self.client().post(
+            '/api/v1/auth/login/', data=user).data)['access_token']
+        with self.app.app_context():
+            user_id = User.query.filter_by(username=username).one().user_id
+        return user_id, {'Authorization': "Bearer " + token}
+
+    def rows(self, shard, table, user_id):
+        ''' Returns a user's rows of a table on a shard '''
+        return self.engines[shard].execute(table.select().where(
+            table.c.created_by == user_id)).fetchall()
+
+    def directory(self, user_id):
+        ''' Returns a user's shard and moving flag in the directory '''
+        users = User.__table__
+        return tuple(self.engines[None].execute(
+            select([users.c.shard, users.c.moving]).where(
+                users.c.user_id == user_id)).first())
+
+    def add_data(self, headers):
+        ''' Creates a category with a recipe and imports another one '''
+        self.client().post('/api/v1/categories/', headers=headers,
+                           data=self.category)
+        category_id = json.loads(self.client().get(
+            '/api/v1/categories/', headers=headers).data)[
+                'categories'][0]['category_id']
+        self.client().post(f'/api/v1/recipes/{category_id}/',
+                           headers=headers,
+                           data={'recipe_name': 'toast',
+                                 'ingredients': 'bread & garlic'})
+        body = json.dumps({'category_name': 'breakfast', 'recipes': [
+            {'recipe_name': 'pancakes', 'ingredients': 'flour, eggs'}]})
+        res = self.client().post('/api/v1/categories/import/',
+                                 headers=headers, data=body,
+                                 content_type='application/x-ndjson')
+        self.assertEqual(json.loads(res.data)['recipes_created'], 1)
+
+    def listing(self, headers):
+        ''' Returns the names and ids of a user's categories and recipes '''
+        categories = json.loads(self.client().get(
+            '/api/v1/categories/', headers=headers).data)['categories']
+        return sorted((category['category_id'], category['category_name'],
+                       sorted((a_recipe['recipe_id'], a_recipe['recipe_name'])
+                              for a_recipe in category['recipes']))
+                      for category in categories)
+
+    def test_rows_on_users_shard(self):
+        ''' Test that each user's rows are on their shard only, with ids
+            unique across the shards, and usernames unique in the directory
+        '''
+        users = [self.register(f'user{number}') for number in range(4)]
+        self.assertEqual({self.router.ring.node_for(user_id)
+                          for user_id, _ in users}, set(SHARDS))
+        for user_id, headers in users:
+            self.add_data(headers)
+            shard = self.router.ring.node_for(user_id)
+            self.assertEqual(self.directory(user_id), (shard, False))
+            for name in (None,) + SHARDS:
+                self.assertEqual(len(self.rows(
+                    name, Category.__table__, user_id)),
+                    2 if name == shard else 0)
+            res = self.client().get('/api/v1/recipes/ingredients/'
+                                    '?ingredients=garlic', headers=headers)
+            self.assertEqual([a_recipe['recipe_name'] for a_recipe in
+                              json.loads(res.data)['recipes']], ['toast'])
+        ids = [category_id for _, headers in users
+               for category_id, _, _ in self.listing(headers)]
+        self.assertEqual(len(ids), len(set(ids)))
+        res = self.client().post('/api/v1/auth/register/', data={
+            'username': 'user0', 'password': 'password',
+            'email': 'other@email.com'})
+        self.assertEqual(res.status_code, 409)
+
+    def test_rebalance(self):
+        ''' Test that users are moved to the shard the ring gives them, from
+            another shard and from the primary, keeping their ids
+        '''
+        user_id, headers = self.register('mover')
+        self.add_data(headers)
+        legacy_id, legacy_headers = self.register('legacy')
+        # as if registered before there were shards
+        self.engines[None].execute(User.__table__.update().where(
+            User.__table__.c.user_id == legacy_id).values(shard=None))
+        self.router.directory.clear()
+        self.add_data(legacy_headers)
+        self.assertEqual(len(self.rows(None, Recipe.__table__, legacy_id)), 2)
+        before = self.listing(headers), self.listing(legacy_headers)
+
+        source = self.router.ring.node_for(user_id)
+        target, = set(SHARDS) - {source}
+        self.router.ring = HashRing([target])
+        with self.app.app_context():
+            self.assertEqual(rebalance(wait=0, dry_run=True, log=str), 2)
+            self.assertEqual(rebalance(wait=0, log=str), 2)
+            self.assertEqual(rebalance(wait=0, log=str), 0)
+
+        self.router.directory.clear()
+        for moved, shard in ((user_id, source), (legacy_id, None)):
+            self.assertEqual(self.directory(moved), (target, False))
+            self.assertFalse(self.rows(shard, Recipe.__table__, moved))
+            self.assertEqual(len(self.rows(target, Recipe.__table__, moved)),
+                             2)
+        self.assertEqual((self.listing(headers),
+                          self.listing(legacy_headers)), before)
+        res = self.client().get('/api/v1/recipes/ingredients/'
+                                '?ingredients=garlic', headers=headers)
+        self.assertEqual(len(json.loads(res.data)['recipes']), 1)
+        self.assertEqual(self.client().post(
+            '/api/v1/categories/', headers=headers,
+            data=self.category1).status_code, 201)
+        self.assertEqual(len(self.rows(target, Category.__table__, user_id)),
+                         3)
+
+    def test_writes_turned_away_while_moving(self):
+        ''' Test that a user being moved can read but not write '''
+        user_id, headers = self.register('mover')
+        self.client().post('/api/v1/categories/', headers=headers,
+                           data=self.category)
+        self.engines[None].execute(User.__table__.update().where(
+            User.__table__.c.user_id == user_id).values(moving=True))
+        self.router.directory.clear()
+        self.assertEqual(self.client().get(
+            '/api/v1/categories/', headers=headers).status_code, 200)
+        res = self.client().post('/api/v1/categories/', headers=headers,
+                                 data=self.category1)
+        self.assertEqual(res.status_code, 503)
+        self.assertEqual(res.headers['Retry-After'],
+                         str(self.router.cache_seconds))
+
+    def test_batched_writes_turned_away_while_moving(self):
+        ''' Test that a batched write of a user being moved gets the 503 '''
+        user_id, headers = self.register('mover')
+        self.engines[None].execute(User.__table__.update().where(
+            User.__table__.c.user_id == user_id).values(moving=True))
+        self.router.directory.clear()
+        res = self.client().post(
+            '/api/v1/batch/', headers=headers, content_type='application/json',
+            data=json.dumps({'operations': [
+                {'method': 'POST', 'path': '/api/v1/categories/',
+                 'body': self.category},
+                {'method': 'GET', 'path': '/api/v1/categories/'}]}))
+        first, second = json.loads(res.data)['results']
+        self.assertEqual(first['status'], 503)
+        self.assertEqual(first['headers']['Retry-After'],
+                         str(self.router.cache_seconds))
+        self.assertEqual(second['status'], 200)
+
+    def test_ids_without_a_block(self):
+        ''' Test that ids are only handed out once id_blocks is seeded '''
+        self.engines[None].execute(db.Model.metadata.tables[
+            'id_blocks'].delete())
+        _, headers = self.register('user')
+        res = self.client().post('/api/v1/categories/', headers=headers,
+                                 data=self.category)
+        self.assertEqual(res.status_code, 500)
+
+
+class WithoutShardsTestCase(BaseTestCase):
+    ''' Tests for an app without shards '''
+
+    def test_no_router(self):
+        ''' Test that the data stays on the primary '''
+        self.assertNotIn('shard_router', self.app.extensions)
+        self.assertFalse(self.app.config['SQLALCHEMY_BINDS'])
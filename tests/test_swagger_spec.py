@@ -0,0 +1,58 @@
+''' This scripts tests serving the Swagger specs from a file '''
+
+import json
+import os
+import tempfile
+from unittest.mock import patch
+
+from app import create_app, warm_up
+from app.apis import api, api_2
+from app.swagger_spec import init_swagger_specs, write_specs
+from instance.config import app_config
+from tests.test_base import BaseTestCase
+
+
+class SwaggerSpecTestCase(BaseTestCase):
+    ''' Tests for the Swagger specs written at build time '''
+
+    def setUp(self):
+        super().setUp()
+        self.path = os.path.join(tempfile.mkdtemp(), 'swagger.json')
+        write_specs(self.app, self.path)
+        self.app.config['SWAGGER_SPEC_FILE'] = self.path
+
+    def spec(self, version='v1'):
+        ''' Returns the spec served for an API version '''
+        res = self.client().get(f'/api/{version}/swagger.json')
+        self.assertEqual(res.status_code, 200)
+        return json.loads(res.data)
+
+    def test_served_from_file(self):
+        ''' Test that the written specs are the built ones and are served
+            without building them
+        '''
+        built = self.spec(), self.spec('v2')
+        with patch.object(app_config['testing'], 'SWAGGER_SPEC_FILE',
+                          self.path):
+            self.app = create_app('testing')
+        self.client = self.app.test_client
+        with patch('flask_restplus.swagger.Swagger.as_dict') as as_dict, \
+                patch.dict(api.__dict__), patch.dict(api_2.__dict__):
+            for an_api in (api, api_2):
+                # the spec restplus built for the first app
+                an_api.__dict__.pop('__schema__', None)
+                an_api._schema = None
+            self.assertEqual((self.spec(), self.spec('v2')), built)
+            warm_up(self.app)
+        self.assertFalse(as_dict.called)
+
+    def test_stale_file(self):
+        ''' Test that a file written for other endpoints is ignored '''
+        with open(self.path) as spec_file:
+            document = json.load(spec_file)
+        document['rules'].pop()
+        document['specs']['api_v1']['info']['title'] = 'Stale'
+        with open(self.path, 'w') as spec_file:
+            json.dump(document, spec_file)
+        init_swagger_specs(self.app)
+        self.assertEqual(self.spec()['info']['title'], 'Recipes API')
@@ -0,0 +1,19 @@
+''' This script has the app gunicorn serves:
+
+        gunicorn --preload -w 4 wsgi:app
+
+    The app is created and warmed up when the module is imported. With
+    --preload that happens once in gunicorn's master and every worker forks
+    from it, sharing the imported modules and the built Swagger specs with
+    the master instead of importing and building its own. Nothing the app
+    creates before the fork is bound to a process: connections, the batch
+    threads and the bcrypt processes are opened on first use in each
+    worker. gevent workers can not be preloaded, see app/green.py.
+'''
+
+import os
+
+from app import create_app, warm_up
+
+app = create_app(config_name=os.getenv('FLASK_CONFIG'))
+warm_up(app)